@@ -0,0 +1,74 @@
+"""
+Run the benchmark suite and compare the results to a JSON baseline.
+
+Usage: python -m benchmarks [-k NAME] [--save] [--baseline PATH] [--threshold 0.2]
+
+Baselines depend on the machine, so save one on the machine (or CI runner) that compares
+against it. The exit status is 1 when any benchmark is slower than its baseline by more
+than the threshold.
+"""
+import argparse
+import os
+import sys
+import tempfile
+
+from benchmarks import harness
+from benchmarks import suite
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks')
+    parser.add_argument('-k', '--filter', action='append', default=[],
+                        help='Only run benchmarks whose name contains this (repeatable).')
+    parser.add_argument('--baseline', default=os.getenv('BENCH_BASELINE', DEFAULT_BASELINE),
+                        help='JSON file to compare with and save to.')
+    parser.add_argument('--save', action='store_true',
+                        help='Save the results as the new baseline.')
+    parser.add_argument('--threshold', type=float, default=float(os.getenv('BENCH_THRESHOLD', 0.2)),
+                        help='Allowed slowdown before failing, as a fraction of ops/s.')
+    parser.add_argument('--min-time', type=float, default=1.0,
+                        help='Minimum seconds to time each benchmark.')
+    parser.add_argument('--min-samples', type=int, default=5,
+                        help='Minimum number of samples per benchmark.')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    names = [name for name in harness.BENCHMARKS
+             if not args.filter or any(text in name for text in args.filter)]
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        context = suite.Context(directory)
+        try:
+            for name in names:
+                func = harness.BENCHMARKS[name](context)
+                result = harness.measure(func, min_time=args.min_time, min_samples=args.min_samples)
+                results[name] = result
+                print('{:28s} {:12.1f} ops/s   p50 {}   p99 {}'.format(
+                    name, result['ops'], harness.format_seconds(result['p50']),
+                    harness.format_seconds(result['p99'])))
+        finally:
+            context.close()
+
+    baseline = harness.load_baseline(args.baseline)
+    regressions = harness.compare(results, baseline, args.threshold)
+    for name, previous, current, change in regressions:
+        print('REGRESSION {}: {:.1f} -> {:.1f} ops/s ({:+.1%})'.format(name, previous, current, change))
+
+    if args.save:
+        if baseline.get('results'):
+            # Keep the results of benchmarks that were not run this time.
+            results = dict(baseline['results'], **results)
+        harness.save_baseline(args.baseline, results)
+        print('Saved baseline to {}'.format(args.baseline))
+        return 0
+
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,98 @@
+"""
+A small benchmark harness: registers benchmarks, times them, and compares results to a baseline.
+"""
+from collections import OrderedDict
+import json
+import platform
+import time
+
+from flaskapi.utils.loadtest import percentile
+
+BENCHMARKS = OrderedDict()
+
+
+def benchmark(name):
+    """
+    Register a benchmark. The decorated function gets the suite context and returns the
+    function to time, so setup is not timed.
+    """
+    def decorator(setup):
+        BENCHMARKS[name] = setup
+        return setup
+    return decorator
+
+
+def calibrate(func, sample_seconds):
+    """Return how many calls make up one sample of at least sample_seconds."""
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    if elapsed >= sample_seconds:
+        return 1
+    return max(1, int(sample_seconds / max(elapsed, 1e-9)))
+
+
+def measure(func, min_time=1.0, min_samples=5, max_samples=1000, sample_seconds=0.001):
+    """
+    Time func and return its ops/s and the p50 and p99 of the time per call, in seconds.
+    Fast functions are called several times per sample, so timer overhead does not count.
+    """
+    calls = calibrate(func, sample_seconds)
+    samples = []
+    deadline = time.perf_counter() + min_time
+    while len(samples) < max_samples and (len(samples) < min_samples or time.perf_counter() < deadline):
+        start = time.perf_counter()
+        for _ in range(calls):
+            func()
+        samples.append((time.perf_counter() - start) / calls)
+    return {
+        'ops': len(samples) / sum(samples),
+        'p50': percentile(samples, 50),
+        'p99': percentile(samples, 99),
+        'samples': len(samples),
+        'calls': calls,
+    }
+
+
+def compare(results, baseline, threshold):
+    """
+    Return (name, baseline ops/s, current ops/s, change) for every benchmark that got slower
+    than the baseline by more than threshold (0.1 is 10% fewer ops/s).
+    """
+    regressions = []
+    for name, result in results.items():
+        previous = baseline.get('results', {}).get(name)
+        if not previous:
+            continue
+        change = result['ops'] / previous['ops'] - 1
+        if change < -threshold:
+            regressions.append((name, previous['ops'], result['ops'], change))
+    return regressions
+
+
+def load_baseline(path):
+    try:
+        with open(path) as fp:
+            return json.load(fp)
+    except FileNotFoundError:
+        return {}
+
+
+def save_baseline(path, results):
+    data = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'results': results,
+    }
+    with open(path, 'w') as fp:
+        json.dump(data, fp, indent=2, sort_keys=True)
+        fp.write('\n')
+
+
+def format_seconds(seconds):
+    if seconds >= 1:
+        return '{:8.2f} s '.format(seconds)
+    if seconds >= 0.001:
+        return '{:8.2f} ms'.format(seconds * 1000)
+    return '{:8.2f} us'.format(seconds * 1000000)
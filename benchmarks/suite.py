@@ -0,0 +1,175 @@
+"""
+Benchmarks for the hot paths. The app runs in-process with the test client from tests/conftest.py,
+against a temporary SQLite database.
+"""
+import base64
+import itertools
+import os
+
+from peewee_moves import get_database_manager
+
+from benchmarks.harness import benchmark
+from flaskapi import create_app
+from flaskapi.ext import credentials
+from flaskapi.ext import db
+from flaskapi.models import Entry
+from flaskapi.models import User
+from flaskapi.models import linebreaks
+from flaskapi.models import linebreaks_many
+from flaskapi.resources import UserResource
+from flaskapi.utils.ratelimit import MemoryStorage
+from flaskapi.utils.ratelimit import RateLimit
+from flaskapi.utils.ratelimit import RateLimiter
+from flaskapi.utils.ratelimit import SQLiteStorage
+from flaskapi.views.public import UserValidator
+from tests import conftest
+
+COMMENT = 'Hello <b>world</b> & "friends"\nsecond line\n\nnew paragraph\r\n\r\nwindows\rlone\n\n\n'
+
+CONTENT = '# Title\n\nSome *markdown* with a [link](http://example.com).\n\n' * 20
+
+
+class Context:
+    """The app, a test client and the data shared by the benchmarks, created on first use."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.config = {
+            'TESTING': True,
+            'DATABASE': 'sqlite:///' + os.path.join(directory, 'bench.sqlite'),
+            'RATELIMIT_ENABLED': False,
+            'METRICS_ENABLED': False,
+            'ACCESS_LOG_FILE': os.path.join(directory, 'access.log'),
+            'LOG_FILE': os.path.join(directory, 'app.log'),
+        }
+        self.app = create_app(self.config)
+        self.app.test_client_class = conftest.TestClient
+        self.app.response_class = conftest.TestResponse
+
+        self.request_context = self.app.test_request_context()
+        self.request_context.push()
+        get_database_manager(self.app).upgrade()
+
+        self.user = User.create(username='bench', email='bench@example.com', password='welcome')
+        self.client = self.app.test_client()
+        self.users = 1
+
+    def close(self):
+        self.request_context.pop()
+
+    def ensure_users(self, count):
+        """Create users until there are at least count of them."""
+        with db.database.atomic():
+            while self.users < count:
+                batch = min(count - self.users, 500)
+                rows = [{
+                    'username': 'user{}'.format(self.users + i),
+                    'email': 'user{}@example.com'.format(self.users + i),
+                    'password_hash': 'plain$$welcome',
+                    'api_key': 'key{}'.format(self.users + i),
+                } for i in range(batch)]
+                User.insert_many(rows).execute()
+                self.users += batch
+
+    def auth_header(self, username, password):
+        token = base64.b64encode('{}:{}'.format(username, password).encode('utf-8'))
+        return {'Authorization': 'Basic ' + token.decode('ascii')}
+
+
+@benchmark('auth_api_key')
+def auth_api_key(context):
+    headers = {'X-Api-Key': context.user.api_key}
+    return lambda: context.client.get('/api/profile', headers=headers)
+
+
+@benchmark('auth_password')
+def auth_password(context):
+    headers = context.auth_header('bench', 'welcome')
+    return lambda: context.client.get('/api/profile', headers=headers)
+
+
+@benchmark('auth_password_uncached')
+def auth_password_uncached(context):
+    headers = context.auth_header('bench', 'welcome')
+
+    def run():
+        credentials.clear()
+        context.client.get('/api/profile', headers=headers)
+    return run
+
+
+def serialize_many(rows):
+    def setup(context):
+        context.ensure_users(rows)
+        resource = UserResource(private=True)
+        return lambda: resource.serialize_many(User.select().order_by(User.id).limit(rows))
+    return setup
+
+
+benchmark('serialize_many_10')(serialize_many(10))
+benchmark('serialize_many_1k')(serialize_many(1000))
+benchmark('serialize_many_100k')(serialize_many(100000))
+
+
+@benchmark('model_to_dict')
+def model_to_dict(context):
+    return lambda: context.user.to_dict(private=True)
+
+
+@benchmark('title_content_html')
+def title_content_html(context):
+    entry = Entry.create(title='Bench', content=CONTENT)
+    return lambda: entry.html
+
+
+@benchmark('linebreaks')
+def linebreaks_benchmark(context):
+    return lambda: linebreaks(COMMENT)
+
+
+@benchmark('linebreaks_1k')
+def linebreaks_1k(context):
+    values = [COMMENT] * 1000
+    return lambda: [linebreaks(value) for value in values]
+
+
+@benchmark('linebreaks_many_1k')
+def linebreaks_many_1k(context):
+    values = [COMMENT] * 1000
+    return lambda: linebreaks_many(values)
+
+
+def rate_limit_hit(storage):
+    def setup(context):
+        limiter = RateLimiter()
+        limiter.storage = storage(context)
+        rate_limit = RateLimit(10 ** 9, 1, by='ip')
+        return lambda: limiter.hit(rate_limit, 'bench')
+    return setup
+
+
+benchmark('ratelimit_memory')(rate_limit_hit(lambda context: MemoryStorage()))
+benchmark('ratelimit_sqlite')(rate_limit_hit(
+    lambda context: SQLiteStorage(os.path.join(context.directory, 'ratelimit.sqlite'))))
+
+
+@benchmark('user_validator_create')
+def user_validator_create(context):
+    counter = itertools.count()
+
+    def run():
+        number = next(counter)
+        data = {
+            'username': 'new{}'.format(number),
+            'email': 'new{}@example.com'.format(number),
+            'password': 'welcome',
+        }
+        validator = UserValidator(User())
+        assert validator.validate(data)
+        validator.save()
+    return run
+
+
+@benchmark('json_error_handler')
+def json_error_handler(context):
+    return lambda: context.client.get('/api/does-not-exist')
@@ -2,7 +2,6 @@ from functools import wraps
 from logging import DEBUG
 from logging import ERROR
 from logging import Formatter
-from logging.handlers import SMTPHandler
 from logging.handlers import WatchedFileHandler
 import os
 
@@ -11,8 +10,8 @@ from flask import Flask
 from flask import jsonify
 from flask import g
 from flask import abort
+from flask import request
 from flask_cors import CORS
-from werkzeug.contrib.cache import SimpleCache
 from werkzeug.exceptions import default_exceptions
 from werkzeug.exceptions import HTTPException
 from werkzeug.exceptions import InternalServerError
@@ -41,14 +40,14 @@ def create_app(config=None):
     if isinstance(config, dict):
         app.config.update(**config)
 
-    app.config.setdefault('CACHE_SECONDS', 604800)
-    app.cache = SimpleCache(threshold=10, default_timeout=app.config['CACHE_SECONDS'])
     app.debug_log_format = DEBUG_LOG_FORMAT.strip()
     app.mail_log_format = MAIL_LOG_FORMAT.strip()
 
+    configure_cache(app)
     configure_authentication(app)
     configure_error_handlers(app)
     configure_extensions(app)
+    configure_metrics(app)
     configure_views(app)
     configure_commands(app)
 
@@ -61,7 +60,31 @@ def create_app(config=None):
     return app
 
 
+def configure_cache(app):
+    from werkzeug.contrib.cache import NullCache
+    from flaskapi.utils.cache import LRUCache
+    from flaskapi.utils.cache import SQLiteCache
+
+    cache_type = app.config['CACHE_TYPE']
+    kwargs = {
+        'threshold': app.config['CACHE_THRESHOLD'],
+        'max_bytes': app.config['CACHE_MAX_BYTES'],
+        'default_timeout': app.config['CACHE_SECONDS'],
+    }
+
+    if cache_type == 'lru':
+        app.cache = LRUCache(**kwargs)
+    elif cache_type == 'sqlite':
+        app.cache = SQLiteCache(app.config['CACHE_SQLITE_PATH'], **kwargs)
+    elif cache_type == 'null':
+        app.cache = NullCache(default_timeout=app.config['CACHE_SECONDS'])
+    else:
+        raise ValueError('Unknown CACHE_TYPE: {}'.format(cache_type))
+
+
 def configure_logging(app):
+    from flaskapi.utils.errormail import DigestMailHandler
+
     # Send WARNING messages to a file log.
     os.makedirs(os.path.dirname(app.config['LOG_FILE']), exist_ok=True)
     file_handler = WatchedFileHandler(filename=app.config['LOG_FILE'])
@@ -69,12 +92,17 @@ def configure_logging(app):
     file_handler.setFormatter(Formatter(app.debug_log_format, '%Y-%m-%d %H:%M:%S'))
     app.logger.addHandler(file_handler)
 
-    # Send ERROR messages via email.
-    mail_handler = SMTPHandler(
+    # Send ERROR messages via email, as digests sent from a background thread.
+    if not app.config['ADMINS']:
+        return
+    mail_handler = DigestMailHandler(
         (app.config['MAIL_SERVER'], app.config['MAIL_PORT']),
         app.config['MAIL_FROM_ADDRESS'],
         app.config['ADMINS'],
-        app.config['MAIL_ERROR_SUBJECT'])
+        app.config['MAIL_ERROR_SUBJECT'],
+        window=app.config['MAIL_ERROR_WINDOW'],
+        queue_size=app.config['MAIL_ERROR_QUEUE_SIZE'],
+        timeout=app.config['MAIL_ERROR_TIMEOUT'])
     mail_handler.setLevel(ERROR)
     mail_handler.setFormatter(Formatter(app.mail_log_format, '%Y-%m-%d %H:%M:%S'))
     app.logger.addHandler(mail_handler)
@@ -84,20 +112,47 @@ def configure_error_handlers(app):
     def error_handler(exc):
         if not isinstance(exc, HTTPException):
             exc = InternalServerError()
-        return jsonify(code=exc.code, message=exc.name), exc.code
+        headers = dict(getattr(exc, 'headers', None) or {})
+        if getattr(exc, 'retry_after', None):
+            headers['Retry-After'] = str(exc.retry_after)
+        return jsonify(code=exc.code, message=exc.name), exc.code, headers
 
     for code in default_exceptions.keys():
         app.register_error_handler(code, error_handler)
 
 
 def configure_extensions(app):
+    from flaskapi.ext import accesslog
+    from flaskapi.ext import credentials
     from flaskapi.ext import db
+    from flaskapi.ext import hasher
+    from flaskapi.ext import limiter
     from flaskapi.ext import mail
 
+    credentials.init_app(app)
     db.init_app(app)
+    # After db, so its teardown runs first and still sees the query stats of the request.
+    accesslog.init_app(app)
+    hasher.init_app(app)
+    limiter.init_app(app)
     mail.init_app(app)
 
 
+def configure_metrics(app):
+    from flaskapi.ext import accesslog
+    from flaskapi.ext import db
+    from flaskapi.ext import hasher
+    from flaskapi.ext import metrics
+
+    metrics.init_app(app)
+    metrics.add_stats('db_pool', db.pool_stats, counters=(
+        'checkouts', 'waits', 'timeouts', 'checkout_seconds_total'))
+    metrics.add_stats('hasher', hasher.stats, counters=('completed', 'rejected', 'seconds_total'))
+    metrics.add_stats('access_log', accesslog.stats, counters=('written', 'dropped', 'batches'))
+    if hasattr(app.cache, 'stats'):
+        metrics.add_stats('cache', app.cache.stats, counters=('hits', 'misses', 'evictions'))
+
+
 def configure_views(app):
     from flaskapi.views import public
     from flaskapi.views import admin
@@ -108,12 +163,69 @@ def configure_views(app):
 
 def configure_authentication(app):
     from flaskapi.ext import auth
+    from flaskapi.ext import credentials
+    from flaskapi.ext import db
     from flaskapi.models import User
 
+    def find_user(check, *expressions):
+        # Look the user up on a replica. If the check fails there, the replica may be behind
+        # a recent change (like a new password), so check again if the primary differs.
+        query = User.select().where(*expressions)
+        user = db.use_replica(query.clone()).first()
+        if user and check(user):
+            return user
+        if query.database is db.read_database():
+            return None
+        fresh = query.first()
+        if not fresh or (user and (user.password_hash, user.api_key) ==
+                         (fresh.password_hash, fresh.api_key)):
+            return None
+        return fresh if check(fresh) else None
+
+    def check_password(user, password):
+        # Skip the expensive hash check if these credentials were recently verified
+        # against the password hash the user still has.
+        if credentials.get(user.username, password) == user.password_hash:
+            return True
+        if user.check_password(password):
+            if user.needs_rehash():
+                # Upgrade hashes made with an outdated method now that the password is known.
+                user.password = password
+                user.save()
+            credentials.set(user.username, password, user.password_hash)
+            return True
+        return False
+
+    def get_api_key():
+        # API keys can be sent in an X-Api-Key header or as a bearer token.
+        api_key = request.headers.get('X-Api-Key')
+        if api_key:
+            return api_key
+        scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+        if scheme.lower() == 'bearer':
+            return token.strip()
+        return None
+
+    def authenticate_api_key(api_key):
+        if not api_key:
+            return False
+        user = find_user(lambda user: user.check_api_key(api_key), User.api_key == api_key)
+        if user:
+            g.user = user
+            return True
+        return False
+
     @auth.verify_password
     def authenticate(username, password):
-        user = User.select().filter(username=username).first()
-        if user and (user.check_api_key(password) or user.check_password(password)):
+        # Without basic auth credentials, fall back to the API key scheme.
+        if not username:
+            return authenticate_api_key(get_api_key())
+
+        def check(user):
+            return user.check_api_key(password) or check_password(user, password)
+
+        user = find_user(check, User.username == username)
+        if user:
             g.user = user
             return True
         return False
@@ -136,6 +248,9 @@ def configure_authentication(app):
 
 
 def configure_commands(app):
+    from flaskapi.utils.importer import FORMATS as IMPORT_FORMATS
+    from flaskapi.utils.loadtest import AUTH_MODES
+
     @app.cli.command()
     def createadmin():
         """Create an admin user."""
@@ -159,6 +274,112 @@ def configure_commands(app):
         User.create(username=username, email=email, password=password, is_admin=True)
         click.echo('User created successfully.')
 
+    @app.cli.command()
+    @click.argument('source', type=click.File('r', encoding='utf-8'), default='-')
+    @click.option('--format', 'input_format', type=click.Choice(IMPORT_FORMATS),
+                  help='Input format. Defaults to ndjson for .ndjson and .jsonl files, else csv.')
+    @click.option('--batch-size', default=1000, help='Number of rows to insert per transaction.')
+    @click.option('--workers', default=os.cpu_count() or 1, help='Number of password hashing processes.')
+    @click.option('--checkpoint', type=click.Path(dir_okay=False),
+                  help='Checkpoint file. Defaults to SOURCE.checkpoint for files.')
+    def importusers(source, input_format, batch_size, workers, checkpoint):
+        """
+        Import users from a CSV file with a header or an NDJSON file (default: stdin).
+        Rows need username, email and password, and can set is_admin.
+        """
+        from flaskapi.operations import UserBulkOperations
+        from flaskapi.utils.importer import Checkpoint
+        from flaskapi.utils.importer import Importer
+        from flaskapi.utils.importer import guess_format
+        from flaskapi.utils.importer import read_rows
+
+        name = getattr(source, 'name', None)
+        if not isinstance(name, str) or name in ('-', '<stdin>'):
+            name = None
+        if checkpoint is None and name:
+            checkpoint = name + '.checkpoint'
+        checkpoint = Checkpoint(checkpoint, os.path.abspath(name) if name else '<stdin>')
+        try:
+            importer = Importer(UserBulkOperations(), checkpoint,
+                                app.config['PASSWORD_HASH_METHOD'], batch_size=batch_size,
+                                workers=workers, echo=click.echo)
+        except ValueError as exc:
+            raise click.ClickException(str(exc))
+        importer.run(read_rows(source, input_format or guess_format(name)))
+
+    @app.cli.command()
+    @click.option('--batch-size', default=500, help='Number of rows to render per transaction.')
+    def renderhtml(batch_size):
+        """Store rendered HTML for content that is missing or stale."""
+        from flaskapi.models import Entry
+        from flaskapi.models import Page
+
+        for model in (Entry, Page):
+            count = model.backfill_html(batch_size=batch_size)
+            click.echo('{}: {} rendered.'.format(model._meta.db_table, count))
+
+    @app.cli.command()
+    @click.option('--users', default=100, help='Number of users to seed the scratch database with.')
+    @click.option('--admin/--no-admin', default=False, help='Make the seeded users admins.')
+    @click.option('--requests', 'count', default=1000, help='Total number of requests to send.')
+    @click.option('--duration', type=float, help='Send requests for this many seconds instead.')
+    @click.option('--concurrency', default=8, help='Number of concurrent clients.')
+    @click.option('--mode', type=click.Choice(['threads', 'processes']), default='threads',
+                  help='Run the clients as threads or as forked processes.')
+    @click.option('--endpoint', 'paths', multiple=True, default=['/api/profile'],
+                  help='Path to request, can be repeated. Requests cycle through them.')
+    @click.option('--auth', type=click.Choice(AUTH_MODES), default='api-key',
+                  help='How the clients authenticate.')
+    @click.option('--ratelimit/--no-ratelimit', default=False, help='Apply the rate limits.')
+    def loadtest(users, admin, count, duration, concurrency, mode, paths, auth, ratelimit):
+        """
+        Run a load test against a copy of the app on a scratch database.
+        Logs, caches and rate limit buckets go to a temporary directory and no error mail is sent.
+        The extensions in flaskapi.ext are module level, so they are rebound to the copy.
+        """
+        import tempfile
+
+        from peewee_moves import get_database_manager
+
+        from flaskapi.ext import db
+        from flaskapi.ext import hasher
+        from flaskapi.models import User
+        from flaskapi.models import generate_api_key
+        from flaskapi.utils.loadtest import format_report
+        from flaskapi.utils.loadtest import get_auth_headers
+        from flaskapi.utils.loadtest import run_load
+        from flaskapi.utils.loadtest import scratch_config
+
+        password = 'loadtest'
+        with tempfile.TemporaryDirectory() as directory:
+            config = scratch_config(app.config, directory, RATELIMIT_ENABLED=ratelimit)
+            load_app = create_app(config)
+
+            with load_app.app_context():
+                get_database_manager(load_app).upgrade()
+                password_hash = hasher.generate(password, config['PASSWORD_HASH_METHOD'])
+                rows = [{
+                    'username': 'loadtest{}'.format(i),
+                    'email': 'loadtest{}@example.com'.format(i),
+                    'password_hash': password_hash,
+                    'api_key': generate_api_key(),
+                    'is_admin': admin,
+                } for i in range(users)]
+                with db.database.atomic():
+                    for start in range(0, len(rows), 500):
+                        User.insert_many(rows[start:start + 500]).execute()
+                if not db.database.is_closed():
+                    db.database.close()
+
+            click.echo('Seeded {} users, sending requests with {} {}.'.format(users, concurrency, mode))
+            headers = [get_auth_headers(auth, row['username'], password, row['api_key'])
+                       for row in rows] or [{}]
+            report = run_load(load_app, list(paths), headers, requests=None if duration else count,
+                              duration=duration, concurrency=concurrency, mode=mode)
+
+        for line in format_report(report):
+            click.echo(line)
+
     @app.cli.command()
     def routes():
         """List all routes."""
@@ -8,7 +8,11 @@ DATABASE = os.getenv('FLASK_DATABASE_URL', 'sqlite:///{}'.format(sqlite_database
 
 LOG_FILE = os.getenv('FLASK_LOG_FILE', os.path.join(os.getcwd(), 'logs', 'app.log'))
 
-ADMINS = os.getenv('FLASK_ADMINS', 'admin@example.com').split(';')
+ACCESS_LOG_ENABLED = os.getenv('FLASK_ACCESS_LOG_ENABLED', 'true').lower() in ('1', 'true', 'on')
+ACCESS_LOG_FILE = os.getenv('FLASK_ACCESS_LOG_FILE', os.path.join(os.getcwd(), 'logs', 'access.log'))
+ACCESS_LOG_QUEUE_SIZE = int(os.getenv('FLASK_ACCESS_LOG_QUEUE_SIZE', 10000))
+
+ADMINS = [value for value in os.getenv('FLASK_ADMINS', 'admin@example.com').split(';') if value]
 
 MAIL_SERVER = os.getenv('FLASK_MAIL_SERVER', 'localhost')
 MAIL_PORT = int(os.getenv('FLASK_MAIL_PORT', 1025))
@@ -18,3 +22,47 @@ MAIL_USERNAME = os.getenv('FLASK_MAIL_USERNAME', '')
 MAIL_PASSWORD = os.getenv('FLASK_MAIL_PASSWORD', '')
 MAIL_ERROR_SUBJECT = os.getenv('FLASK_MAIL_ERROR_SUBJECT', 'Application Error')
 MAIL_FROM_ADDRESS = os.getenv('FLASK_MAIL_FROM_ADDRESS', 'admin@example.com')
+MAIL_ERROR_WINDOW = float(os.getenv('FLASK_MAIL_ERROR_WINDOW', 60))
+MAIL_ERROR_QUEUE_SIZE = int(os.getenv('FLASK_MAIL_ERROR_QUEUE_SIZE', 1000))
+MAIL_ERROR_TIMEOUT = float(os.getenv('FLASK_MAIL_ERROR_TIMEOUT', 10))
+
+CREDENTIAL_CACHE_SIZE = int(os.getenv('FLASK_CREDENTIAL_CACHE_SIZE', 1024))
+CREDENTIAL_CACHE_SECONDS = int(os.getenv('FLASK_CREDENTIAL_CACHE_SECONDS', 300))
+
+CACHE_TYPE = os.getenv('FLASK_CACHE_TYPE', 'lru')
+CACHE_SECONDS = int(os.getenv('FLASK_CACHE_SECONDS', 604800))
+CACHE_THRESHOLD = int(os.getenv('FLASK_CACHE_THRESHOLD', 10000))
+CACHE_MAX_BYTES = int(os.getenv('FLASK_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+CACHE_SQLITE_PATH = os.getenv('FLASK_CACHE_SQLITE_PATH', os.path.join(os.getcwd(), 'cache', 'cache.sqlite'))
+
+DATABASE_POOL = os.getenv('FLASK_DATABASE_POOL', 'false').lower() in ('1', 'true', 'on')
+DATABASE_MAX_CONNECTIONS = int(os.getenv('FLASK_DATABASE_MAX_CONNECTIONS', 20))
+DATABASE_STALE_TIMEOUT = int(os.getenv('FLASK_DATABASE_STALE_TIMEOUT', 300))
+DATABASE_WAIT_TIMEOUT = float(os.getenv('FLASK_DATABASE_WAIT_TIMEOUT', 10))
+
+DATABASE_REPLICAS = [url for url in os.getenv('FLASK_DATABASE_REPLICAS', '').split(';') if url]
+DATABASE_REPLICA_SELECTION = os.getenv('FLASK_DATABASE_REPLICA_SELECTION', 'round-robin')
+DATABASE_READ_YOUR_WRITES_SECONDS = int(os.getenv('FLASK_DATABASE_READ_YOUR_WRITES_SECONDS', 5))
+
+DATABASE_SERVER_TIMING = os.getenv('FLASK_DATABASE_SERVER_TIMING', 'false').lower() in ('1', 'true', 'on')
+DATABASE_REPEATED_QUERY_THRESHOLD = int(os.getenv('FLASK_DATABASE_REPEATED_QUERY_THRESHOLD', 10))
+SLOW_REQUEST_SECONDS = float(os.getenv('FLASK_SLOW_REQUEST_SECONDS', 1))
+
+PASSWORD_HASH_METHOD = os.getenv('FLASK_PASSWORD_HASH_METHOD', 'pbkdf2:sha256:50000')
+HASHER_WORKERS = int(os.getenv('FLASK_HASHER_WORKERS', os.cpu_count() or 1))
+HASHER_QUEUE_SIZE = int(os.getenv('FLASK_HASHER_QUEUE_SIZE', 64))
+HASHER_TIMEOUT = float(os.getenv('FLASK_HASHER_TIMEOUT', 30))
+HASHER_RETRY_AFTER = int(os.getenv('FLASK_HASHER_RETRY_AFTER', 1))
+
+RATELIMIT_ENABLED = os.getenv('FLASK_RATELIMIT_ENABLED', 'false').lower() in ('1', 'true', 'on')
+RATELIMIT_STORAGE = os.getenv('FLASK_RATELIMIT_STORAGE', 'memory')
+RATELIMIT_MAX_ENTRIES = int(os.getenv('FLASK_RATELIMIT_MAX_ENTRIES', 10000))
+RATELIMIT_SQLITE_PATH = os.getenv('FLASK_RATELIMIT_SQLITE_PATH', os.path.join(os.getcwd(), 'cache', 'ratelimit.sqlite'))
+
+TRUSTED_PROXIES = [value for value in os.getenv('FLASK_TRUSTED_PROXIES', '').split(';') if value]
+
+METRICS_ENABLED = os.getenv('FLASK_METRICS_ENABLED', 'true').lower() in ('1', 'true', 'on')
+METRICS_DIR = os.getenv('FLASK_METRICS_DIR', '')
+METRICS_FLUSH_SECONDS = float(os.getenv('FLASK_METRICS_FLUSH_SECONDS', 1))
+
+BULK_MAX_OPERATIONS = int(os.getenv('FLASK_BULK_MAX_OPERATIONS', 10000))
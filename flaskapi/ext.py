@@ -1,7 +1,18 @@
 from flask_httpauth import HTTPBasicAuth
 from flask_mail import Mail
-from playhouse.flask_utils import FlaskDB
 
+from flaskapi.utils.accesslog import AccessLog
+from flaskapi.utils.credentials import CredentialCache
+from flaskapi.utils.database import FlaskDB
+from flaskapi.utils.hashing import Hasher
+from flaskapi.utils.metrics import Metrics
+from flaskapi.utils.ratelimit import RateLimiter
+
+accesslog = AccessLog()
 auth = HTTPBasicAuth()
+credentials = CredentialCache()
 db = FlaskDB()
+hasher = Hasher()
+limiter = RateLimiter()
 mail = Mail()
+metrics = Metrics()
@@ -0,0 +1,20 @@
+"""
+create table pages
+date created: 2026-10-18 09:12:51.877014
+"""
+
+
+def upgrade(migrator):
+    with migrator.create_table('pages') as table:
+        table.primary_key('id')
+        table.datetime('date_created')
+        table.datetime('date_updated')
+        table.char('title', max_length=250)
+        table.datetime('date_published', null=True)
+        table.text('content', null=True)
+        table.text('content_html', null=True)
+        table.char('content_hash', max_length=40, null=True)
+
+
+def downgrade(migrator):
+    migrator.drop_table('pages')
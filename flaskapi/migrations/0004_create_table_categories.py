@@ -0,0 +1,16 @@
+"""
+create table categories
+date created: 2026-10-18 10:41:09.518437
+"""
+
+
+def upgrade(migrator):
+    with migrator.create_table('categories') as table:
+        table.primary_key('id')
+        table.datetime('date_created')
+        table.datetime('date_updated')
+        table.char('name', max_length=50, unique=True)
+
+
+def downgrade(migrator):
+    migrator.drop_table('categories')
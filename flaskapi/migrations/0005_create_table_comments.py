@@ -0,0 +1,24 @@
+"""
+create table comments
+date created: 2026-10-18 10:41:22.102945
+"""
+
+
+def upgrade(migrator):
+    with migrator.create_table('comments') as table:
+        table.primary_key('id')
+        table.datetime('date_created')
+        table.datetime('date_updated')
+        table.char('author', max_length=100)
+        table.datetime('date_published')
+        table.text('content')
+        table.foreign_key('entry_id', 'entries.id')
+        # Comments are listed per entry, ordered by date_published.
+        table.add_index(('entry_id', 'date_published'))
+    # peewee indexes every foreign key. The composite index above also serves lookups by
+    # entry_id alone, so the single column one would only slow down writes.
+    migrator.drop_index('comments', 'comments_entry_id')
+
+
+def downgrade(migrator):
+    migrator.drop_table('comments')
@@ -0,0 +1,19 @@
+"""
+create table entries_categories_through
+date created: 2026-10-18 10:41:37.664120
+"""
+
+
+def upgrade(migrator):
+    with migrator.create_table('entries_categories_through') as table:
+        table.primary_key('id')
+        table.foreign_key('entry_id', 'entries.id')
+        table.foreign_key('category_id', 'categories.id')
+        table.add_index(('entry_id', 'category_id'), unique=True)
+    # peewee indexes every foreign key. The unique index above also serves lookups by
+    # entry_id alone, so the single column one would only slow down writes.
+    migrator.drop_index('entries_categories_through', 'entries_categories_through_entry_id')
+
+
+def downgrade(migrator):
+    migrator.drop_table('entries_categories_through')
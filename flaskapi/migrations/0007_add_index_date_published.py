@@ -0,0 +1,15 @@
+"""
+add index date_published
+date created: 2026-10-18 10:42:03.220871
+"""
+
+
+def upgrade(migrator):
+    # Used by TitleContent.published_filter() and the default ordering of entries.
+    migrator.add_index('entries', ('date_published', ))
+    migrator.add_index('pages', ('date_published', ))
+
+
+def downgrade(migrator):
+    migrator.drop_index('pages', 'pages_date_published')
+    migrator.drop_index('entries', 'entries_date_published')
@@ -1,3 +1,7 @@
+from collections import OrderedDict
+from functools import lru_cache
+import hashlib
+import hmac
 import re
 from uuid import uuid4
 from datetime import datetime
@@ -11,12 +15,27 @@ from peewee import DateTimeField
 from peewee import ForeignKeyField
 from peewee import TextField
 from playhouse.fields import ManyToManyField
-from werkzeug.security import check_password_hash
-from werkzeug.security import generate_password_hash
 
+from flaskapi.ext import credentials
 from flaskapi.ext import db
+from flaskapi.ext import hasher
+from flaskapi.utils.hashing import get_hash_method
+from flaskapi.utils.hashing import normalize_hash_method
 
-PARAGRAPH_RE = re.compile(r'(?:\r\n|\r|\n){2,}')
+# Two or more linebreaks (\r\n, \r or \n) start a new paragraph. Since a lone \r\n also
+# counts as two linebreaks, that is simply any run of two or more \r or \n characters.
+PARAGRAPH_RE = re.compile(r'[\r\n]{2,}')
+
+# Markers that can not occur in escaped text or in the tags inserted by linebreaks.
+# PARAGRAPH_MARK stands in for paragraph breaks until single newlines have been replaced,
+# BATCH_SEPARATOR separates values converted together by linebreaks_many.
+PARAGRAPH_MARK = '<>'
+BATCH_SEPARATOR = '<|>'
+
+
+def _linebreaks(value):
+    value = PARAGRAPH_RE.sub(PARAGRAPH_MARK, value).replace('\n', '<br>')
+    return value.replace(PARAGRAPH_MARK, '</p>\n<p>')
 
 
 def linebreaks(value):
@@ -26,10 +45,30 @@ def linebreaks(value):
     Two linebreaks = <p> tag
     One linebreak = <br> tag
     """
-    value = str(escape(value))
-    paragraphs = PARAGRAPH_RE.split(value)
-    iter_paragraphs = ('<p>{}</p>'.format(x.replace('\n', '<br>')) for x in paragraphs)
-    return '\n'.join(iter_paragraphs)
+    return '<p>' + _linebreaks(str(escape(value))) + '</p>'
+
+
+def linebreaks_many(values):
+    """
+    Convert each of the given values like linebreaks and return a list.
+    All values are escaped and converted together in one pass over the combined text.
+    """
+    values = list(values)
+    if not values:
+        return []
+    text = BATCH_SEPARATOR.join(str(escape(value)) for value in values)
+    return ['<p>' + value + '</p>' for value in _linebreaks(text).split(BATCH_SEPARATOR)]
+
+
+def content_hash(value):
+    """Return a hash of the given content, used to detect stale rendered HTML."""
+    return hashlib.sha1((value or '').encode('utf-8')).hexdigest()
+
+
+@lru_cache(maxsize=1024)
+def render_markdown(value):
+    """Render the given markdown to HTML, remembering recently rendered content."""
+    return markdown(value)
 
 
 def generate_api_key():
@@ -44,16 +83,60 @@ class Model(db.Model):
     def __repr__(self):
         return str(self)
 
+    def save(self, *args, **kwargs):
+        """Overwrite to keep reading from the primary database after a write."""
+        db.record_write()
+        return super().save(*args, **kwargs)
+
+    def delete_instance(self, *args, **kwargs):
+        """Overwrite to keep reading from the primary database after a write."""
+        db.record_write()
+        return super().delete_instance(*args, **kwargs)
+
     def to_dict(self, private=False):
         """
         Convert this model to a dictionary representation.
         The private attribute controls whether private fields should be included in the output.
         """
-        data = {'id': self.id}
-        data.update({key: getattr(self, key) for key in self._meta.serialize})
+        return {key: getattr(self, key) for key in self.serialize_keys(private=private)}
+
+    @classmethod
+    def to_dict_many(cls, objs, private=False, keys=None):
+        """
+        Convert the given instances to dictionaries like to_dict and return a list.
+        keys limits the output to those keys. Overwrite to compute values for a batch at once.
+        """
+        if keys is None:
+            keys = cls.serialize_keys(private=private)
+        return [{key: getattr(obj, key) for key in keys} for obj in objs]
+
+    @classmethod
+    def get_serialize_keys(cls, private=False):
+        """Return the keys to include in the dictionary representation, in order."""
+        keys = ('id', ) + tuple(cls._meta.serialize)
         if private:
-            data.update({key: getattr(self, key) for key in self._meta.serialize_private})
-        return data
+            keys += tuple(cls._meta.serialize_private)
+        return keys
+
+    @classmethod
+    def serialize_keys(cls, private=False):
+        """Return get_serialize_keys without duplicates, built once per class and reused."""
+        cache = cls._meta.__dict__.setdefault('serialize_keys_cache', {})
+        if private not in cache:
+            cache[private] = tuple(OrderedDict.fromkeys(cls.get_serialize_keys(private=private)))
+        return cache[private]
+
+    @classmethod
+    def serialize_columns(cls, private=False):
+        """
+        Return the fields to select to serialize rows without building model instances.
+        Returns None if any of the serialized keys is not a database column (like a property).
+        """
+        fields = cls._meta.fields
+        keys = cls.serialize_keys(private=private)
+        if not all(key in fields for key in keys):
+            return None
+        return tuple(fields[key] for key in keys)
 
     class Meta:
         serialize = ()
@@ -68,16 +151,13 @@ class TimestampedModel(Model):
         self.date_updated = datetime.utcnow()
         super().save(*args, **kwargs)
 
-    def to_dict(self, private=False):
-        """
-        Convert this model to a dictionary representation.
-        Overwrites to add date_created and date_updated fields.
-        """
-        data = super().to_dict(private=private)
+    @classmethod
+    def get_serialize_keys(cls, private=False):
+        """Overwrites to add date_created and date_updated fields."""
+        keys = super().get_serialize_keys(private=private)
         if private:
-            data['date_created'] = self.date_created
-            data['date_updated'] = self.date_updated
-        return data
+            keys += ('date_created', 'date_updated')
+        return keys
 
 
 class User(TimestampedModel):
@@ -108,23 +188,34 @@ class User(TimestampedModel):
         """Set the password to the hashed value."""
         if not value:
             return
-        self.password_hash = generate_password_hash(value, method=self._get_hash_method())
+        self.password_hash = hasher.generate(value, self._get_hash_method())
+        credentials.invalidate(self.username)
 
     def check_password(self, value):
         """Check if the given password is valid for this user."""
         if not value:
             return False
-        return check_password_hash(self.password_hash, value)
+        return hasher.check(self.password_hash, value)
+
+    def needs_rehash(self):
+        """Check if the password hash was made with another method than the configured one."""
+        return get_hash_method(self.password_hash) != normalize_hash_method(self._get_hash_method())
 
     def generate_api_key(self):
         """Generate an API key and save it to the api_key field."""
         self.api_key = generate_api_key()
+        credentials.invalidate(self.username)
+
+    def delete_instance(self, *args, **kwargs):
+        """Overwrite to drop any cached credentials for this user."""
+        credentials.invalidate(self.username)
+        return super().delete_instance(*args, **kwargs)
 
     def check_api_key(self, value):
         """Check if the given API key is valid for this user."""
-        if not value:
+        if not value or not self.api_key:
             return False
-        return value == self.api_key
+        return hmac.compare_digest(value.encode('utf-8'), self.api_key.encode('utf-8'))
 
 
 class Category(TimestampedModel):
@@ -141,6 +232,8 @@ class TitleContent(TimestampedModel):
     title = CharField(max_length=250)
     date_published = DateTimeField(null=True)
     content = TextField(null=True)
+    content_html = TextField(null=True)
+    content_hash = CharField(max_length=40, null=True)
 
     class Meta:
         serialize = ('title', 'date_published', 'html')
@@ -152,10 +245,49 @@ class TitleContent(TimestampedModel):
         """Filter to find all published instances."""
         return (cls.date_published) & (cls.date_published < datetime.utcnow())
 
+    def save(self, *args, **kwargs):
+        """Overwrite to store the rendered HTML alongside the content."""
+        self.render_html()
+        super().save(*args, **kwargs)
+
+    def render_html(self):
+        """Render content to content_html if it changed since it was last rendered."""
+        digest = content_hash(self.content)
+        if digest != self.content_hash:
+            self.content_html = markdown(self.content or '')
+            self.content_hash = digest
+
+    @classmethod
+    def backfill_html(cls, batch_size=500):
+        """Store rendered HTML for every row where it is missing or stale. Return the count."""
+        count = 0
+        last_id = 0
+        while True:
+            query = (cls
+                     .select(cls.id, cls.content, cls.content_hash)
+                     .where(cls.id > last_id)
+                     .order_by(cls.id)
+                     .limit(batch_size))
+            rows = list(query.tuples())
+            if not rows:
+                return count
+            with cls._meta.database.atomic():
+                for pk, content, digest in rows:
+                    new_digest = content_hash(content)
+                    if digest == new_digest:
+                        continue
+                    # Update directly so that date_updated is left alone.
+                    html = markdown(content or '')
+                    cls.update(content_html=html, content_hash=new_digest).where(cls.id == pk).execute()
+                    count += 1
+            last_id = rows[-1][0]
+
     @property
     def html(self):
         """Return content as formatted (safe) HTML."""
-        return markdown(self.content or '')
+        if self.content_hash is not None and self.content_hash == content_hash(self.content):
+            return self.content_html
+        return render_markdown(self.content or '')
 
 
 class Entry(TitleContent):
@@ -191,3 +323,20 @@ class Comment(TimestampedModel):
     def html(self):
         """Return content as formatted (safe) HTML."""
         return linebreaks(self.content or '')
+
+    @classmethod
+    def html_many(cls, comments):
+        """Return content as formatted (safe) HTML for each of the given comments at once."""
+        return linebreaks_many(comment.content or '' for comment in comments)
+
+    @classmethod
+    def to_dict_many(cls, comments, private=False, keys=None):
+        """Overwrite to render the html of all the comments at once with html_many."""
+        if keys is None:
+            keys = cls.serialize_keys(private=private)
+        data = super().to_dict_many(comments, private=private,
+                                    keys=tuple(key for key in keys if key != 'html'))
+        if 'html' in keys:
+            for item, html in zip(data, cls.html_many(comments)):
+                item['html'] = html
+        return data
@@ -0,0 +1,50 @@
+from datetime import datetime
+
+from flask import current_app
+from peewee_validates import Field
+from peewee_validates import ModelValidator
+from peewee_validates import validate_email
+
+from flaskapi.ext import credentials
+from flaskapi.ext import hasher
+from flaskapi.models import User
+from flaskapi.utils.bulk import BulkOperations
+
+
+class UserValidator(ModelValidator):
+    password = Field(str, min_length=6)
+
+    class Meta:
+        exclude = ('password_hash', )
+
+    def __init__(self, *args, **kwargs):
+        """Overwrite to add email validator."""
+        super().__init__(*args, **kwargs)
+        self._meta.fields['email'].validators.append(validate_email())
+
+
+class UserBulkOperations(BulkOperations):
+    model = User
+    validator_class = UserValidator
+
+    def validate_item(self, item):
+        """Overwrite to require a password for new users."""
+        super().validate_item(item)
+        if item.op == 'create' and not item.errors and not item.data.get('password'):
+            item.errors['password'] = self.message('required')
+
+    def prepare(self, items):
+        """Overwrite to hash the passwords in parallel and drop cached credentials."""
+        with_password = [item for item in items
+                         if item.op != 'delete' and item.data.get('password')]
+        method = current_app.config['PASSWORD_HASH_METHOD']
+        hashes = hasher.generate_many([item.data['password'] for item in with_password], method)
+        for item, password_hash in zip(with_password, hashes):
+            item.data['password_hash'] = password_hash
+
+        now = datetime.utcnow()
+        for item in items:
+            if item.op == 'update':
+                item.data['date_updated'] = now
+            if item.obj is not None:
+                credentials.invalidate(item.obj.username)
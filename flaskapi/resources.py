@@ -1,6 +1,16 @@
 from flaskapi.utils.resource import Resource
+from flaskapi.models import Entry
 from flaskapi.models import User
 
 
 class UserResource(Resource):
     model = User
+
+
+class EntryResource(Resource):
+    model = Entry
+    prefetch = ('categories', 'comments')
+
+    def all(self):
+        """Overwrite to only return published entries."""
+        return super().all().where(Entry.published_filter())
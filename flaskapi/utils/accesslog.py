@@ -0,0 +1,191 @@
+import json
+import os
+import queue
+import re
+import sys
+import time
+import traceback
+from uuid import uuid4
+
+from flask import g
+from flask import request
+
+from flaskapi.utils.background import BackgroundQueueMixin
+
+# Incoming request ids are kept if they look like one, otherwise a new one is generated.
+REQUEST_ID_PATTERN = re.compile(r'^[A-Za-z0-9._:-]{1,128}$')
+
+_STOP = object()
+
+
+def format_timestamp(seconds):
+    return '{}.{:03d}Z'.format(time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(seconds)),
+                               int(seconds % 1 * 1000))
+
+
+class QueueWriter(BackgroundQueueMixin):
+    """
+    Appends lines to a file from a background thread. write() puts the record on a bounded queue
+    and returns at once; when the queue is full the record is dropped and counted. The thread
+    writes whatever is queued in one batch, and reopens the file when it was moved or deleted
+    (like WatchedFileHandler), so logrotate works.
+    """
+
+    thread_name = 'QueueWriter'
+
+    def __init__(self, path, queue_size=10000, batch_size=1000, encode=json.dumps):
+        self.path = path
+        self.batch_size = batch_size
+        self.encode = encode
+        self.written = 0
+        self.dropped = 0
+        self.batches = 0
+        self._stream = None
+        self._stat = None
+        self._init_queue(queue_size)
+
+    def write(self, record):
+        """Queue the record for writing. Return False if it was dropped."""
+        if not self._put(record):
+            self.dropped += 1
+            return False
+        return True
+
+    def _run(self):
+        # The stream of the parent process is not used after a fork.
+        self._stream = None
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            stop = _STOP in batch
+            records = [record for record in batch if record is not _STOP]
+            if records:
+                try:
+                    self._write_batch(records)
+                except Exception:
+                    if sys.stderr:
+                        sys.stderr.write('Could not write {} records to {}:\n'.format(
+                            len(records), self.path))
+                        traceback.print_exc(file=sys.stderr)
+            if stop:
+                if self._stream is not None:
+                    self._stream.close()
+                    self._stream = None
+                return
+
+    def _open(self):
+        """Return the open file, reopening it if it was moved or deleted since it was opened."""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            stat = None
+        if self._stream is not None and (
+                stat is None or (stat.st_dev, stat.st_ino) != self._stat):
+            self._stream.close()
+            self._stream = None
+        if self._stream is None:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            self._stream = open(self.path, 'a', encoding='utf-8')
+            stat = os.fstat(self._stream.fileno())
+            self._stat = (stat.st_dev, stat.st_ino)
+        return self._stream
+
+    def _write_batch(self, records):
+        stream = self._open()
+        stream.write(''.join(self.encode(record) + '\n' for record in records))
+        stream.flush()
+        self.written += len(records)
+        self.batches += 1
+
+    def stats(self):
+        return {
+            'queued': self._queued(),
+            'written': self.written,
+            'dropped': self.dropped,
+            'batches': self.batches,
+        }
+
+    def close(self, timeout=10):
+        """Write what is queued and stop the background thread."""
+        self._stop(_STOP, timeout)
+
+
+class AccessLog:
+    """
+    Writes one JSON line per request to ACCESS_LOG_FILE: time, request id, method, path,
+    endpoint, user id, status, response bytes, database queries and time, and total latency.
+    The request id is taken from the X-Request-Id header when it looks valid, otherwise
+    generated. It is available as g.request_id and returned in the X-Request-Id header.
+    The lines are written by a QueueWriter, so the request never waits for the disk.
+    """
+
+    header = 'X-Request-Id'
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self.writer = None
+        self.db = None
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        from flaskapi.ext import db
+
+        if self.writer is not None:
+            self.writer.close()
+        self.enabled = app.config['ACCESS_LOG_ENABLED']
+        self.db = db
+        self.writer = None
+        if not self.enabled:
+            return
+
+        self.writer = QueueWriter(app.config['ACCESS_LOG_FILE'],
+                                  queue_size=app.config['ACCESS_LOG_QUEUE_SIZE'])
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+
+    def _before_request(self):
+        request_id = request.headers.get(self.header)
+        if not request_id or not REQUEST_ID_PATTERN.match(request_id):
+            request_id = uuid4().hex
+        g.request_id = request_id
+        g._access_log = (time.time(), time.perf_counter(), [500, None])
+
+    def _after_request(self, response):
+        state = g.get('_access_log')
+        if state is not None:
+            response.headers[self.header] = g.request_id
+            state[2][0] = response.status_code
+            state[2][1] = response.calculate_content_length()
+        return response
+
+    def _teardown_request(self, exc):
+        state = g.pop('_access_log', None)
+        if state is None:
+            return
+        timestamp, start, (status, size) = state
+        user = g.get('user')
+        stats = self.db.request_stats()
+        self.writer.write({
+            'time': format_timestamp(timestamp),
+            'request_id': g.request_id,
+            'method': request.method,
+            'path': request.path,
+            'endpoint': request.endpoint,
+            'user_id': getattr(user, 'id', None),
+            'status': status,
+            'bytes': size,
+            'db_queries': stats.count if stats is not None else None,
+            'db_ms': round(stats.seconds * 1000, 3) if stats is not None else None,
+            'ms': round((time.perf_counter() - start) * 1000, 3),
+        })
+
+    def stats(self):
+        return self.writer.stats() if self.writer is not None else None
@@ -0,0 +1,55 @@
+import os
+import queue
+import threading
+
+
+class BackgroundQueueMixin:
+    """
+    A bounded queue consumed by the _run method of the class in a daemon thread. The queue and
+    thread are started on first use in every process. Classes call _init_queue() from __init__
+    and set thread_name.
+    """
+
+    thread_name = None
+
+    def _init_queue(self, queue_size):
+        self.queue_size = queue_size
+        self._pid = None
+        self._queue = None
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def _start(self):
+        with self._start_lock:
+            # A forked process inherits the queue but not the thread, so it starts its own.
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._queue = queue.Queue(self.queue_size)
+                self._thread = threading.Thread(target=self._run, name=self.thread_name,
+                                                daemon=True)
+                self._thread.start()
+
+    def _put(self, item):
+        """Queue the item without waiting. Return False if the queue is full."""
+        if self._pid != os.getpid():
+            self._start()
+        try:
+            self._queue.put_nowait(item)
+            return True
+        except queue.Full:
+            return False
+
+    def _queued(self):
+        return self._queue.qsize() if self._pid == os.getpid() else 0
+
+    def _stop(self, item, timeout):
+        """Queue the stop item and wait for the thread of this process to finish."""
+        if self._pid == os.getpid() and self._thread.is_alive():
+            try:
+                self._queue.put(item, timeout=timeout)
+            except queue.Full:
+                pass
+            self._thread.join(timeout)
+
+    def _run(self):
+        raise NotImplementedError
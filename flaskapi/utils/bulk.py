@@ -0,0 +1,276 @@
+from werkzeug.exceptions import BadRequest
+
+from flaskapi.ext import db
+
+OPERATIONS = ('create', 'update', 'delete')
+
+
+def chunked(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class BulkItem:
+    """One operation of a bulk request, with its validated data and errors."""
+
+    __slots__ = ('index', 'op', 'pk', 'data', 'obj', 'errors', 'step')
+
+    def __init__(self, index, op, pk=None, data=None):
+        self.index = index
+        self.op = op
+        self.pk = pk
+        self.data = data
+        self.obj = None
+        self.errors = {}
+        self.step = 0
+
+
+class BulkOperations:
+    """
+    Validates and applies a list of create, update and delete operations on a model in one
+    transaction. Every item is validated with validator_class like a single request would be,
+    except that unique fields are checked for the whole batch at once: a query per field and
+    chunk of values instead of one per field and item. If any item is invalid, nothing is written.
+
+    Unique values are checked against the table as it will be after the batch, so values given
+    up by deleted or updated rows can be taken by other items. Deletes run first, then updates,
+    ordered so that a row gives up a value before another row takes it, then creates with
+    insert_many in chunks. Updates making the same changes in the same step share one UPDATE.
+    Rows can not swap values within one batch, since one of them would have to go first.
+    """
+
+    model = None
+    validator_class = None
+
+    # Values per IN (...) query, and rows per INSERT (SQLite allows 999 variables per query).
+    query_chunk_size = 500
+    insert_chunk_size = 100
+
+    def __init__(self, max_operations=None):
+        self.max_operations = max_operations
+        self.fields = self.model._meta.fields
+        self.pk_field = self.model._meta.primary_key
+        self.unique_fields = [field for field in self.model._meta.sorted_fields
+                              if field.unique and not field.primary_key]
+        self.validator = self.validator_class(self.model())
+        self.validator._meta.fields = {
+            name: self.without_unique_validators(field)
+            for name, field in self.validator._meta.fields.items()}
+
+    @staticmethod
+    def without_unique_validators(field):
+        field.validators = [func for func in field.validators
+                            if getattr(func, '__name__', None) != 'unique_validator']
+        return field
+
+    def parse(self, payload):
+        """
+        Return the items of a payload: a list of {"op": ..., "id": ..., "data": {...}},
+        optionally wrapped in {"operations": [...]}. Raise BadRequest if it is not a list.
+        """
+        if isinstance(payload, dict):
+            payload = payload.get('operations')
+        if not isinstance(payload, list):
+            raise BadRequest('Expected a list of operations.')
+        if self.max_operations and len(payload) > self.max_operations:
+            raise BadRequest('At most {} operations are allowed.'.format(self.max_operations))
+
+        items = []
+        for index, operation in enumerate(payload):
+            if not isinstance(operation, dict):
+                operation = {}
+            data = operation.get('data')
+            item = BulkItem(index, operation.get('op'), operation.get('id'),
+                            data if isinstance(data, dict) else {})
+            if item.op not in OPERATIONS:
+                item.errors['op'] = 'must be one of: {}'.format(', '.join(OPERATIONS))
+            elif item.op != 'create' and not isinstance(item.pk, int):
+                item.errors['id'] = self.message('required')
+            elif data is not None and not isinstance(data, dict):
+                item.errors['data'] = 'must be an object'
+            items.append(item)
+        return items
+
+    def message(self, key):
+        meta = self.validator._meta
+        return meta.messages.get(key) or meta.default_messages[key]
+
+    def load(self, items):
+        """Set obj on the update and delete items, with one query per chunk of ids."""
+        by_pk = {}
+        for item in items:
+            if item.op in ('update', 'delete') and not item.errors:
+                if item.pk in by_pk:
+                    item.errors['id'] = 'must only appear once'
+                else:
+                    by_pk[item.pk] = item
+        for pks in chunked(list(by_pk), self.query_chunk_size):
+            for obj in self.model.select().where(self.pk_field << pks):
+                by_pk[obj._get_pk_value()].obj = obj
+        for item in by_pk.values():
+            if item.obj is None:
+                item.errors['id'] = 'not found'
+
+    def validate_item(self, item):
+        """Validate the data of a create or update item and replace it with the cleaned data."""
+        validator = self.validator
+        validator.instance = item.obj if item.op == 'update' else self.model()
+        validator.pk_value = validator.instance._get_pk_value()
+        if validator.validate(dict(item.data)):
+            item.data = validator.data
+        else:
+            item.errors.update(validator.errors)
+
+    def get_changes(self, item):
+        """Return the fields an update item changes, as a dictionary of name to new value."""
+        return {name: value for name, value in self.get_row(item).items()
+                if value != getattr(item.obj, name)}
+
+    def check_unique(self, items):
+        """
+        Check the unique fields of the create and update items against each other, and against
+        the table as it will be after the deletes and updates of the batch.
+        """
+        deleted = {item.pk for item in items if item.op == 'delete'}
+        checked = [item for item in items if item.op != 'delete' and not item.errors]
+        changes = {item: self.get_changes(item) for item in checked if item.op == 'update'}
+        for field in self.unique_fields:
+            # Rows updated to another value give up their current one.
+            vacating = {item.pk for item, changed in changes.items() if field.name in changed}
+            owners = {}
+            for item in checked:
+                value = item.data.get(field.name)
+                if value is None:
+                    continue
+                if value in owners:
+                    item.errors[field.name] = self.message('unique')
+                else:
+                    owners[value] = item
+
+            for values in chunked(list(owners), self.query_chunk_size):
+                query = (self.model
+                         .select(self.pk_field, field)
+                         .where(field << values)
+                         .tuples())
+                for pk, value in query:
+                    item = owners[value]
+                    if pk != item.pk and pk not in deleted and pk not in vacating:
+                        item.errors[field.name] = self.message('unique')
+
+        unique_names = {field.name for field in self.unique_fields}
+        updates = {item: {name: value for name, value in changed.items() if name in unique_names}
+                   for item, changed in changes.items() if not item.errors}
+        for item in self.order_updates(updates):
+            for name in updates[item]:
+                item.errors[name] = 'can not be swapped with another item'
+
+    def order_updates(self, changes):
+        """
+        Set the step of the given update items, a dictionary of item to the unique values it
+        changes: every item runs a step after the items giving up a value it takes.
+        Return the items that would have to take values from each other in a cycle.
+        """
+        holders = {(name, getattr(item.obj, name)): item
+                   for item, changed in changes.items() for name in changed}
+        dependencies = {item: [holders[key] for key in changed.items()
+                               if key in holders and holders[key] is not item]
+                        for item, changed in changes.items()}
+
+        steps = {}
+        cycles = set()
+        for root in changes:
+            if root in steps:
+                continue
+            stack = [(root, iter(dependencies[root]))]
+            visiting = {root}
+            while stack:
+                item, pending = stack[-1]
+                dependency = next(pending, None)
+                if dependency is None:
+                    stack.pop()
+                    visiting.discard(item)
+                    steps[item] = max((steps.get(dep, 0) + 1 for dep in dependencies[item]), default=0)
+                elif dependency in visiting:
+                    members = [entry[0] for entry in stack]
+                    cycles.update(members[members.index(dependency):])
+                elif dependency not in steps:
+                    visiting.add(dependency)
+                    stack.append((dependency, iter(dependencies[dependency])))
+
+        for item, step in steps.items():
+            item.step = step
+        return [item for item in changes if item in cycles]
+
+    def validate(self, items):
+        """Validate the items. Return True if all of them are valid."""
+        self.load(items)
+        for item in items:
+            if item.op in ('create', 'update') and not item.errors:
+                self.validate_item(item)
+        self.check_unique(items)
+        return not any(item.errors for item in items)
+
+    def prepare(self, items):
+        """Hook to turn the cleaned data of the create and update items into model fields."""
+
+    def get_row(self, item):
+        return {name: value for name, value in item.data.items()
+                if name in self.fields and name != self.pk_field.name}
+
+    def execute(self, items):
+        """Write the validated items in one transaction."""
+        self.prepare(items)
+        deletes = [item for item in items if item.op == 'delete']
+        updates = [item for item in items if item.op == 'update']
+        creates = [item for item in items if item.op == 'create']
+
+        db.record_write()
+        with db.database.atomic():
+            for chunk in chunked(deletes, self.query_chunk_size):
+                pks = [item.pk for item in chunk]
+                self.model.delete().where(self.pk_field << pks).execute()
+
+            for changed, pks in self.group_updates(updates):
+                for chunk in chunked(pks, self.query_chunk_size):
+                    self.model.update(**changed).where(self.pk_field << chunk).execute()
+            for item in updates:
+                for name, value in self.get_changes(item).items():
+                    setattr(item.obj, name, value)
+
+            rows = [self.get_row(item) for item in creates]
+            for chunk in chunked(rows, self.insert_chunk_size):
+                self.model.insert_many(chunk).execute()
+
+            # insert_many does not return the new ids, so read the rows back by a unique field.
+            if creates:
+                field = self.unique_fields[0]
+                by_value = {row[field.name]: item for row, item in zip(rows, creates)}
+                for values in chunked(list(by_value), self.query_chunk_size):
+                    for obj in self.model.select().where(field << values):
+                        by_value[getattr(obj, field.name)].obj = obj
+
+    def group_updates(self, updates):
+        """
+        Return (changes, primary keys) for the update items, in order of their step, with the
+        items of a step that make the same changes grouped together.
+        """
+        groups = {}
+        for item in updates:
+            changed = self.get_changes(item)
+            if not changed:
+                continue
+            try:
+                key = (item.step, tuple(sorted(changed.items())))
+                hash(key)
+            except TypeError:
+                key = (item.step, id(item))
+            groups.setdefault(key, (changed, []))[1].append(item.pk)
+        return [groups[key] for key in sorted(groups, key=lambda key: key[0])]
+
+    def run(self, payload):
+        """Parse, validate and execute the payload. Return the items."""
+        items = self.parse(payload)
+        if self.validate(items):
+            self.execute(items)
+        return items
+
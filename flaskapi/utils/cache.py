@@ -0,0 +1,304 @@
+from collections import OrderedDict
+import math
+import pickle
+import threading
+import time
+
+from werkzeug.contrib.cache import BaseCache
+
+from flaskapi.utils.sqlite import LocalConnection
+
+
+class StatsMixin:
+    """Hit, miss and eviction counters for a cache. Counters are local to the process."""
+
+    hits = 0
+    misses = 0
+    evictions = 0
+
+    def stats(self):
+        """Return the counters and current size of the cache as a dictionary."""
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'entries': self.count(),
+            'bytes': self.size(),
+        }
+
+    def count(self):
+        raise NotImplementedError
+
+    def size(self):
+        raise NotImplementedError
+
+
+class LRUCache(StatsMixin, BaseCache):
+    """
+    An in-process, thread safe least recently used cache.
+    Bounded by number of entries and approximate size in bytes of the pickled values.
+    A max_bytes of 0 means the size is unbounded.
+    """
+
+    # Whether entries are visible to every process using the cache.
+    shared = False
+
+    def __init__(self, threshold=500, max_bytes=0, default_timeout=300):
+        BaseCache.__init__(self, default_timeout)
+        self.threshold = threshold
+        self.max_bytes = max_bytes
+        self._cache = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def _get_expiration(self, timeout):
+        if timeout is None:
+            timeout = self.default_timeout
+        if timeout > 0:
+            timeout = time.time() + timeout
+        return timeout
+
+    def _pop(self, key):
+        expires, value = self._cache.pop(key)
+        self._bytes -= len(value)
+
+    def _prune(self):
+        while self._cache and (
+                len(self._cache) > self.threshold or
+                (self.max_bytes and self._bytes > self.max_bytes)):
+            self._pop(next(iter(self._cache)))
+            self.evictions += 1
+
+    def _get(self, key):
+        try:
+            expires, value = self._cache[key]
+        except KeyError:
+            return None
+        if expires != 0 and expires <= time.time():
+            self._pop(key)
+            return None
+        return value
+
+    def get(self, key):
+        with self._lock:
+            value = self._get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._cache.move_to_end(key)
+        try:
+            return pickle.loads(value)
+        except pickle.PickleError:
+            return None
+
+    def _set(self, key, expires, value):
+        if key in self._cache:
+            self._pop(key)
+        self._cache[key] = (expires, value)
+        self._bytes += len(value)
+        self._prune()
+
+    def set(self, key, value, timeout=None):
+        expires = self._get_expiration(timeout)
+        value = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._set(key, expires, value)
+        return True
+
+    def add(self, key, value, timeout=None):
+        expires = self._get_expiration(timeout)
+        value = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            if self._get(key) is not None:
+                return False
+            self._set(key, expires, value)
+        return True
+
+    def delete(self, key):
+        with self._lock:
+            if key not in self._cache:
+                return False
+            self._pop(key)
+            return True
+
+    def has(self, key):
+        with self._lock:
+            return self._get(key) is not None
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+            self._bytes = 0
+        return True
+
+    def count(self):
+        return len(self._cache)
+
+    def size(self):
+        return self._bytes
+
+
+class SQLiteCache(StatsMixin, BaseCache):
+    """
+    A cache stored in a SQLite database file, shared by every process on the host.
+    Bounded by number of entries and approximate size in bytes, evicting the least
+    recently used entries first. A max_bytes of 0 means the size is unbounded.
+
+    The entry count and total size are kept in the cache_stats row by triggers, so checking
+    the bounds on each write does not scan the table. Reads do not write: the access times of
+    hits are collected in the process and stored with the next write, or once
+    accessed_batch_size of them are pending, so a hit does not take the database write lock.
+    """
+
+    shared = True
+
+    # Number of pending access times that are stored without waiting for a write.
+    accessed_batch_size = 100
+
+    schema = (
+        'CREATE TABLE IF NOT EXISTS cache ('
+        'key TEXT PRIMARY KEY, value BLOB, expires REAL, accessed REAL, size INTEGER)',
+        'CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)',
+        'CREATE INDEX IF NOT EXISTS cache_expires ON cache (expires)',
+        'CREATE TABLE IF NOT EXISTS cache_stats ('
+        'id INTEGER PRIMARY KEY CHECK (id = 0), entries INTEGER, bytes INTEGER)',
+        'INSERT OR IGNORE INTO cache_stats (id, entries, bytes) '
+        'SELECT 0, COUNT(*), COALESCE(SUM(size), 0) FROM cache',
+        'CREATE TRIGGER IF NOT EXISTS cache_insert AFTER INSERT ON cache BEGIN '
+        'UPDATE cache_stats SET entries = entries + 1, bytes = bytes + NEW.size WHERE id = 0; END',
+        'CREATE TRIGGER IF NOT EXISTS cache_delete AFTER DELETE ON cache BEGIN '
+        'UPDATE cache_stats SET entries = entries - 1, bytes = bytes - OLD.size WHERE id = 0; END',
+    )
+
+    def __init__(self, path, threshold=500, max_bytes=0, default_timeout=300, timeout=5):
+        BaseCache.__init__(self, default_timeout)
+        self.path = path
+        self.threshold = threshold
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        # INSERT OR REPLACE only fires the delete trigger for the replaced row with
+        # recursive_triggers on.
+        self._connection = LocalConnection(path, timeout, pragmas=(
+            'journal_mode=WAL', 'synchronous=NORMAL', 'recursive_triggers=ON'))
+        self._lock = threading.Lock()
+        self._accessed = {}
+
+        conn = self._connection.get()
+        conn.execute('BEGIN IMMEDIATE')
+        for statement in self.schema:
+            conn.execute(statement)
+        conn.execute('COMMIT')
+
+    def _get_expiration(self, timeout):
+        if timeout is None:
+            timeout = self.default_timeout
+        if timeout > 0:
+            timeout = time.time() + timeout
+        return timeout
+
+    def _stats(self, conn):
+        return conn.execute('SELECT entries, bytes FROM cache_stats WHERE id = 0').fetchone()
+
+    def _over(self, count, size):
+        return count > self.threshold or (self.max_bytes and size > self.max_bytes)
+
+    def _prune(self, conn):
+        count, size = self._stats(conn)
+        if not self._over(count, size):
+            return
+
+        conn.execute('DELETE FROM cache WHERE expires > 0 AND expires <= ?', (time.time(), ))
+        count, size = self._stats(conn)
+        while count and self._over(count, size):
+            # Evict enough of the oldest entries to get under the entry limit, and roughly
+            # enough average sized ones to get under the size limit.
+            excess = count - self.threshold
+            if self.max_bytes and size > self.max_bytes:
+                excess = max(excess, math.ceil((size - self.max_bytes) / (size / count)))
+            cursor = conn.execute(
+                'DELETE FROM cache WHERE key IN '
+                '(SELECT key FROM cache ORDER BY accessed LIMIT ?)', (max(excess, 1), ))
+            with self._lock:
+                self.evictions += cursor.rowcount
+            count, size = self._stats(conn)
+
+    def _store_accessed(self, conn):
+        """Store the pending access times, in the transaction of the caller."""
+        with self._lock:
+            accessed, self._accessed = self._accessed, {}
+        if accessed:
+            conn.executemany('UPDATE cache SET accessed = ? WHERE key = ?',
+                             [(when, key) for key, when in accessed.items()])
+
+    def get(self, key):
+        conn = self._connection.get()
+        row = conn.execute('SELECT value, expires FROM cache WHERE key = ?', (key, )).fetchone()
+        now = time.time()
+        with self._lock:
+            if row is None or (row[1] != 0 and row[1] <= now):
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._accessed[key] = now
+            full = len(self._accessed) >= self.accessed_batch_size
+        if full:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                self._store_accessed(conn)
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+            conn.execute('COMMIT')
+        try:
+            return pickle.loads(row[0])
+        except pickle.PickleError:
+            return None
+
+    def _write(self, key, value, timeout, replace):
+        expires = self._get_expiration(timeout)
+        value = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        conn = self._connection.get()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            self._store_accessed(conn)
+            if not replace:
+                row = conn.execute('SELECT expires FROM cache WHERE key = ?', (key, )).fetchone()
+                if row is not None and (row[0] == 0 or row[0] > time.time()):
+                    conn.execute('ROLLBACK')
+                    return False
+            conn.execute(
+                'INSERT OR REPLACE INTO cache (key, value, expires, accessed, size) '
+                'VALUES (?, ?, ?, ?, ?)', (key, value, expires, time.time(), len(value)))
+            self._prune(conn)
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+        return True
+
+    def set(self, key, value, timeout=None):
+        return self._write(key, value, timeout, replace=True)
+
+    def add(self, key, value, timeout=None):
+        return self._write(key, value, timeout, replace=False)
+
+    def delete(self, key):
+        cursor = self._connection.get().execute('DELETE FROM cache WHERE key = ?', (key, ))
+        return cursor.rowcount > 0
+
+    def has(self, key):
+        row = self._connection.get().execute(
+            'SELECT 1 FROM cache WHERE key = ? AND (expires = 0 OR expires > ?)',
+            (key, time.time())).fetchone()
+        return row is not None
+
+    def clear(self):
+        self._connection.get().execute('DELETE FROM cache')
+        return True
+
+    def count(self):
+        return self._stats(self._connection.get())[0]
+
+    def size(self):
+        return self._stats(self._connection.get())[1]
@@ -0,0 +1,84 @@
+from collections import OrderedDict
+from threading import Lock
+import hashlib
+import hmac
+import time
+
+
+class CredentialCache:
+    """
+    A bounded, expiring cache of credentials that were successfully verified.
+
+    Entries are keyed by username plus a keyed digest (HMAC with the app secret) of the
+    presented secret, so plaintext secrets are never stored. Each entry remembers the
+    value it was verified against (the password hash), and a lookup only succeeds when
+    that value still matches. This keeps the cache correct across processes, where a
+    password change in one worker cannot invalidate the memory of another.
+    """
+
+    def __init__(self, app=None):
+        self.maxsize = 0
+        self.timeout = 0
+        self._key = b''
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.maxsize = app.config['CREDENTIAL_CACHE_SIZE']
+        self.timeout = app.config['CREDENTIAL_CACHE_SECONDS']
+
+        key = app.config['SECRET_KEY']
+        self._key = key.encode('utf-8') if isinstance(key, str) else key
+        self.clear()
+
+    @property
+    def enabled(self):
+        return self.maxsize > 0 and self.timeout > 0
+
+    def _make_key(self, username, secret):
+        digest = hmac.new(self._key, secret.encode('utf-8'), hashlib.sha256).hexdigest()
+        return (username, digest)
+
+    def get(self, username, secret):
+        """Return the value stored for these credentials, or None if missing or expired."""
+        if not self.enabled or not secret:
+            return None
+        key = self._make_key(username, secret)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, username, secret, value):
+        """Remember that these credentials were verified against the given value."""
+        if not self.enabled or not secret:
+            return
+        key = self._make_key(username, secret)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.timeout, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, username):
+        """Drop every entry for the given username."""
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == username]:
+                del self._entries[key]
+
+    def clear(self):
+        """Drop every entry."""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
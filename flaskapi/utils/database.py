@@ -0,0 +1,451 @@
+from contextlib import contextmanager
+from functools import wraps
+from urllib.parse import urlparse
+import os
+import threading
+import time
+
+from flask import current_app
+from flask import g
+from flask import has_app_context
+from flask import has_request_context
+from flask import request
+from playhouse import flask_utils
+from playhouse import pool
+from playhouse.db_url import connect as db_url_connect
+from playhouse.db_url import parseresult_to_dict
+
+try:
+    from playhouse.postgres_ext import PostgresqlExtDatabase
+    from playhouse.postgres_ext import ServerSide
+except ImportError:
+    PostgresqlExtDatabase = ServerSide = None
+
+
+class PoolMetricsMixin:
+    """
+    Extends the playhouse pooled databases:
+    - Waits up to wait_timeout seconds for a connection when the pool is exhausted,
+      instead of failing right away.
+    - Starts with an empty pool in a forked child process, so connections are never
+      shared with the parent (prefork servers like gunicorn).
+    - Keeps counters for checkouts, waits and timeouts, and checkout latency.
+    """
+
+    def __init__(self, *args, wait_timeout=None, **kwargs):
+        self.wait_timeout = wait_timeout
+        self._reset_metrics()
+        self._reset_pool_state()
+        super().__init__(*args, **kwargs)
+
+    def _reset_metrics(self):
+        self.checkouts = 0
+        self.waits = 0
+        self.timeouts = 0
+        self.checkout_seconds_total = 0.0
+        self.checkout_seconds_max = 0.0
+
+    def _reset_pool_state(self):
+        self._pid = os.getpid()
+        self._condition = threading.Condition()
+        self._reserved = 0
+
+    def _check_fork(self):
+        """Drop everything inherited from the parent process after a fork."""
+        if self._pid == os.getpid():
+            return
+        # The inherited sockets belong to the parent, so they are forgotten, not closed.
+        self._connections = []
+        self._in_use = {}
+        self._closed = set()
+        self._local = type(self._local)()
+        self._conn_lock = threading.Lock()
+        self._reset_pool_state()
+        self._reset_metrics()
+
+    def _is_exhausted(self):
+        if not self.max_connections:
+            return False
+        return len(self._in_use) + self._reserved >= self.max_connections
+
+    def connect(self):
+        self._check_fork()
+        start = time.perf_counter()
+
+        # Wait for a free slot outside of the connection lock, which close() needs in order
+        # to return a connection to the pool. The slot is reserved until connect() returns.
+        with self._condition:
+            if self._is_exhausted():
+                self.waits += 1
+                deadline = start + (self.wait_timeout or 0)
+                while self._is_exhausted():
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0:
+                        self.timeouts += 1
+                        raise ValueError('Exceeded maximum connections.')
+                    self._condition.wait(remaining)
+            self._reserved += 1
+
+        try:
+            super().connect()
+        finally:
+            with self._condition:
+                self._reserved -= 1
+
+        elapsed = time.perf_counter() - start
+        self.checkouts += 1
+        self.checkout_seconds_total += elapsed
+        self.checkout_seconds_max = max(self.checkout_seconds_max, elapsed)
+
+    def _close(self, conn, close_conn=False):
+        super()._close(conn, close_conn=close_conn)
+        with self._condition:
+            self._condition.notify()
+
+    def stats(self):
+        """Return the current state of the pool and its counters as a dictionary."""
+        self._check_fork()
+        return {
+            'max_connections': self.max_connections,
+            'in_use': len(self._in_use),
+            'idle': len(self._connections),
+            'checkouts': self.checkouts,
+            'waits': self.waits,
+            'timeouts': self.timeouts,
+            'checkout_seconds_total': self.checkout_seconds_total,
+            'checkout_seconds_max': self.checkout_seconds_max,
+        }
+
+
+def get_pooled_classes():
+    """Return a dictionary of URL scheme to metered pooled database class."""
+    classes = {
+        'mysql': 'PooledMySQLDatabase',
+        'postgres': 'PooledPostgresqlDatabase',
+        'postgresql': 'PooledPostgresqlDatabase',
+        'postgresext': 'PooledPostgresqlExtDatabase',
+        'postgresqlext': 'PooledPostgresqlExtDatabase',
+        'sqlite': 'PooledSqliteDatabase',
+        'sqliteext': 'PooledSqliteExtDatabase',
+    }
+    result = {}
+    for scheme, name in classes.items():
+        base = getattr(pool, name, None)
+        if base is not None:
+            result[scheme] = type('Metered' + name, (PoolMetricsMixin, base), {})
+    return result
+
+
+POOLED_CLASSES = get_pooled_classes()
+
+
+def connect_pool(url, **kwargs):
+    """
+    Connect to the database URL with a metered connection pool.
+    Accepts plain schemes (postgresql://) as well as playhouse pool schemes (postgresql+pool://).
+    The kwargs are passed to the pooled database class.
+    """
+    parsed = urlparse(url)
+    parsed = parsed._replace(scheme=parsed.scheme.replace('+pool', ''))
+    try:
+        database_class = POOLED_CLASSES[parsed.scheme]
+    except KeyError:
+        raise RuntimeError('Connection pooling is not supported for {}.'.format(parsed.scheme))
+    connect_kwargs = parseresult_to_dict(parsed)
+    connect_kwargs.update(kwargs)
+    return database_class(**connect_kwargs)
+
+
+def iterate(query, server_side=False):
+    """
+    Iterate over the results of a query without caching them in the query.
+    With server_side=True on PostgresqlExtDatabase (postgresext:// URLs), rows are fetched
+    from a server-side cursor as they are consumed, instead of all at once by the driver.
+    """
+    database = getattr(query.database, 'obj', query.database)
+    if server_side and PostgresqlExtDatabase is not None and isinstance(database, PostgresqlExtDatabase):
+        return ServerSide(query)
+    return query.iterator()
+
+
+class ReplicaRouter:
+    """
+    Picks a read replica for each request, either in turn (round-robin) or the one with
+    the fewest requests in flight in this process (least-loaded).
+    """
+
+    selections = ('round-robin', 'least-loaded')
+
+    def __init__(self, databases, selection='round-robin'):
+        if selection not in self.selections:
+            raise ValueError('Unknown replica selection: {}'.format(selection))
+        self.databases = list(databases)
+        self.selection = selection
+        self.loads = [0] * len(self.databases)
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Return the index of the replica to use. It must be given back with release()."""
+        with self._lock:
+            count = len(self.databases)
+            if self.selection == 'least-loaded':
+                # Break ties in turn, so idle replicas are still used evenly.
+                order = [(self._next + offset) % count for offset in range(count)]
+                index = min(order, key=self.loads.__getitem__)
+            else:
+                index = self._next % count
+            self._next = index + 1
+            self.loads[index] += 1
+        return index
+
+    def release(self, index):
+        with self._lock:
+            self.loads[index] -= 1
+
+
+class QueryStats:
+    """Counts the queries run while it is collecting, with their total time and the slowest one."""
+
+    def __init__(self, record=False):
+        self.count = 0
+        self.seconds = 0.0
+        self.slowest_seconds = 0.0
+        self.slowest_sql = None
+        self.statements = {}
+        self.queries = [] if record else None
+
+    def add(self, sql, seconds):
+        self.count += 1
+        self.seconds += seconds
+        self.statements[sql] = self.statements.get(sql, 0) + 1
+        if seconds >= self.slowest_seconds:
+            self.slowest_seconds = seconds
+            self.slowest_sql = sql
+        if self.queries is not None:
+            self.queries.append(sql)
+
+    def repeated(self, threshold):
+        """
+        Return (sql, count) for the statements that ran at least threshold times, which usually
+        means related objects are loaded one at a time (an N+1 query).
+        """
+        return sorted(((sql, count) for sql, count in self.statements.items() if count >= threshold),
+                      key=lambda item: -item[1])
+
+
+class FlaskDB(flask_utils.FlaskDB):
+    """
+    Subclass of playhouse FlaskDB that can put a connection pool behind the configured URL
+    and route reads to replicas.
+    Set DATABASE_POOL to enable the pool, with the DATABASE_MAX_CONNECTIONS,
+    DATABASE_STALE_TIMEOUT and DATABASE_WAIT_TIMEOUT settings.
+    Set DATABASE_REPLICAS to a list of URLs to enable read_database() and use_replica().
+
+    Every query is counted by the QueryStats collecting in the current thread, see count_queries().
+    Each request collects its own, reported in a Server-Timing header (DATABASE_SERVER_TIMING)
+    and in the log for requests slower than SLOW_REQUEST_SECONDS or running a statement at least
+    DATABASE_REPEATED_QUERY_THRESHOLD times.
+    """
+
+    router = None
+    read_your_writes = 0
+
+    def __init__(self, *args, **kwargs):
+        self._local = threading.local()
+        super().__init__(*args, **kwargs)
+
+    def init_app(self, app):
+        super().init_app(app)
+        replicas = [self._connect(app, url) for url in app.config.get('DATABASE_REPLICAS', ())]
+        self.router = None
+        if replicas:
+            selection = app.config.get('DATABASE_REPLICA_SELECTION', 'round-robin')
+            self.router = ReplicaRouter(replicas, selection)
+        self.read_your_writes = app.config.get('DATABASE_READ_YOUR_WRITES_SECONDS', 0)
+        if replicas and self.read_your_writes and not getattr(getattr(app, 'cache', None), 'shared', False):
+            # A per-process cache would only send the writer's next read to the primary when it
+            # happens to land on the same process.
+            raise ValueError('DATABASE_READ_YOUR_WRITES_SECONDS requires a cache shared between '
+                             'processes (CACHE_TYPE=sqlite), or set it to 0.')
+
+        self.instrument(getattr(self.database, 'obj', self.database))
+        for replica in replicas:
+            self.instrument(replica)
+
+    def _register_handlers(self, app):
+        super()._register_handlers(app)
+        app.before_request(self._start_request_stats)
+        app.after_request(self._add_server_timing)
+        app.teardown_request(self._finish_request_stats)
+
+    def _collectors(self):
+        collectors = getattr(self._local, 'collectors', None)
+        if collectors is None:
+            collectors = self._local.collectors = []
+        return collectors
+
+    def instrument(self, database):
+        """Wrap execute_sql of the given database to report queries to the collecting QueryStats."""
+        execute_sql = database.execute_sql
+        if getattr(execute_sql, 'instrumented', False):
+            return
+
+        @wraps(execute_sql)
+        def instrumented(sql, *args, **kwargs):
+            collectors = self._collectors()
+            if not collectors:
+                return execute_sql(sql, *args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return execute_sql(sql, *args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                for stats in collectors:
+                    stats.add(sql, elapsed)
+
+        instrumented.instrumented = True
+        database.execute_sql = instrumented
+
+    @contextmanager
+    def count_queries(self, record=False):
+        """
+        Collect the queries run in this thread within the block in a QueryStats.
+        With record=True, the SQL of every query is kept in its queries list.
+        """
+        stats = QueryStats(record=record)
+        collectors = self._collectors()
+        collectors.append(stats)
+        try:
+            yield stats
+        finally:
+            collectors.remove(stats)
+
+    def _start_request_stats(self):
+        stats = QueryStats()
+        self._collectors().append(stats)
+        g._query_stats = (stats, time.perf_counter())
+
+    def request_stats(self):
+        """Return the QueryStats of the current request, or None outside of a request."""
+        stats = g.get('_query_stats') if has_app_context() else None
+        return stats[0] if stats is not None else None
+
+    def _add_server_timing(self, response):
+        if not current_app.config.get('DATABASE_SERVER_TIMING') or '_query_stats' not in g:
+            return response
+        stats = g._query_stats[0]
+        response.headers.add('Server-Timing', 'db;dur={:.3f};desc="{} queries"'.format(
+            stats.seconds * 1000, stats.count))
+        return response
+
+    def _finish_request_stats(self, exc):
+        stats, start = g.pop('_query_stats', (None, None))
+        if stats is None:
+            return
+        collectors = self._collectors()
+        if stats in collectors:
+            collectors.remove(stats)
+
+        config = current_app.config
+        elapsed = time.perf_counter() - start
+        slow = config.get('SLOW_REQUEST_SECONDS') and elapsed >= config['SLOW_REQUEST_SECONDS']
+        threshold = config.get('DATABASE_REPEATED_QUERY_THRESHOLD')
+        repeated = stats.repeated(threshold) if threshold else []
+        if not (slow or repeated):
+            return
+
+        lines = ['{} request: {} {} took {:.1f} ms'.format(
+            'Slow' if slow else 'Repeated queries in', request.method, request.path, elapsed * 1000)]
+        lines.append('{} queries in {:.1f} ms, slowest {:.1f} ms: {}'.format(
+            stats.count, stats.seconds * 1000, stats.slowest_seconds * 1000, stats.slowest_sql))
+        for sql, count in repeated:
+            lines.append('Ran {} times (possible N+1 query): {}'.format(count, sql))
+        current_app.logger.warning('\n'.join(lines))
+
+    def _connect(self, app, url):
+        if app.config.get('DATABASE_POOL'):
+            return connect_pool(
+                url,
+                max_connections=app.config['DATABASE_MAX_CONNECTIONS'],
+                stale_timeout=app.config['DATABASE_STALE_TIMEOUT'],
+                wait_timeout=app.config['DATABASE_WAIT_TIMEOUT'])
+        return db_url_connect(url)
+
+    def _load_database(self, app, config_value):
+        if app.config.get('DATABASE_POOL') and isinstance(config_value, str):
+            config_value = self._connect(app, config_value)
+        super()._load_database(app, config_value)
+
+    def close_db(self, exc):
+        super().close_db(exc)
+        if not has_app_context():
+            return
+        g.pop('_database_wrote', None)
+        g.pop('_database_user_wrote', None)
+        index = g.pop('_database_replica', None)
+        if index is not None:
+            self.router.release(index)
+            replica = self.router.databases[index]
+            if not replica.is_closed():
+                replica.close()
+
+    def _write_key(self, username):
+        return 'database-write:{}'.format(username)
+
+    def record_write(self):
+        """
+        Remember that the current request wrote to the primary, so it stops reading from replicas.
+        The current user also reads from the primary for DATABASE_READ_YOUR_WRITES_SECONDS, which
+        is shared between processes through the app cache (init_app requires a shared cache).
+        """
+        if self.router is None or not has_app_context():
+            return
+        g._database_wrote = True
+        user = g.get('user')
+        if user is not None and self.read_your_writes:
+            current_app.cache.set(self._write_key(user.username), True, timeout=self.read_your_writes)
+
+    def recently_wrote(self, username):
+        """Return True if the given user wrote within the read-your-writes window."""
+        if not self.read_your_writes:
+            return False
+        return bool(current_app.cache.get(self._write_key(username)))
+
+    def read_database(self):
+        """
+        Return the database to use for reads in the current request.
+        That is a replica, which stays the same for the whole request, unless there are no replicas,
+        there is no request, the request is not a safe method (so objects about to be changed are
+        never read stale) or the request (or recently the current user) wrote to the primary.
+        """
+        if self.router is None or not has_request_context() or g.get('_database_wrote'):
+            return self.database
+        if request.method not in ('GET', 'HEAD', 'OPTIONS'):
+            return self.database
+        user = g.get('user')
+        if user is not None:
+            # Looked up once per request, the cache may be a database of its own.
+            wrote = g.get('_database_user_wrote')
+            if wrote is None:
+                wrote = g._database_user_wrote = self.recently_wrote(user.username)
+            if wrote:
+                return self.database
+
+        index = g.get('_database_replica')
+        if index is None:
+            index = g._database_replica = self.router.acquire()
+        return self.router.databases[index]
+
+    def use_replica(self, query):
+        """Route the given read query to read_database(). Queries for other databases are left as is."""
+        if query.database is self.database:
+            query.database = self.read_database()
+        return query
+
+    def pool_stats(self):
+        """Return the connection pool metrics, or None if the database is not pooled."""
+        database = getattr(self.database, 'obj', self.database)
+        if not isinstance(database, PoolMetricsMixin):
+            return None
+        return database.stats()
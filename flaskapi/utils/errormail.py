@@ -0,0 +1,129 @@
+from collections import OrderedDict
+from email.message import EmailMessage
+from email.utils import formatdate
+import logging
+import queue
+import smtplib
+import sys
+import time
+import traceback
+
+from flaskapi.utils.background import BackgroundQueueMixin
+
+DIGEST_ENTRY_FORMAT = """
+Occurrences: {count}
+First:       {first}
+Last:        {last}
+
+{message}
+"""
+
+# Queue items that end the current window, and stop the background thread.
+_WINDOW_CLOSED = object()
+_STOP = object()
+
+
+class DigestMailHandler(BackgroundQueueMixin, logging.Handler):
+    """
+    A logging handler that mails records from a background thread, so logging an error never
+    waits for the mail server. Records go through a bounded queue (records that do not fit are
+    dropped and counted); the thread collects them for `window` seconds after the first one,
+    collapses repeats by (pathname, lineno, exception type) and sends one digest with counts.
+    """
+
+    thread_name = 'DigestMailHandler'
+
+    def __init__(self, mailhost, fromaddr, toaddrs, subject, window=60.0, queue_size=1000,
+                 timeout=10.0):
+        super().__init__()
+        self.mailhost = mailhost
+        self.fromaddr = fromaddr
+        self.toaddrs = list(toaddrs)
+        self.subject = subject
+        self.window = window
+        self.timeout = timeout
+        self.dropped = 0
+        self.sent = 0
+        self._reported_dropped = 0
+        self._init_queue(queue_size)
+
+    def emit(self, record):
+        try:
+            exc_type = record.exc_info[0].__name__ if record.exc_info else None
+            key = (record.pathname, record.lineno, exc_type)
+            item = (key, self.format(record), record.created)
+        except Exception:
+            self.handleError(record)
+            return
+        if not self._put(item):
+            self.dropped += 1
+
+    def _run(self):
+        digest = OrderedDict()
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(0, deadline - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = _WINDOW_CLOSED
+
+            if item is _WINDOW_CLOSED or item is _STOP:
+                if digest:
+                    self.send(digest)
+                digest = OrderedDict()
+                deadline = None
+                if item is _STOP:
+                    return
+                continue
+
+            key, message, created = item
+            entry = digest.get(key)
+            if entry is None:
+                digest[key] = [1, message, created, created]
+            else:
+                entry[0] += 1
+                entry[3] = created
+            if deadline is None:
+                deadline = time.monotonic() + self.window
+
+    def format_digest(self, digest, dropped=0):
+        """Return the subject and body of the digest mail."""
+        total = sum(entry[0] for entry in digest.values())
+        subject = self.subject
+        if total > 1:
+            subject = '{} ({} errors, {} distinct)'.format(subject, total, len(digest))
+
+        def timestamp(created):
+            return time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(created))
+
+        parts = [DIGEST_ENTRY_FORMAT.format(
+            count=count, first=timestamp(first), last=timestamp(last), message=message).strip()
+            for count, message, first, last in digest.values()]
+        if dropped:
+            parts.append('{} records were dropped because the mail queue was full.'.format(dropped))
+        return subject, ('\n\n' + '-' * 70 + '\n\n').join(parts) + '\n'
+
+    def send(self, digest):
+        dropped, self._reported_dropped = self.dropped - self._reported_dropped, self.dropped
+        subject, body = self.format_digest(digest, dropped)
+        message = EmailMessage()
+        message['From'] = self.fromaddr
+        message['To'] = ','.join(self.toaddrs)
+        message['Subject'] = subject
+        message['Date'] = formatdate()
+        message.set_content(body)
+        try:
+            with smtplib.SMTP(*self.mailhost, timeout=self.timeout) as smtp:
+                smtp.send_message(message)
+            self.sent += 1
+        except Exception:
+            # There is no record to pass to handleError, so report the way it does.
+            if logging.raiseExceptions and sys.stderr:
+                sys.stderr.write('--- Logging error ---\nCould not send the error digest:\n')
+                traceback.print_exc(file=sys.stderr)
+
+    def close(self):
+        """Send what was collected so far and stop the background thread."""
+        self._stop(_STOP, self.timeout)
+        super().close()
@@ -0,0 +1,56 @@
+from datetime import date
+import csv
+import io
+import zlib
+
+from flask import json
+
+
+def format_csv_value(value):
+    """Return the value as text for a CSV cell: ISO dates, lowercase booleans, empty for None."""
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, date):
+        return value.isoformat()
+    return value
+
+
+def csv_chunks(rows, keys, chunk_size=65536):
+    """Generate the given dictionaries as CSV with a header of keys, in chunks of about chunk_size."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(keys)
+    for row in rows:
+        writer.writerow([format_csv_value(row.get(key)) for key in keys])
+        if buffer.tell() >= chunk_size:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def ndjson_chunks(rows, chunk_size=65536):
+    """Generate the given dictionaries as newline delimited JSON, in chunks of about chunk_size."""
+    buffer = []
+    buffered = 0
+    for row in rows:
+        line = json.dumps(row) + '\n'
+        buffer.append(line)
+        buffered += len(line)
+        if buffered >= chunk_size:
+            yield ''.join(buffer)
+            buffer = []
+            buffered = 0
+    yield ''.join(buffer)
+
+
+def gzip_chunks(chunks, level=6):
+    """Compress the given text chunks as a gzip stream."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
@@ -0,0 +1,199 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError
+import os
+import threading
+import time
+
+from werkzeug.exceptions import ServiceUnavailable
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS
+from werkzeug.security import check_password_hash
+from werkzeug.security import generate_password_hash
+
+
+class HasherBusy(ServiceUnavailable):
+    """Raised when the password hashing queue is full."""
+
+    description = 'Too many password checks in progress. Try again later.'
+
+    def __init__(self, retry_after=None):
+        super().__init__()
+        self.retry_after = retry_after
+
+
+def normalize_hash_method(method):
+    """Return the method as it is stored in a password hash, with the default pbkdf2 iterations."""
+    if method.startswith('pbkdf2:') and method.count(':') == 1:
+        return '{}:{}'.format(method, DEFAULT_PBKDF2_ITERATIONS)
+    return method
+
+
+def get_hash_method(pwhash):
+    """Return the method a password hash was generated with."""
+    return (pwhash or '').split('$', 1)[0]
+
+
+class Hasher:
+    """
+    Runs password hashing in a dedicated thread pool, so a burst of logins or signups can only
+    use HASHER_WORKERS cores. Up to HASHER_QUEUE_SIZE more hashes can wait for a worker; beyond
+    that HasherBusy (503) is raised right away instead of tying up the request thread.
+    Without init_app, hashes are computed in the calling thread.
+    """
+
+    def __init__(self, app=None):
+        self.workers = 0
+        self.queue_size = 0
+        self.timeout = None
+        self.retry_after = 1
+        self._executor = None
+        self._init_lock = threading.Lock()
+        self._reset()
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.workers = app.config['HASHER_WORKERS']
+        self.queue_size = app.config['HASHER_QUEUE_SIZE']
+        self.timeout = app.config['HASHER_TIMEOUT']
+        self.retry_after = app.config['HASHER_RETRY_AFTER']
+        self.shutdown()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.workers + self.queue_size or 1)
+        self.in_flight = 0
+        self.running = 0
+        self.completed = 0
+        self.rejected = 0
+        self.seconds_total = 0.0
+        self.seconds_max = 0.0
+
+    def _get_executor(self):
+        # Worker threads do not survive a fork, so a child process starts its own pool.
+        if self._executor is None or self._pid != os.getpid():
+            with self._init_lock:
+                if self._executor is None or self._pid != os.getpid():
+                    self._reset()
+                    self._executor = ThreadPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    def shutdown(self):
+        """Stop the worker threads. A new pool is started on the next hash."""
+        if self._executor is not None and self._pid == os.getpid():
+            self._executor.shutdown(wait=False)
+        self._executor = None
+
+    @property
+    def enabled(self):
+        return self.workers > 0
+
+    def _run(self, func, *args):
+        with self._lock:
+            self.running += 1
+        start = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.running -= 1
+                self.completed += 1
+                self.seconds_total += elapsed
+                self.seconds_max = max(self.seconds_max, elapsed)
+
+    def _submit(self, count, func, *args, wait=False):
+        """
+        Submit func(*args), which computes count hashes, to the pool and return its future.
+        It holds one of the workers + queue_size slots until it is done or cancelled, even if
+        the caller stopped waiting for it. With wait=True, wait up to timeout for a free slot.
+        Raise HasherBusy if there is none.
+        """
+        executor = self._get_executor()
+        slots = self._slots
+        if not (slots.acquire(timeout=self.timeout) if wait else slots.acquire(blocking=False)):
+            with self._lock:
+                self.rejected += 1
+            raise HasherBusy(retry_after=self.retry_after)
+        with self._lock:
+            self.in_flight += count
+
+        def release():
+            with self._lock:
+                self.in_flight -= count
+            slots.release()
+
+        def task():
+            # Released before the result is set, so a caller that got it sees the slot free.
+            try:
+                return func(*args)
+            finally:
+                release()
+
+        try:
+            future = executor.submit(task)
+        except BaseException:
+            release()
+            raise
+        future.add_done_callback(lambda future: future.cancelled() and release())
+        return future
+
+    def submit(self, func, *args):
+        """Run func(*args) in the pool and return its result, or raise HasherBusy if it is full."""
+        if not self.enabled:
+            return func(*args)
+        future = self._submit(1, self._run, func, *args)
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            future.cancel()
+            raise HasherBusy(retry_after=self.retry_after)
+
+    def generate(self, password, method):
+        """Hash the given password with the given method."""
+        return self.submit(generate_password_hash, password, method)
+
+    def generate_many(self, passwords, method, chunk_size=16):
+        """
+        Hash the given passwords with the given method and return the hashes in order.
+        The passwords are hashed in chunks, with at most one chunk per worker waiting at a time,
+        so logins and signups still get a worker in between. Each chunk takes a slot like a
+        single hash does, waiting up to timeout for one, so HasherBusy can be raised here too.
+        """
+        passwords = list(passwords)
+        if not self.enabled:
+            return [generate_password_hash(password, method) for password in passwords]
+
+        def hash_chunk(chunk):
+            return [self._run(generate_password_hash, password, method) for password in chunk]
+
+        hashes = []
+        pending = deque()
+        for start in range(0, len(passwords), chunk_size):
+            if len(pending) >= self.workers:
+                hashes.extend(pending.popleft().result())
+            chunk = passwords[start:start + chunk_size]
+            pending.append(self._submit(len(chunk), hash_chunk, chunk, wait=True))
+        while pending:
+            hashes.extend(pending.popleft().result())
+        return hashes
+
+    def check(self, pwhash, password):
+        """Check the given password against the given hash."""
+        return self.submit(check_password_hash, pwhash, password)
+
+    def stats(self):
+        """Return the queue depth and hash latency counters as a dictionary."""
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'queue_size': self.queue_size,
+                'in_flight': self.in_flight,
+                'queued': max(self.in_flight - self.running, 0),
+                'completed': self.completed,
+                'rejected': self.rejected,
+                'seconds_total': self.seconds_total,
+                'seconds_max': self.seconds_max,
+            }
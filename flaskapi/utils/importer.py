@@ -0,0 +1,166 @@
+from concurrent.futures import ProcessPoolExecutor
+import csv
+from itertools import islice
+from itertools import repeat
+import json
+import os
+import time
+
+from peewee import IntegrityError
+from werkzeug.security import generate_password_hash
+
+FORMATS = ('csv', 'ndjson')
+
+
+def guess_format(filename):
+    """Return the import format for a filename: ndjson for .ndjson and .jsonl files, else csv."""
+    if os.path.splitext(filename or '')[1].lower() in ('.ndjson', '.jsonl'):
+        return 'ndjson'
+    return 'csv'
+
+
+def read_rows(fp, format):
+    """
+    Generate a dictionary for every row of a CSV file with a header, or every line of an NDJSON
+    file. Empty values are left out, so defaults apply. Rows that can not be parsed are
+    generated as the ValueError describing the problem, so every row keeps its number.
+    """
+    if format == 'csv':
+        for row in csv.DictReader(fp):
+            yield {key: value for key, value in row.items() if key and value not in (None, '')}
+        return
+
+    for line in fp:
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as exc:
+            yield ValueError('invalid JSON: {}'.format(exc))
+            continue
+        if not isinstance(row, dict):
+            yield ValueError('expected an object')
+            continue
+        yield {key: value for key, value in row.items() if value not in (None, '')}
+
+
+class Checkpoint:
+    """
+    Remembers how many rows of a source were processed, in a JSON file that is replaced
+    atomically, so an interrupted import can continue where it stopped.
+    """
+
+    def __init__(self, path, source):
+        self.path = path
+        self.source = source
+
+    def load(self):
+        """Return the saved counters for this source, or None."""
+        if not self.path:
+            return None
+        try:
+            with open(self.path) as fp:
+                data = json.load(fp)
+        except FileNotFoundError:
+            return None
+        if data.get('source') != self.source:
+            raise ValueError('Checkpoint {} is for {}, not {}.'.format(
+                self.path, data.get('source'), self.source))
+        return data
+
+    def save(self, **counters):
+        if not self.path:
+            return
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as fp:
+            json.dump(dict(counters, source=self.source), fp)
+        os.replace(tmp_path, self.path)
+
+    def remove(self):
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class Importer:
+    """
+    Creates objects from rows with bulk operations, one transaction per batch, hashing the
+    passwords in a process pool. The counters are saved to the checkpoint after every batch,
+    and rows processed before are skipped. Messages are passed to echo(message, err=False).
+    """
+
+    def __init__(self, operations, checkpoint, method, batch_size=1000, workers=1, echo=None):
+        self.operations = operations
+        self.checkpoint = checkpoint
+        self.method = method
+        self.batch_size = batch_size
+        self.workers = workers
+        self.echo = echo or (lambda message, err=False: None)
+
+        counters = checkpoint.load() or {}
+        self.processed = counters.get('processed', 0)
+        self.imported = counters.get('imported', 0)
+        self.skipped = counters.get('skipped', 0)
+
+    def create(self, batch, executor):
+        """
+        Validate a batch of rows and create the valid ones. Rows added concurrently since
+        validating make the insert fail, so the batch is validated once more. Return the items.
+        """
+        for attempt in range(2):
+            items = self.operations.parse([
+                {'op': 'create', 'data': row if isinstance(row, dict) else {}} for row in batch])
+            for item, row in zip(items, batch):
+                if isinstance(row, ValueError):
+                    item.errors['row'] = str(row)
+            self.operations.validate(items)
+            valid = [item for item in items if not item.errors]
+
+            passwords = [item.data.pop('password') for item in valid]
+            chunksize = max(1, len(passwords) // (self.workers * 4))
+            hashes = executor.map(generate_password_hash, passwords, repeat(self.method),
+                                  chunksize=chunksize)
+            for item, password_hash in zip(valid, hashes):
+                item.data['password_hash'] = password_hash
+            try:
+                self.operations.execute(valid)
+                return items
+            except IntegrityError:
+                if attempt:
+                    raise
+
+    def run(self, rows):
+        """Import the rows, from the first one not processed before. Remove the checkpoint."""
+        if self.processed:
+            self.echo('Resuming after row {}.'.format(self.processed))
+        rows = islice(rows, self.processed, None)
+        start = time.perf_counter()
+        done = 0
+
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            while True:
+                batch = list(islice(rows, self.batch_size))
+                if not batch:
+                    break
+
+                items = self.create(batch, executor)
+                for item in items:
+                    if item.errors:
+                        self.echo('Row {} skipped: {}'.format(
+                            self.processed + item.index + 1,
+                            '; '.join('{} {}'.format(key, message)
+                                      for key, message in sorted(item.errors.items()))), err=True)
+                invalid = sum(1 for item in items if item.errors)
+                self.processed += len(batch)
+                self.imported += len(batch) - invalid
+                self.skipped += invalid
+                done += len(batch)
+                self.checkpoint.save(processed=self.processed, imported=self.imported,
+                                     skipped=self.skipped)
+
+                elapsed = time.perf_counter() - start
+                self.echo('{} rows: {} imported, {} skipped ({:.1f} rows/s)'.format(
+                    self.processed, self.imported, self.skipped,
+                    done / elapsed if elapsed else 0.0))
+
+        self.checkpoint.remove()
+        self.echo('Done: {} imported, {} skipped.'.format(self.imported, self.skipped))
@@ -0,0 +1,168 @@
+from collections import Counter
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import ThreadPoolExecutor
+import base64
+import math
+import os
+import time
+
+AUTH_MODES = ('none', 'password', 'api-key', 'bearer')
+
+# The app driven by worker processes. Set before the pool forks, so it is never pickled.
+_app = None
+
+
+def get_auth_headers(mode, username, password, api_key):
+    """Return the request headers that authenticate a user with the given mode."""
+    if mode == 'password':
+        token = base64.b64encode('{}:{}'.format(username, password).encode('utf-8'))
+        return {'Authorization': 'Basic ' + token.decode('ascii')}
+    if mode == 'api-key':
+        return {'X-Api-Key': api_key}
+    if mode == 'bearer':
+        return {'Authorization': 'Bearer ' + api_key}
+    if mode == 'none':
+        return {}
+    raise ValueError('Unknown auth mode: {}'.format(mode))
+
+
+def scratch_config(config, directory, **overrides):
+    """
+    Return a copy of the app config for a load test app that keeps its database, logs, caches and
+    rate limit buckets in directory, sends no error mail and reads no replicas.
+    """
+    config = dict(config)
+    config.update({
+        'DATABASE': 'sqlite:///' + os.path.join(directory, 'loadtest.sqlite'),
+        'DATABASE_REPLICAS': [],
+        'LOG_FILE': os.path.join(directory, 'app.log'),
+        'ACCESS_LOG_FILE': os.path.join(directory, 'access.log'),
+        'ADMINS': [],
+        'CACHE_SQLITE_PATH': os.path.join(directory, 'cache.sqlite'),
+        'RATELIMIT_SQLITE_PATH': os.path.join(directory, 'ratelimit.sqlite'),
+        'METRICS_DIR': '',
+    })
+    config.update(overrides)
+    return config
+
+
+def percentile(values, percent):
+    """Return the given percentile of the values, using the nearest rank."""
+    values = sorted(values)
+    if not values:
+        return None
+    return values[max(0, math.ceil(percent / 100 * len(values)) - 1)]
+
+
+def run_worker(app, worker, requests, deadline, paths, headers):
+    """
+    Send requests through the WSGI app until the given number was sent or the deadline passed,
+    cycling through the paths and the headers (one set per user), offset by the worker number.
+    Return a list of (path, status, seconds), with status 0 for requests that raised.
+    """
+    client = app.test_client()
+    results = []
+    index = worker
+    while (requests is None or len(results) < requests) and (deadline is None or time.time() < deadline):
+        path = paths[index % len(paths)]
+        request_headers = headers[index % len(headers)]
+        index += 1
+        start = time.perf_counter()
+        try:
+            status = client.get(path, headers=request_headers).status_code
+        except Exception:
+            status = 0
+        results.append((path, status, time.perf_counter() - start))
+    return results
+
+
+def _run_process_worker(*args):
+    return run_worker(_app, *args)
+
+
+def run_load(app, paths, headers, requests=None, duration=None, concurrency=1, mode='threads'):
+    """
+    Drive the app with concurrent clients, as threads or forked processes, until `requests`
+    requests were sent in total or `duration` seconds passed. Return a report (see summarize).
+    """
+    global _app
+    if requests is None and duration is None:
+        raise ValueError('Either requests or duration is required.')
+
+    deadline = time.time() + duration if duration else None
+    quotas = [None] * concurrency
+    if requests is not None:
+        quotas = [requests // concurrency + (worker < requests % concurrency)
+                  for worker in range(concurrency)]
+
+    if mode == 'threads':
+        executor = ThreadPoolExecutor(max_workers=concurrency)
+        func = run_worker
+        args = (app, )
+    elif mode == 'processes':
+        _app = app
+        executor = ProcessPoolExecutor(max_workers=concurrency)
+        func = _run_process_worker
+        args = ()
+    else:
+        raise ValueError('Unknown mode: {}'.format(mode))
+
+    start = time.perf_counter()
+    with executor:
+        futures = [executor.submit(func, *(args + (worker, quota, deadline, paths, headers)))
+                   for worker, quota in enumerate(quotas)]
+        results = [result for future in futures for result in future.result()]
+    return summarize(results, time.perf_counter() - start)
+
+
+def summarize(results, elapsed):
+    """Return throughput, latency percentiles and error counts, overall and per path."""
+    def stats(items):
+        latencies = sorted(seconds for path, status, seconds in items)
+        errors = sum(1 for path, status, seconds in items if status == 0 or status >= 400)
+        return {
+            'requests': len(items),
+            'errors': errors,
+            'error_rate': errors / len(items) if items else 0.0,
+            'p50': percentile(latencies, 50),
+            'p90': percentile(latencies, 90),
+            'p99': percentile(latencies, 99),
+            'max': latencies[-1] if latencies else None,
+        }
+
+    by_path = defaultdict(list)
+    for item in results:
+        by_path[item[0]].append(item)
+
+    report = stats(results)
+    report['seconds'] = elapsed
+    report['throughput'] = len(results) / elapsed if elapsed else 0.0
+    report['statuses'] = dict(Counter(status for path, status, seconds in results))
+    report['paths'] = {path: stats(items) for path, items in sorted(by_path.items())}
+    return report
+
+
+def format_report(report):
+    """Return the report as lines of text."""
+    def ms(seconds):
+        return '-' if seconds is None else '{:.1f}ms'.format(seconds * 1000)
+
+    def line(label, stats):
+        return '{:30s} {:>8d} {:>8d} {:>7.1%} {:>9s} {:>9s} {:>9s} {:>9s}'.format(
+            label, stats['requests'], stats['errors'], stats['error_rate'],
+            ms(stats['p50']), ms(stats['p90']), ms(stats['p99']), ms(stats['max']))
+
+    lines = [
+        '{} requests in {:.2f}s: {:.1f} req/s'.format(
+            report['requests'], report['seconds'], report['throughput']),
+        'Status codes: {}'.format(', '.join(
+            '{}: {}'.format(status or 'exception', count)
+            for status, count in sorted(report['statuses'].items()))),
+        '',
+        '{:30s} {:>8s} {:>8s} {:>7s} {:>9s} {:>9s} {:>9s} {:>9s}'.format(
+            'path', 'requests', 'errors', 'rate', 'p50', 'p90', 'p99', 'max'),
+    ]
+    lines.extend(line(path, stats) for path, stats in report['paths'].items())
+    lines.append(line('total', report))
+    return lines
@@ -0,0 +1,336 @@
+from bisect import bisect_left
+import glob
+import json
+import os
+import threading
+import time
+import weakref
+
+from flask import g
+from flask import request
+
+# Upper bounds in seconds of the request latency histogram buckets.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Shard:
+    """The metrics recorded by a single thread. Only that thread writes to it, so no locks."""
+
+    __slots__ = ('requests', 'latency', 'sizes', 'in_flight')
+
+    def __init__(self):
+        self.requests = {}   # (endpoint, method, status) -> count
+        self.latency = {}    # endpoint -> [count per bucket..., count above the last, sum]
+        self.sizes = {}      # endpoint -> [count, sum]
+        self.in_flight = {}  # endpoint -> count
+
+    def snapshot(self):
+        """Return a copy that is safe to read while the owning thread keeps recording."""
+        # dict() and list() copies are atomic under the GIL.
+        return {
+            'requests': dict(self.requests),
+            'latency': {key: list(value) for key, value in dict(self.latency).items()},
+            'sizes': {key: list(value) for key, value in dict(self.sizes).items()},
+            'in_flight': dict(self.in_flight),
+        }
+
+
+def merge(target, source):
+    """Add the source snapshot to the target snapshot in place."""
+    for name in ('requests', 'in_flight'):
+        for key, value in source[name].items():
+            target[name][key] = target[name].get(key, 0) + value
+    for name in ('latency', 'sizes'):
+        for key, values in source[name].items():
+            current = target[name].get(key)
+            if current is None:
+                target[name][key] = list(values)
+            else:
+                target[name][key] = [a + b for a, b in zip(current, values)]
+    return target
+
+
+def empty_snapshot():
+    return {'requests': {}, 'latency': {}, 'sizes': {}, 'in_flight': {}}
+
+
+def dump_snapshot(snapshot):
+    """Convert a snapshot to something JSON can encode (tuple keys are not allowed)."""
+    return {name: [[key, value] for key, value in values.items()]
+            for name, values in snapshot.items()}
+
+
+def load_snapshot(data):
+    snapshot = empty_snapshot()
+    for name, items in data.items():
+        if name in snapshot:
+            snapshot[name] = {tuple(key) if isinstance(key, list) else key: value
+                              for key, value in items}
+    return snapshot
+
+
+def pid_exists(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(**labels):
+    if not labels:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(key, escape_label(value))
+                          for key, value in sorted(labels.items())) + '}'
+
+
+def format_value(value):
+    if value is None:
+        return 'NaN'
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Metrics:
+    """
+    Request instrumentation: latency histograms, status code counters, in-flight gauges and
+    response sizes per endpoint, rendered in the Prometheus text format.
+
+    Every thread records into a shard of its own, so recording takes no locks; shards are
+    only added up when the metrics are rendered. With METRICS_DIR set, every process also
+    writes its totals to a file there (at most every METRICS_FLUSH_SECONDS), and rendering
+    adds up the files of all processes, so prefork workers report as one. Like other
+    multiprocess exporters, the directory should be emptied when the server starts.
+    """
+
+    prefix = 'flaskapi'
+
+    def __init__(self, app=None):
+        self.enabled = True
+        self.directory = None
+        self.flush_seconds = 1.0
+        self.stats = []
+        self._reset()
+
+        if app is not None:
+            self.init_app(app)
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._shards = []
+        self._retired = empty_snapshot()
+        self._flushed = 0.0
+
+    def init_app(self, app):
+        self.enabled = app.config['METRICS_ENABLED']
+        self.directory = app.config['METRICS_DIR'] or None
+        self.flush_seconds = app.config['METRICS_FLUSH_SECONDS']
+        self.stats = []
+        self._reset()
+
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+        if self.enabled:
+            app.before_request(self._before_request)
+            app.after_request(self._after_request)
+            app.teardown_request(self._teardown_request)
+
+    def add_stats(self, name, func, counters=()):
+        """
+        Render the dictionary returned by func as flaskapi_<name>_<key> samples, labeled with
+        the process id. The keys in counters are counters, the others gauges. If func returns
+        None, nothing is rendered.
+        """
+        self.stats.append((name, func, frozenset(counters)))
+
+    def _get_shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None or self._pid != os.getpid():
+            if self._pid != os.getpid():
+                # Counters inherited from the parent process are already counted by the parent.
+                self._reset()
+            shard = self._local.shard = Shard()
+            with self._lock:
+                self._shards.append((weakref.ref(threading.current_thread()), shard))
+        return shard
+
+    def _before_request(self):
+        endpoint = request.endpoint or 'none'
+        in_flight = self._get_shard().in_flight
+        in_flight[endpoint] = in_flight.get(endpoint, 0) + 1
+        g._metrics = (endpoint, request.method, time.perf_counter(), [500, None])
+
+    def _after_request(self, response):
+        state = g.get('_metrics')
+        if state is not None:
+            state[3][0] = response.status_code
+            state[3][1] = response.calculate_content_length()
+        return response
+
+    def _teardown_request(self, exc):
+        state = g.pop('_metrics', None)
+        if state is None:
+            return
+        endpoint, method, start, (status, size) = state
+        self.record(endpoint, method, status, time.perf_counter() - start, size)
+
+    def record(self, endpoint, method, status, seconds, size=None):
+        """Record a finished request, and the end of its in-flight time."""
+        shard = self._get_shard()
+        shard.in_flight[endpoint] = shard.in_flight.get(endpoint, 0) - 1
+
+        key = (endpoint, method, status)
+        shard.requests[key] = shard.requests.get(key, 0) + 1
+
+        latency = shard.latency.get(endpoint)
+        if latency is None:
+            latency = shard.latency[endpoint] = [0] * (len(LATENCY_BUCKETS) + 2)
+        latency[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        latency[-1] += seconds
+
+        if size is not None:
+            sizes = shard.sizes.get(endpoint)
+            if sizes is None:
+                sizes = shard.sizes[endpoint] = [0, 0]
+            sizes[0] += 1
+            sizes[1] += size
+
+        if self.directory and time.monotonic() - self._flushed >= self.flush_seconds:
+            self.flush()
+
+    def collect(self):
+        """Return the totals of this process, adding up the shards of every thread."""
+        self._get_shard()
+        with self._lock:
+            # Shards of finished threads are folded into the retired totals.
+            alive = []
+            for ref, shard in self._shards:
+                if ref() is None or not ref().is_alive():
+                    merge(self._retired, shard.snapshot())
+                else:
+                    alive.append((ref, shard))
+            self._shards = alive
+            total = merge(empty_snapshot(), self._retired)
+        for ref, shard in alive:
+            merge(total, shard.snapshot())
+        return total
+
+    def collect_stats(self):
+        """Return the extra stats of this process as a list of (name, values, counters)."""
+        result = []
+        for name, func, counters in self.stats:
+            values = func()
+            if values is not None:
+                result.append((name, values, sorted(counters)))
+        return result
+
+    def _path(self, pid):
+        return os.path.join(self.directory, 'metrics-{}.json'.format(pid))
+
+    def flush(self):
+        """Write the totals of this process to METRICS_DIR."""
+        if not self.directory:
+            return
+        self._flushed = time.monotonic()
+        data = {
+            'pid': os.getpid(),
+            'metrics': dump_snapshot(self.collect()),
+            'stats': self.collect_stats(),
+        }
+        path = self._path(os.getpid())
+        tmp_path = '{}.{}.tmp'.format(path, threading.get_ident())
+        with open(tmp_path, 'w') as fp:
+            json.dump(data, fp)
+        os.replace(tmp_path, path)
+
+    def collect_all(self):
+        """
+        Return the totals and the extra stats of every process.
+        Counters of processes that exited are kept, their in-flight gauges and stats are not.
+        """
+        if not self.directory:
+            return self.collect(), [(os.getpid(), self.collect_stats())]
+
+        self.flush()
+        total = empty_snapshot()
+        stats = []
+        for path in sorted(glob.glob(os.path.join(self.directory, 'metrics-*.json'))):
+            try:
+                with open(path) as fp:
+                    data = json.load(fp)
+            except (OSError, ValueError):
+                continue
+            snapshot = load_snapshot(data['metrics'])
+            if not pid_exists(data['pid']):
+                snapshot['in_flight'] = {}
+            else:
+                stats.append((data['pid'], data['stats']))
+            merge(total, snapshot)
+        return total, stats
+
+    def render(self):
+        """Return every metric in the Prometheus text exposition format."""
+        snapshot, stats = self.collect_all()
+        prefix = self.prefix
+        lines = []
+
+        def header(name, kind, text):
+            lines.append('# HELP {}_{} {}'.format(prefix, name, text))
+            lines.append('# TYPE {}_{} {}'.format(prefix, name, kind))
+
+        def sample(name, value, **labels):
+            lines.append('{}_{}{} {}'.format(prefix, name, format_labels(**labels),
+                                             format_value(value)))
+
+        header('http_requests_total', 'counter', 'Requests by endpoint, method and status code.')
+        for (endpoint, method, status), count in sorted(snapshot['requests'].items()):
+            sample('http_requests_total', count, endpoint=endpoint, method=method, status=status)
+
+        header('http_request_duration_seconds', 'histogram', 'Request latency by endpoint.')
+        for endpoint, values in sorted(snapshot['latency'].items()):
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS, values):
+                cumulative += count
+                sample('http_request_duration_seconds_bucket', cumulative,
+                       endpoint=endpoint, le=format_value(bound))
+            cumulative += values[len(LATENCY_BUCKETS)]
+            sample('http_request_duration_seconds_bucket', cumulative, endpoint=endpoint, le='+Inf')
+            sample('http_request_duration_seconds_sum', values[-1], endpoint=endpoint)
+            sample('http_request_duration_seconds_count', cumulative, endpoint=endpoint)
+
+        header('http_requests_in_flight', 'gauge', 'Requests being handled by endpoint.')
+        for endpoint, count in sorted(snapshot['in_flight'].items()):
+            sample('http_requests_in_flight', count, endpoint=endpoint)
+
+        header('http_response_size_bytes', 'summary', 'Response body size by endpoint.')
+        for endpoint, (count, total) in sorted(snapshot['sizes'].items()):
+            sample('http_response_size_bytes_sum', total, endpoint=endpoint)
+            sample('http_response_size_bytes_count', count, endpoint=endpoint)
+
+        # Group the extra stats by metric name, since each name gets a single header.
+        samples = {}
+        for pid, process_stats in stats:
+            for name, values, counters in process_stats:
+                for key, value in sorted(values.items()):
+                    if not isinstance(value, (int, float)):
+                        continue
+                    metric = '{}_{}'.format(name, key)
+                    kind = 'counter' if key in counters else 'gauge'
+                    samples.setdefault((metric, kind), []).append((pid, value))
+        for (metric, kind), values in sorted(samples.items()):
+            lines.append('# TYPE {}_{} {}'.format(prefix, metric, kind))
+            for pid, value in values:
+                sample(metric, value, pid=pid)
+
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,234 @@
+from collections import OrderedDict
+import hashlib
+import hmac
+import ipaddress
+import math
+import threading
+import time
+
+from flask import g
+from flask import request
+from werkzeug.exceptions import TooManyRequests
+
+from flaskapi.utils.sqlite import LocalConnection
+
+
+class RateLimitExceeded(TooManyRequests):
+    """Raised when a rate limit bucket is empty. Carries the X-RateLimit-* headers."""
+
+    def __init__(self, headers, retry_after):
+        super().__init__()
+        self.headers = headers
+        self.retry_after = retry_after
+
+
+class RateLimit:
+    """
+    A token bucket of `limit` requests, refilled at `limit` per `period` seconds.
+    The bucket is picked by `by`:
+    - 'user': the logged in user, or the client IP address for anonymous requests
+    - 'api_key': the API key of the logged in user, or the client IP address
+    - 'ip': the client IP address
+    API keys are stored as an HMAC with the given secret, so storage never holds the key itself.
+    """
+
+    scopes = ('user', 'api_key', 'ip')
+
+    def __init__(self, limit, period=60, by='user'):
+        if by not in self.scopes:
+            raise ValueError('Unknown rate limit scope: {}'.format(by))
+        self.limit = limit
+        self.period = period
+        self.rate = limit / period
+        self.by = by
+
+    def get_identity(self, address, user=None, secret=b''):
+        """Return the identity of the given client address and user for this limit."""
+        if user is not None and self.by == 'user':
+            return 'user:{}'.format(user.id)
+        if user is not None and self.by == 'api_key':
+            digest = hmac.new(secret, (user.api_key or '').encode('utf-8'), hashlib.sha256)
+            return 'key:{}'.format(digest.hexdigest())
+        return 'ip:{}'.format(address)
+
+
+def parse_networks(values):
+    """Parse addresses and networks (like 10.0.0.0/8) to a list of ip_network."""
+    return [ipaddress.ip_network(value.strip(), strict=False) for value in values if value.strip()]
+
+
+def get_client_address(remote_addr, forwarded_for, trusted):
+    """
+    Return the address of the client. When the request comes from one of the trusted proxy
+    networks, the X-Forwarded-For header is followed from the right, past every trusted proxy,
+    to the first address that is not one. Addresses set by the client itself are never used.
+    """
+    def is_trusted(value):
+        try:
+            address = ipaddress.ip_address(value)
+        except ValueError:
+            return False
+        return any(address in network for network in trusted)
+
+    if not trusted or not is_trusted(remote_addr):
+        return remote_addr
+    address = remote_addr
+    for value in reversed([value.strip() for value in (forwarded_for or '').split(',')]):
+        if not value:
+            break
+        address = value
+        if not is_trusted(value):
+            break
+    return address
+
+
+def refill(tokens, updated, now, capacity, rate):
+    """Return the tokens in a bucket at time now, given its tokens at time updated."""
+    return min(capacity, tokens + max(now - updated, 0) * rate)
+
+
+class MemoryStorage:
+    """
+    Token buckets in a dictionary, local to the process. Beyond max_entries the least recently
+    used bucket is dropped, which has usually refilled already.
+    """
+
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def consume(self, key, capacity, rate, now=None):
+        """Take a token from the bucket. Return (allowed, tokens left)."""
+        if now is None:
+            now = time.time()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                tokens = capacity
+            else:
+                tokens = refill(bucket[0], bucket[1], now, capacity, rate)
+                self._buckets.move_to_end(key)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_entries:
+                self._buckets.popitem(last=False)
+        return allowed, tokens
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class SQLiteStorage:
+    """
+    Token buckets in a SQLite database file, shared by every worker process on the host.
+    Put the file on a memory backed filesystem (like /dev/shm) to keep it off the disk.
+    """
+
+    schema = (
+        'CREATE TABLE IF NOT EXISTS ratelimit ('
+        'key TEXT PRIMARY KEY, tokens REAL, updated REAL, full_at REAL)'
+    )
+
+    def __init__(self, path, prune_interval=1000, timeout=5):
+        self.path = path
+        self.prune_interval = prune_interval
+        self.timeout = timeout
+        self._connection = LocalConnection(
+            path, timeout, pragmas=('journal_mode=WAL', 'synchronous=OFF'))
+        self._writes = 0
+
+        with self._connection.get() as conn:
+            conn.execute(self.schema)
+            conn.execute('CREATE INDEX IF NOT EXISTS ratelimit_full_at ON ratelimit (full_at)')
+
+    def consume(self, key, capacity, rate, now=None):
+        """Take a token from the bucket. Return (allowed, tokens left)."""
+        if now is None:
+            now = time.time()
+        conn = self._connection.get()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute(
+                'SELECT tokens, updated FROM ratelimit WHERE key = ?', (key, )).fetchone()
+            tokens = capacity if row is None else refill(row[0], row[1], now, capacity, rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            conn.execute(
+                'INSERT OR REPLACE INTO ratelimit (key, tokens, updated, full_at) VALUES (?, ?, ?, ?)',
+                (key, tokens, now, now + (capacity - tokens) / rate))
+
+            self._writes += 1
+            if self._writes % self.prune_interval == 0:
+                conn.execute('DELETE FROM ratelimit WHERE full_at <= ?', (now, ))
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+        return allowed, tokens
+
+    def clear(self):
+        self._connection.get().execute('DELETE FROM ratelimit')
+
+    def __len__(self):
+        conn = self._connection.get()
+        return conn.execute('SELECT COUNT(*) FROM ratelimit').fetchone()[0]
+
+
+class RateLimiter:
+    """
+    Checks RateLimit buckets for views. Storage is picked with RATELIMIT_STORAGE:
+    'memory' (per process) or 'sqlite' (shared by the processes on a host, at RATELIMIT_SQLITE_PATH).
+    Limits are only checked when RATELIMIT_ENABLED is set.
+
+    Behind a reverse proxy every request comes from the proxy's address. List the proxies in
+    TRUSTED_PROXIES to take the client address from their X-Forwarded-For header instead.
+    """
+
+    def __init__(self, app=None):
+        self.enabled = True
+        self.storage = MemoryStorage()
+        self.trusted_proxies = []
+        self.secret = b''
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config['RATELIMIT_ENABLED']
+        self.trusted_proxies = parse_networks(app.config['TRUSTED_PROXIES'])
+        self.secret = str(app.config['SECRET_KEY']).encode('utf-8')
+        storage = app.config['RATELIMIT_STORAGE']
+        if storage == 'memory':
+            self.storage = MemoryStorage(max_entries=app.config['RATELIMIT_MAX_ENTRIES'])
+        elif storage == 'sqlite':
+            self.storage = SQLiteStorage(app.config['RATELIMIT_SQLITE_PATH'])
+        else:
+            raise ValueError('Unknown RATELIMIT_STORAGE: {}'.format(storage))
+
+    def hit(self, rate_limit, scope=None):
+        """
+        Take a token for the current request and return the X-RateLimit-* headers.
+        Raise RateLimitExceeded if the bucket is empty. The scope (like the endpoint name) keeps
+        buckets of different views apart.
+        """
+        address = get_client_address(request.remote_addr, request.headers.get('X-Forwarded-For'),
+                                     self.trusted_proxies)
+        identity = rate_limit.get_identity(address, g.get('user'), self.secret)
+        key = '{}|{}'.format(scope or request.endpoint, identity)
+        allowed, tokens = self.storage.consume(key, rate_limit.limit, rate_limit.rate)
+        headers = {
+            'X-RateLimit-Limit': str(rate_limit.limit),
+            'X-RateLimit-Remaining': str(int(tokens)),
+            'X-RateLimit-Reset': str(math.ceil((rate_limit.limit - tokens) / rate_limit.rate)),
+        }
+        if not allowed:
+            raise RateLimitExceeded(headers, math.ceil((1 - tokens) / rate_limit.rate))
+        return headers
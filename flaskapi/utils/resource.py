@@ -1,14 +1,81 @@
+from collections import defaultdict
+from copy import copy
+from itertools import islice
+import base64
+import binascii
+import hashlib
+import json
+
+from playhouse.fields import ManyToManyField
 from playhouse.flask_utils import get_object_or_404
+from werkzeug.exceptions import BadRequest
+
+from flaskapi.ext import db
+from flaskapi.utils.database import iterate
+
+
+def to_dict_many(model, objs, private=False, keys=None):
+    """
+    Convert instances of the model to dictionaries with the model's to_dict_many if it has one
+    (which may compute values for the whole batch at once), otherwise one at a time.
+    """
+    batch = getattr(model, 'to_dict_many', None)
+    if batch is not None:
+        return batch(objs, private=private, keys=keys)
+    if keys is None:
+        return [obj.to_dict(private=private) for obj in objs]
+    return [{key: getattr(obj, key) for key in keys} for obj in objs]
 
 
 class Resource:
     """A resource is an object that can be exposed via a REST API."""
 
     model = None
+    page_size = 50
+    max_page_size = 1000
+
+    # Names of related collections (reverse foreign keys or many to many fields) to include
+    # in each serialized object. They are loaded for a batch of objects at a time, with one
+    # query per relation.
+    prefetch = ()
+
+    # Number of model instances serialized together by serialize_objects.
+    batch_size = 500
+
+    # Names of the fields to serialize, set by only(). None serializes all of them.
+    fields = None
 
     def __init__(self, private=False):
         self.private = private
 
+    def get_field_names(self):
+        """Return the names of every serialized field, or None if the model does not list them."""
+        serialize_keys = getattr(self.model, 'serialize_keys', None)
+        if serialize_keys is None:
+            return None
+        return tuple(serialize_keys(private=self.private)) + tuple(self.prefetch)
+
+    def only(self, fields):
+        """
+        Return a copy of this resource that serializes only the given fields, a comma separated
+        string like ?fields=username,email (the id is always included), or this resource if no
+        fields are given. Only the columns of those fields are selected, and only the requested
+        prefetch relations are loaded.
+        Raise BadRequest for fields that are not serialized at this privacy level.
+        """
+        if not fields:
+            return self
+        names = [name.strip() for name in fields.split(',') if name.strip()]
+        allowed = self.get_field_names()
+        invalid = [name for name in names if allowed is None or name not in allowed]
+        if invalid or not names:
+            raise BadRequest('Invalid fields: {}.'.format(', '.join(invalid) or fields))
+
+        resource = copy(self)
+        resource.fields = tuple(name for name in allowed if name == 'id' or name in names)
+        resource.prefetch = tuple(name for name in self.prefetch if name in names)
+        return resource
+
     def create(self, **kwargs):
         """
         Create an instance of the model and return it.
@@ -20,26 +87,260 @@ class Resource:
         return self.model(**kwargs)
 
     def all(self):
-        """Return an iterable representing all the available objects."""
+        """
+        Return an iterable representing all the available objects.
+        The query reads from a replica when replicas are configured, and selects only the
+        columns of the requested fields when only() was used.
+        """
         if not self.model:
             msg = '{} must define a model class.'.format(self.__class__.__name__)
             raise NotImplementedError(msg)
-        return self.model.select()
+        query = self.model.select()
+        if self.fields is not None:
+            columns = self.get_columns()
+            if columns is not None:
+                # get_object_version needs date_updated, even if it is not serialized.
+                date_updated = self.model._meta.fields.get('date_updated')
+                if date_updated is not None and 'date_updated' not in self.fields:
+                    columns += (date_updated, )
+                query = query.select(*columns)
+        return db.use_replica(query)
 
     def get(self, pk):
         """Find an object with the given primary key or raise NotFound."""
         return get_object_or_404(self.all(), self.model.id == pk)
 
+    def paginate(self, cursor=None, limit=None, query=None):
+        """
+        Return a query for a page of objects ordered by primary key and the cursor for the next page.
+        The page is selected with WHERE id > :cursor ORDER BY id LIMIT n, so it stays stable while
+        rows are inserted concurrently. The next cursor is None on the last page.
+        """
+        page, next_cursor, rows = self.find_page(cursor, limit, query)
+        return page, next_cursor
+
+    def paginate_with_version(self, cursor=None, limit=None, query=None):
+        """
+        Like paginate, and also return the ETag of the page as get_version(page, next_cursor)
+        would. The update timestamps are read by the query that finds the page, so answering
+        with 304 takes one query.
+        """
+        date_updated = self.model._meta.fields.get('date_updated')
+        if date_updated is None:
+            page, next_cursor = self.paginate(cursor, limit, query)
+            return page, next_cursor, None
+        page, next_cursor, rows = self.find_page(cursor, limit, query, date_updated)
+        etag, last_modified = self.make_version(rows, next_cursor)
+        return page, next_cursor, etag
+
+    def find_page(self, cursor, limit, query, *columns):
+        """Return the page query, the next cursor and the (id, *columns) rows on the page."""
+        if query is None:
+            query = self.all()
+        limit = self.get_limit(limit)
+        after = self.decode_cursor(cursor)
+        if after is not None:
+            query = query.where(self.model.id > after)
+        query = query.order_by(self.model.id)
+
+        # Find the ids on this page with a narrow query, fetching one extra row to find out
+        # whether there is a next page. The page itself is bounded by id, so it can be
+        # serialized with a projected query and does not shift if rows are deleted meanwhile.
+        rows = list(query.select(self.model.id, *columns).limit(limit + 1).tuples())
+        if not rows:
+            return query.where(self.model.id << []), None, rows
+        next_cursor = self.encode_cursor(rows[limit - 1][0]) if len(rows) > limit else None
+        rows = rows[:limit]
+        return query.where(self.model.id <= rows[-1][0]), next_cursor, rows
+
+    def get_limit(self, value):
+        """Convert the requested page size to an int between 1 and max_page_size."""
+        if value is None or value == '':
+            return self.page_size
+        try:
+            value = int(value)
+        except (TypeError, ValueError):
+            raise BadRequest('Invalid limit.')
+        return max(1, min(value, self.max_page_size))
+
+    def encode_cursor(self, pk):
+        """Encode the given primary key as an opaque cursor."""
+        data = json.dumps({'id': pk}).encode('utf-8')
+        return base64.urlsafe_b64encode(data).decode('ascii').rstrip('=')
+
+    def decode_cursor(self, cursor):
+        """Decode an opaque cursor to a primary key, or raise BadRequest."""
+        if not cursor:
+            return None
+        try:
+            data = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+            pk = json.loads(data.decode('utf-8'))['id']
+        except (binascii.Error, ValueError, TypeError, KeyError):
+            raise BadRequest('Invalid cursor.')
+        if not isinstance(pk, int):
+            raise BadRequest('Invalid cursor.')
+        return pk
+
+    def get_version(self, query, *extra):
+        """
+        Return an ETag for the objects in the given query, or None if the model has no
+        date_updated field. It is computed from ids and update timestamps with a narrow query,
+        so a request can be answered with 304 before anything is serialized.
+        Any extra values (like the next page cursor) are included in the ETag.
+        There is no last modified date for a collection: removing a row does not change the
+        newest date_updated, so If-Modified-Since could not notice it.
+        """
+        date_updated = self.model._meta.fields.get('date_updated')
+        if date_updated is None:
+            return None
+        rows = query.select(self.model.id, date_updated).order_by(self.model.id).tuples()
+        etag, last_modified = self.make_version(rows, *extra)
+        return etag
+
+    def get_object_version(self, obj, *extra):
+        """Return an ETag and last modified date for the given object."""
+        if 'date_updated' not in self.model._meta.fields:
+            return None, None
+        return self.make_version([(obj.id, obj.date_updated)], *extra)
+
+    def make_version(self, rows, *extra):
+        """Return an ETag and last modified date for (id, date_updated) pairs."""
+        key = (self.model._meta.db_table, self.private, extra)
+        if self.fields is not None:
+            key += (self.fields, )
+        digest = hashlib.sha1(repr(key).encode('utf-8'))
+        last_modified = None
+        for pk, date_updated in rows:
+            digest.update('{}:{};'.format(pk, date_updated).encode('utf-8'))
+            if last_modified is None or date_updated > last_modified:
+                last_modified = date_updated
+        return digest.hexdigest(), last_modified
+
     def serialize_many(self, data):
         """Serialize the given data as an iterable of objects."""
-        return tuple(self.serialize(obj) for obj in data)
+        return tuple(self.serialize_iter(data))
+
+    def serialize_iter(self, data, server_side=False):
+        """
+        Serialize the given data lazily, one object at a time.
+        Queries are iterated without caching rows, so memory use stays flat for large tables.
+        With server_side=True, rows come from a server-side cursor where the database supports it.
+        """
+        items = self.serialize_items(data, server_side=server_side)
+        if not self.prefetch:
+            for pk, item in items:
+                yield item
+            return
+
+        while True:
+            batch = list(islice(items, self.batch_size))
+            if not batch:
+                return
+            self.attach_related(batch)
+            for pk, item in batch:
+                yield item
+
+    def serialize_items(self, data, server_side=False):
+        """Serialize the given data without related collections, as (primary key, dict) pairs."""
+        columns = self.get_columns() if hasattr(data, 'tuples') else None
+        if columns is not None:
+            yield from self.serialize_rows(data, columns, server_side=server_side)
+            return
+
+        if hasattr(data, 'iterator'):
+            data = iterate(data, server_side=server_side)
+        data = iter(data)
+        while True:
+            objs = list(islice(data, self.batch_size))
+            if not objs:
+                return
+            for obj, item in zip(objs, self.serialize_objects(objs)):
+                yield obj.id, item
+
+    def get_columns(self):
+        """
+        Return the columns needed to serialize rows without building model instances.
+        Returns None when full instances are needed: the model does not support it, or this
+        resource overrides get_items.
+        """
+        serialize_columns = getattr(self.model, 'serialize_columns', None)
+        if serialize_columns is None or type(self).get_items is not Resource.get_items:
+            return None
+        columns = serialize_columns(private=self.private)
+        if columns is not None and self.fields is not None:
+            columns = tuple(column for column in columns if column.name in self.fields)
+        return columns
+
+    def serialize_rows(self, query, columns, server_side=False):
+        """Serialize a query by selecting only the given columns (starting with id) as tuples."""
+        names = tuple(column.name for column in columns)
+        for row in iterate(query.select(*columns).tuples(), server_side=server_side):
+            yield row[0], dict(zip(names, row))
 
     def serialize(self, obj):
         """Serialize the given object to a dictionary representation."""
-        data = obj.to_dict(private=self.private)
-        data.update(self.get_items(obj))
+        data = self.serialize_object(obj)
+        if self.prefetch:
+            self.attach_related([(obj.id, data)])
+        return data
+
+    def serialize_object(self, obj):
+        """Serialize the given object without related collections."""
+        return self.serialize_objects([obj])[0]
+
+    def serialize_objects(self, objs):
+        """
+        Serialize a batch of objects without related collections and return a list of dicts.
+        This is the hook for computing values for many objects at once; by default it uses the
+        model's to_dict_many.
+        """
+        keys = None
+        if self.fields is not None:
+            keys = tuple(name for name in self.fields if name not in self.prefetch)
+        data = to_dict_many(self.model, objs, private=self.private, keys=keys)
+        for obj, item in zip(objs, data):
+            item.update(self.get_items(obj))
         return data
 
     def get_items(self, obj):
         """Get any sub-items related to the main obj. Will be used to update the returned dict."""
         return {}
+
+    def attach_related(self, items):
+        """Add every prefetch relation to the given (primary key, dict) pairs, in place."""
+        ids = [pk for pk, data in items]
+        for name in self.prefetch:
+            related = self.get_related(name, ids)
+            for pk, data in items:
+                data[name] = related.get(pk, [])
+
+    def get_related(self, name, ids):
+        """
+        Load the named relation for all the given primary keys with a single IN (...) query.
+        Return a dictionary of primary key to a list of serialized related objects.
+        """
+        field = getattr(self.model, name, None)
+        reverse = self.model._meta.reverse_rel.get(name)
+
+        # Each related object gets the primary key it belongs to as prefetch_key.
+        if reverse is not None:
+            rel_model = reverse.model_class
+            query = rel_model.select(rel_model, reverse.alias('prefetch_key')).where(reverse << ids)
+        elif isinstance(field, ManyToManyField):
+            rel_model = field.rel_model
+            through = field.get_through_model()
+            src_fk = through._meta.rel_for_model(self.model)
+            dest_fk = through._meta.rel_for_model(rel_model)
+            query = (rel_model
+                     .select(rel_model, src_fk.alias('prefetch_key'))
+                     .join(through, on=(dest_fk == rel_model.id))
+                     .where(src_fk << ids))
+        else:
+            msg = '{} can not prefetch {}.'.format(self.__class__.__name__, name)
+            raise ValueError(msg)
+
+        objs = list(db.use_replica(query).naive())
+        related = defaultdict(list)
+        for obj, data in zip(objs, to_dict_many(rel_model, objs, private=self.private)):
+            related[obj.prefetch_key].append(data)
+        return related
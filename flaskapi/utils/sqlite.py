@@ -0,0 +1,32 @@
+import os
+import sqlite3
+import threading
+
+
+class LocalConnection:
+    """
+    A SQLite connection per thread, in autocommit mode so callers manage transactions with
+    BEGIN IMMEDIATE. A forked process opens its own, since a connection can not be shared
+    across a fork. The pragmas are run on every new connection.
+    """
+
+    def __init__(self, path, timeout=5, pragmas=()):
+        self.path = path
+        self.timeout = timeout
+        self.pragmas = pragmas
+        self._local = threading.local()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def get(self):
+        """Return the connection of the current thread, reconnecting after a fork."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            for pragma in self.pragmas:
+                conn.execute('PRAGMA ' + pragma)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
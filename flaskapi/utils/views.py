@@ -1,11 +1,55 @@
+from functools import wraps
+
+from flask import after_this_request
 from flask import request
 from flask import jsonify
+from flask import json
+from flask import stream_with_context
+from flask import Response
 from flask.views import MethodView
+from werkzeug.http import http_date
+from werkzeug.http import is_resource_modified
+from werkzeug.http import quote_etag
+
+from flaskapi.ext import limiter
+from flaskapi.utils.export import gzip_chunks
+
+
+def check_rate_limit(rate_limit):
+    """Take a token from the rate limit or raise RateLimitExceeded (429)."""
+    headers = limiter.hit(rate_limit)
+
+    @after_this_request
+    def add_headers(response):
+        # Replace the headers of a limit checked earlier in the same request.
+        for key, value in headers.items():
+            response.headers[key] = value
+        return response
+
+
+def rate_limited(rate_limit):
+    """
+    Return a view decorator that checks the rate limit before the view runs. Listed last in
+    View.decorators it also runs before the other decorators, like authentication, so requests
+    over the limit are rejected before any password is verified. The user is not known yet
+    there, so the limit should be by='ip'.
+    """
+    def decorator(func):
+        @wraps(func)
+        def decorated(*args, **kwargs):
+            if limiter.enabled:
+                check_rate_limit(rate_limit)
+            return func(*args, **kwargs)
+        return decorated
+    return decorator
 
 
 class View(MethodView):
     """Subclass of Flask MethodView with a couple helper methods."""
 
+    # A RateLimit applied to every method of the view, checked by dispatch().
+    rate_limit = None
+
     @classmethod
     def register(cls, blueprint, route, name):
         """
@@ -18,8 +62,16 @@ class View(MethodView):
         blueprint.add_url_rule(route, view_func=cls.as_view(name))
 
     def dispatch(self):
-        """Hook for a custom action before the normal method is called."""
-        pass
+        """
+        Hook for a custom action before the normal method is called.
+        Checks the rate limit by default, so overrides should call super().
+        """
+        if self.rate_limit is not None and limiter.enabled:
+            self.check_rate_limit(self.rate_limit)
+
+    def check_rate_limit(self, rate_limit):
+        """Take a token from the rate limit or raise RateLimitExceeded (429)."""
+        check_rate_limit(rate_limit)
 
     def dispatch_request(self, *args, **kwargs):
         """Subclass to call the custom dispatch() method."""
@@ -43,13 +95,71 @@ class View(MethodView):
         """Return the given data as JSON with the given status code."""
         return jsonify(data), code
 
-    def object(self, data):
+    def not_modified(self, etag=None, last_modified=None):
+        """
+        Return a 304 Not Modified response if the request's If-None-Match or If-Modified-Since
+        header matches the given ETag or last modified date, otherwise None.
+        """
+        if not (etag or last_modified):
+            return None
+        if is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+            return None
+        return Response(status=304, headers=self.validator_headers(etag, last_modified))
+
+    def validator_headers(self, etag=None, last_modified=None):
+        """Return the ETag and Last-Modified headers for the given values."""
+        headers = {}
+        if etag:
+            headers['ETag'] = quote_etag(etag)
+        if last_modified:
+            headers['Last-Modified'] = http_date(last_modified)
+        return headers
+
+    def object(self, data, etag=None, last_modified=None):
         """Return the given data as JSON with a key of 'object'."""
-        return jsonify(dict(object=data)), 200
+        return jsonify(dict(object=data)), 200, self.validator_headers(etag, last_modified)
+
+    def objects(self, data, stream=False, etag=None, last_modified=None, **extra):
+        """
+        Return the given data as JSON with a key of 'objects', along with any extra keys.
+        With stream=True the data can be any iterable, which is consumed lazily and sent
+        to the client in chunks as it is encoded.
+        """
+        headers = self.validator_headers(etag, last_modified)
+        if stream:
+            generator = stream_with_context(self.stream_json(data, **extra))
+            return Response(generator, mimetype='application/json'), 200, headers
+        return jsonify(dict(objects=data, **extra)), 200, headers
+
+    def download(self, chunks, mimetype, filename):
+        """Stream the given text chunks as a file attachment, gzipped when the client accepts it."""
+        headers = {
+            'Content-Disposition': 'attachment; filename="{}"'.format(filename),
+            'Vary': 'Accept-Encoding',
+        }
+        if request.accept_encodings['gzip']:
+            chunks = gzip_chunks(chunks)
+            headers['Content-Encoding'] = 'gzip'
+        return Response(stream_with_context(chunks), mimetype=mimetype, headers=headers)
 
-    def objects(self, data):
-        """Return the given data as JSON with a key of 'objects'."""
-        return jsonify(dict(objects=data)), 200
+    def stream_json(self, data, chunk_size=8192, **extra):
+        """Generate the JSON for an {"objects": [...]} envelope incrementally."""
+        yield '{"objects": ['
+        buffer = []
+        buffered = 0
+        for index, obj in enumerate(data):
+            item = json.dumps(obj)
+            buffer.append(',' + item if index else item)
+            buffered += len(item)
+            if buffered >= chunk_size:
+                yield ''.join(buffer)
+                buffer = []
+                buffered = 0
+        buffer.append(']')
+        for key, value in extra.items():
+            buffer.append(', {}: {}'.format(json.dumps(key), json.dumps(value)))
+        buffer.append('}')
+        yield ''.join(buffer)
 
     def errors(self, data):
         """Return the given data as JSON with a key of 'errors'."""
@@ -1,10 +1,17 @@
 from flask import Blueprint
-from peewee_validates import Field
-from peewee_validates import ModelValidator
-from peewee_validates import validate_email
+from flask import current_app
+from flask import Response
+from flask import request
+from werkzeug.exceptions import BadRequest
 
 from flaskapi.ext import auth
+from flaskapi.ext import metrics
+from flaskapi.models import User
+from flaskapi.operations import UserBulkOperations
+from flaskapi.operations import UserValidator
 from flaskapi.resources import UserResource
+from flaskapi.utils.export import csv_chunks
+from flaskapi.utils.export import ndjson_chunks
 from flaskapi.utils.views import View
 
 api = Blueprint('admin', __name__)
@@ -12,25 +19,21 @@ api = Blueprint('admin', __name__)
 user_resource = UserResource(private=True)
 
 
-class UserValidator(ModelValidator):
-    password = Field(str, min_length=6)
-
-    class Meta:
-        exclude = ('password_hash', )
-
-    def __init__(self, *args, **kwargs):
-        """Overwrite to add email validator."""
-        super().__init__(*args, **kwargs)
-        self._meta.fields['email'].validators.append(validate_email())
-
-
 class AdminView(View):
     decorators = [auth.admin_required, auth.login_required]
 
 
 class UsersView(AdminView):
     def get(self):
-        return self.objects(user_resource.serialize_many(user_resource.all()))
+        cursor = request.args.get('cursor')
+        limit = request.args.get('limit')
+        resource = user_resource.only(request.args.get('fields'))
+        page, next_cursor, etag = resource.paginate_with_version(cursor=cursor, limit=limit)
+        rv = self.not_modified(etag)
+        if rv:
+            return rv
+        data = resource.serialize_many(page)
+        return self.objects(data, next_cursor=next_cursor, etag=etag)
 
     def post(self):
         obj = user_resource.create()
@@ -41,9 +44,47 @@ class UsersView(AdminView):
         return self.object(user_resource.serialize(obj))
 
 
+class BulkUsersView(AdminView):
+    def post(self):
+        operations = UserBulkOperations(current_app.config['BULK_MAX_OPERATIONS'])
+        items = operations.run(request.get_json(silent=True))
+        errors = [dict(index=item.index, errors=item.errors) for item in items if item.errors]
+        if errors:
+            return self.errors(errors)
+        data = [dict(index=item.index, op=item.op, object=user_resource.serialize(item.obj))
+                for item in items]
+        return self.objects(data)
+
+
+class UsersExportView(AdminView):
+    formats = {
+        'csv': 'text/csv',
+        'ndjson': 'application/x-ndjson',
+    }
+
+    def get(self):
+        export_format = request.args.get('format', 'csv')
+        if export_format not in self.formats:
+            raise BadRequest('format must be one of: {}'.format(', '.join(sorted(self.formats))))
+        resource = user_resource.only(request.args.get('fields'))
+        query = resource.all().order_by(User.id)
+        rows = resource.serialize_iter(query, server_side=True)
+        if export_format == 'csv':
+            chunks = csv_chunks(rows, resource.fields or User.serialize_keys(private=True))
+        else:
+            chunks = ndjson_chunks(rows)
+        return self.download(chunks, self.formats[export_format], 'users.' + export_format)
+
+
 class UserView(AdminView):
     def get(self, pk):
-        return self.object(user_resource.serialize(user_resource.get(pk)))
+        resource = user_resource.only(request.args.get('fields'))
+        obj = resource.get(pk)
+        etag, last_modified = resource.get_object_version(obj)
+        rv = self.not_modified(etag, last_modified)
+        if rv:
+            return rv
+        return self.object(resource.serialize(obj), etag=etag, last_modified=last_modified)
 
     def post(self, pk):
         obj = user_resource.get(pk)
@@ -59,5 +100,13 @@ class UserView(AdminView):
         return self.object(user_resource.serialize(obj))
 
 
+class MetricsView(AdminView):
+    def get(self):
+        return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
 UsersView.register(api, '/users', 'users')
+BulkUsersView.register(api, '/users/bulk', 'users_bulk')
+UsersExportView.register(api, '/users/export', 'users_export')
 UserView.register(api, '/users/<pk>', 'user')
+MetricsView.register(api, '/metrics', 'metrics')
@@ -1,17 +1,22 @@
 from flask import Blueprint
 from flask import g
+from flask import request
 from peewee_validates import Field
 from peewee_validates import ModelValidator
 from peewee_validates import validate_email
 from peewee_validates import ValidationError
 
 from flaskapi.ext import auth
+from flaskapi.resources import EntryResource
 from flaskapi.resources import UserResource
+from flaskapi.utils.ratelimit import RateLimit
 from flaskapi.utils.views import View
+from flaskapi.utils.views import rate_limited
 
 api = Blueprint('api', __name__)
 
 user_resource = UserResource(private=False)
+entry_resource = EntryResource(private=False)
 
 
 class UserValidator(ModelValidator):
@@ -48,6 +53,8 @@ class ProfileValidator(ModelValidator):
 
 
 class UsersView(View):
+    rate_limit = RateLimit(10, 60, by='ip')
+
     def post(self):
         obj = user_resource.create()
         validator = UserValidator(obj)
@@ -58,10 +65,18 @@ class UsersView(View):
 
 
 class ProfileView(View):
-    decorators = (auth.login_required, )
+    # The limit by address runs before authentication, so a burst of password guesses is
+    # rejected without verifying each password. The limit by user runs after it.
+    decorators = (auth.login_required, rate_limited(RateLimit(60, 60, by='ip')))
+    rate_limit = RateLimit(60, 60, by='user')
 
     def get(self):
-        return self.object(user_resource.serialize(g.user))
+        resource = user_resource.only(request.args.get('fields'))
+        etag, last_modified = resource.get_object_version(g.user)
+        rv = self.not_modified(etag, last_modified)
+        if rv:
+            return rv
+        return self.object(resource.serialize(g.user), etag=etag, last_modified=last_modified)
 
     def post(self):
         obj = g.user
@@ -80,5 +95,24 @@ class ProfileView(View):
         return self.object(user_resource.serialize(obj))
 
 
+class EntriesView(View):
+    def get(self):
+        cursor = request.args.get('cursor')
+        limit = request.args.get('limit')
+        resource = entry_resource.only(request.args.get('fields'))
+        page, next_cursor = resource.paginate(cursor=cursor, limit=limit)
+        # Entries carry their comments, so pages can be large: encode them as they are read.
+        data = resource.serialize_iter(page)
+        return self.objects(data, stream=True, next_cursor=next_cursor)
+
+
+class EntryView(View):
+    def get(self, pk):
+        resource = entry_resource.only(request.args.get('fields'))
+        return self.object(resource.serialize(resource.get(pk)))
+
+
 UsersView.register(api, '/users', 'users')
 ProfileView.register(api, '/profile', 'profile')
+EntriesView.register(api, '/entries', 'entries')
+EntryView.register(api, '/entries/<pk>', 'entry')
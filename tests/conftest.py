@@ -1,3 +1,4 @@
+from contextlib import contextmanager
 import base64
 import json
 
@@ -8,6 +9,7 @@ from werkzeug import cached_property
 import pytest
 
 from flaskapi import create_app
+from flaskapi.ext import db
 
 
 class TestResponse(Response):
@@ -59,6 +61,8 @@ def app(tmpdir):
         'TESTING': True,
         'DATABASE': 'sqlite:///' + sqlite_file,
         'PASSWORD_HASH_METHOD': 'plain',
+        'LOG_FILE': str(tmpdir.join('app.log')),
+        'ACCESS_LOG_FILE': str(tmpdir.join('access.log')),
     }
     app = create_app(config)
     app.test_client_class = TestClient
@@ -74,3 +78,20 @@ def app(tmpdir):
 def client(app):
     with app.test_client() as client:
         yield client
+
+
+@pytest.fixture(scope='function')
+def max_queries():
+    """
+    Return a context manager that fails the test if the block runs more than the given number
+    of queries. Usage: with max_queries(2): client.get(...)
+    """
+    @contextmanager
+    def check(limit):
+        with db.count_queries(record=True) as stats:
+            yield stats
+        msg = '{} queries, expected at most {}:\n{}'.format(
+            stats.count, limit, '\n'.join(stats.queries))
+        assert stats.count <= limit, msg
+
+    return check
@@ -0,0 +1,148 @@
+import pytest
+from flask import url_for
+
+from flaskapi.models import User
+
+
+@pytest.fixture(scope='function')
+def admin():
+    return User.create(username='admin', email='admin@example.com', password='welcome', is_admin=True)
+
+
+def post_bulk(client, admin, operations):
+    return client.json_post(url_for('admin.users_bulk'), data=operations,
+                            auth=(admin.username, admin.api_key))
+
+
+def new_user(number):
+    return {'op': 'create', 'data': {
+        'username': 'user{}'.format(number),
+        'email': 'user{}@example.com'.format(number),
+        'password': 'welcome{}'.format(number),
+    }}
+
+
+def test_not_admin(client):
+    user = User.create(username='tim', email='tim@example.com', password='welcome')
+    resp = post_bulk(client, user, [new_user(1)])
+    assert resp.status_code == 401
+
+
+def test_bulk(client, admin, max_queries):
+    tim = User.create(username='tim', email='tim@example.com', password='welcome')
+    bob = User.create(username='bob', email='bob@example.com', password='welcome')
+
+    operations = [new_user(i) for i in range(250)]
+    operations.append({'op': 'update', 'id': tim.id, 'data': {'email': 'tim@example.org'}})
+    # A deleted user's username can be reused in the same request.
+    operations.append({'op': 'delete', 'id': bob.id})
+    operations.append({'op': 'create', 'data': {
+        'username': 'bob', 'email': 'bob@example.org', 'password': 'welcome', 'is_admin': True}})
+
+    # auth 1, load 1, unique 3, delete 1, update 1, insert 3, read back 1, transaction overhead.
+    with max_queries(16):
+        resp = post_bulk(client, admin, {'operations': operations})
+    assert resp.status_code == 200
+    objects = resp.json['objects']
+    assert [obj['index'] for obj in objects] == list(range(253))
+    assert objects[0]['op'] == 'create'
+    assert objects[0]['object']['username'] == 'user0'
+    assert objects[250]['object']['email'] == 'tim@example.org'
+    assert objects[251]['object']['id'] == bob.id
+    assert objects[252]['object']['is_admin'] is True
+
+    assert User.select().count() == 253
+    user = User.get(User.username == 'user7')
+    assert user.id == objects[7]['object']['id']
+    assert user.check_password('welcome7')
+    assert User.get(User.id == tim.id).email == 'tim@example.org'
+    assert User.get(User.username == 'bob').id != bob.id
+
+
+def test_bulk_is_atomic(client, admin):
+    tim = User.create(username='tim', email='tim@example.com', password='welcome')
+
+    operations = [
+        new_user(1),
+        new_user(1),
+        {'op': 'create', 'data': {'username': 'admin', 'email': 'admin2@example.com', 'password': 'welcome'}},
+        {'op': 'create', 'data': {'username': 'nopass', 'email': 'nopass@example.com'}},
+        {'op': 'create', 'data': {'username': 'short', 'email': 'invalid', 'password': 'x'}},
+        {'op': 'update', 'id': tim.id, 'data': {'email': 'admin@example.com'}},
+        {'op': 'delete', 'id': 12345},
+        {'op': 'rename'},
+        {'op': 'delete'},
+        new_user(2),
+    ]
+    resp = post_bulk(client, admin, operations)
+    assert resp.status_code == 422
+
+    errors = {error['index']: error['errors'] for error in resp.json['errors']}
+    assert sorted(errors) == [1, 2, 3, 4, 5, 6, 7, 8]
+    assert errors[1] == {'username': 'must be a unique value', 'email': 'must be a unique value'}
+    assert errors[2] == {'username': 'must be a unique value'}
+    assert errors[3] == {'password': 'must be provided'}
+    assert set(errors[4]) == {'email', 'password'}
+    assert errors[5] == {'email': 'must be a unique value'}
+    assert errors[6] == {'id': 'not found'}
+    assert 'op' in errors[7]
+    assert errors[8] == {'id': 'must be provided'}
+
+    assert User.select().count() == 2
+    assert User.get(User.id == tim.id).email == 'tim@example.com'
+
+
+def test_bulk_bad_request(app, client, admin):
+    resp = post_bulk(client, admin, {'users': []})
+    assert resp.status_code == 400
+
+    app.config['BULK_MAX_OPERATIONS'] = 2
+    resp = post_bulk(client, admin, [new_user(1), new_user(2), new_user(3)])
+    assert resp.status_code == 400
+
+
+def test_bulk_takes_vacated_values(client, admin):
+    tim = User.create(username='tim', email='tim@example.com', password='welcome')
+    bob = User.create(username='bob', email='bob@example.com', password='welcome')
+
+    # tim takes bob's username, which bob gives up in the same request, listed after tim.
+    operations = [
+        {'op': 'update', 'id': tim.id, 'data': {'username': 'bob'}},
+        {'op': 'update', 'id': bob.id, 'data': {'username': 'robert'}},
+        {'op': 'create', 'data': {'username': 'tim', 'email': 'new@example.com', 'password': 'welcome'}},
+    ]
+    resp = post_bulk(client, admin, operations)
+    assert resp.status_code == 200, resp.json
+    assert User.get(User.id == tim.id).username == 'bob'
+    assert User.get(User.id == bob.id).username == 'robert'
+    assert User.get(User.username == 'tim').email == 'new@example.com'
+
+
+def test_bulk_swap(client, admin):
+    tim = User.create(username='tim', email='tim@example.com', password='welcome')
+    bob = User.create(username='bob', email='bob@example.com', password='welcome')
+
+    resp = post_bulk(client, admin, [
+        {'op': 'update', 'id': tim.id, 'data': {'username': 'bob'}},
+        {'op': 'update', 'id': bob.id, 'data': {'username': 'tim'}},
+    ])
+    assert resp.status_code == 422
+    assert [error['errors'] for error in resp.json['errors']] == [
+        {'username': 'can not be swapped with another item'}] * 2
+    assert User.get(User.id == tim.id).username == 'tim'
+
+
+def test_bulk_groups_updates(client, admin, max_queries):
+    users = [User.create(username='user{}'.format(i), email='user{}@example.com'.format(i),
+                         password='welcome') for i in range(5)]
+    operations = [{'op': 'update', 'id': user.id, 'data': {'is_admin': True}} for user in users]
+    # The first item makes a change of its own, the other four share one UPDATE.
+    operations[0]['data']['email'] = 'first@example.com'
+
+    with max_queries(20) as stats:
+        resp = post_bulk(client, admin, operations)
+    assert resp.status_code == 200, resp.json
+    updates = [sql for sql in stats.queries if sql.startswith('UPDATE')]
+    assert len(updates) == 2
+    assert User.select().where(User.is_admin).count() == 6
+    assert User.get(User.id == users[0].id).email == 'first@example.com'
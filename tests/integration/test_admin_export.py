@@ -0,0 +1,79 @@
+import csv
+import gzip
+import io
+import json
+
+import pytest
+from flask import url_for
+
+from flaskapi.models import User
+
+
+@pytest.fixture(scope='function')
+def client(app):
+    # Streamed responses pop their own request context, which a preserved context would break.
+    return app.test_client()
+
+
+@pytest.fixture(scope='function')
+def admin():
+    return User.create(username='admin', email='admin@example.com', password='welcome', is_admin=True)
+
+
+def export(client, admin, **kwargs):
+    headers = kwargs.pop('headers', {})
+    headers['X-Api-Key'] = admin.api_key
+    return client.get(url_for('admin.users_export', **kwargs), headers=headers)
+
+
+def test_not_admin(client):
+    user = User.create(username='tim', email='tim@example.com', password='welcome')
+    resp = client.get(url_for('admin.users_export'), headers={'X-Api-Key': user.api_key})
+    assert resp.status_code == 401
+
+
+def test_csv(client, admin, max_queries):
+    User.create(username='tim', email='tim@example.com', password='welcome')
+    with max_queries(2):
+        resp = export(client, admin, format='csv')
+        assert resp.is_streamed
+        data = resp.data.decode('utf-8')
+    assert resp.status_code == 200
+    assert resp.mimetype == 'text/csv'
+    assert resp.headers['Content-Disposition'] == 'attachment; filename="users.csv"'
+
+    rows = list(csv.reader(io.StringIO(data)))
+    assert rows[0] == list(User.serialize_keys(private=True))
+    assert [row[1] for row in rows[1:]] == ['admin', 'tim']
+    assert rows[1][rows[0].index('is_admin')] == 'true'
+    assert rows[1][rows[0].index('api_key')] == admin.api_key
+    assert rows[1][rows[0].index('date_created')].startswith(admin.date_created.isoformat()[:10])
+
+
+def test_ndjson_gzip(client, admin):
+    for i in range(500):
+        User.create(username='user{}'.format(i), email='user{}@example.com'.format(i), password='welcome')
+
+    resp = export(client, admin, format='ndjson', headers={'Accept-Encoding': 'gzip'})
+    assert resp.status_code == 200
+    assert resp.mimetype == 'application/x-ndjson'
+    assert resp.headers['Content-Encoding'] == 'gzip'
+
+    lines = gzip.decompress(resp.data).decode('utf-8').splitlines()
+    assert len(lines) == 501
+    objects = [json.loads(line) for line in lines]
+    assert objects[0]['username'] == 'admin'
+    assert objects[-1]['username'] == 'user499'
+    assert set(objects[0]) == set(User.serialize_keys(private=True))
+
+
+def test_invalid_format(client, admin):
+    resp = export(client, admin, format='xml')
+    assert resp.status_code == 400
+
+
+def test_csv_fields(client, admin, max_queries):
+    with max_queries(2) as stats:
+        data = export(client, admin, format='csv', fields='username').data.decode('utf-8')
+    assert list(csv.reader(io.StringIO(data))) == [['id', 'username'], [str(admin.id), 'admin']]
+    assert stats.queries[-1].startswith('SELECT "t1"."id", "t1"."username" FROM')
@@ -0,0 +1,63 @@
+import pytest
+from flask import url_for
+
+from flaskapi.ext import metrics
+from flaskapi.models import User
+
+
+@pytest.fixture(scope='function')
+def admin():
+    return User.create(username='admin', email='admin@example.com', password='welcome', is_admin=True)
+
+
+def get_metrics(client, admin):
+    resp = client.get(url_for('admin.metrics'), headers={'X-Api-Key': admin.api_key})
+    assert resp.status_code == 200
+    assert resp.mimetype == 'text/plain'
+    return resp.data.decode('utf-8').splitlines()
+
+
+def test_not_admin(client):
+    user = User.create(username='tim', email='tim@example.com', password='welcome')
+    resp = client.get(url_for('admin.metrics'), headers={'X-Api-Key': user.api_key})
+    assert resp.status_code == 401
+
+
+def test_metrics(client, admin):
+    client.json_get(url_for('api.profile'), auth=('admin', 'welcome'))
+    client.json_get(url_for('api.profile'), auth=('admin', 'invalid'))
+    client.json_get('/does-not-exist')
+
+    lines = get_metrics(client, admin)
+    assert 'flaskapi_http_requests_total{endpoint="api.profile",method="GET",status="200"} 1' in lines
+    assert 'flaskapi_http_requests_total{endpoint="api.profile",method="GET",status="401"} 1' in lines
+    assert 'flaskapi_http_requests_total{endpoint="none",method="GET",status="404"} 1' in lines
+    assert 'flaskapi_http_request_duration_seconds_bucket{endpoint="api.profile",le="+Inf"} 2' in lines
+    assert 'flaskapi_http_request_duration_seconds_count{endpoint="api.profile"} 2' in lines
+    assert 'flaskapi_http_response_size_bytes_count{endpoint="api.profile"} 2' in lines
+    assert 'flaskapi_http_requests_in_flight{endpoint="api.profile"} 0' in lines
+
+    # The metrics request itself is in flight while they are rendered.
+    assert 'flaskapi_http_requests_in_flight{endpoint="admin.metrics"} 1' in lines
+
+    assert '# TYPE flaskapi_hasher_completed counter' in lines
+    assert '# TYPE flaskapi_cache_entries gauge' in lines
+    assert not any(line.startswith('flaskapi_db_pool') for line in lines)
+
+
+def test_metrics_dir(client, admin, tmpdir):
+    metrics.directory = str(tmpdir.mkdir('metrics'))
+
+    # Another worker process that exited after handling a request.
+    other = tmpdir.join('metrics', 'metrics-999999999.json')
+    other.write(
+        '{"pid": 999999999, "stats": [["hasher", {"completed": 5}, ["completed"]]], "metrics": {'
+        '"requests": [[["api.profile", "GET", 200], 3]], "in_flight": [["api.profile", 1]], '
+        '"latency": [], "sizes": []}}')
+
+    client.json_get(url_for('api.profile'), auth=('admin', 'welcome'))
+    lines = get_metrics(client, admin)
+    assert 'flaskapi_http_requests_total{endpoint="api.profile",method="GET",status="200"} 4' in lines
+    assert 'flaskapi_http_requests_in_flight{endpoint="api.profile"} 0' in lines
+    assert not any('pid="999999999"' in line for line in lines)
+    assert tmpdir.join('metrics').listdir()
@@ -2,6 +2,7 @@ import pytest
 from flask import url_for
 
 from flaskapi.models import User
+from flaskapi.resources import UserResource
 
 USER_DATA = {
     'username': 'admin',
@@ -31,10 +32,36 @@ def test_not_admin(client):
     assert resp.status_code == 401
 
 
-def test_list(client, user):
+def test_list(client, user, max_queries):
     auth = (user.username, user.api_key)
-    resp = client.json_get(url_for('admin.users'), auth=auth)
+    with max_queries(3):
+        resp = client.json_get(url_for('admin.users'), auth=auth)
     assert 'objects' in resp.json
+    assert resp.json['next_cursor'] is None
+
+
+def test_list_paginated(client, user, max_queries):
+    for i in range(4):
+        User.create(username='user{}'.format(i), email='user{}@example.com'.format(i), password='welcome')
+
+    auth = (user.username, user.api_key)
+    usernames = []
+    cursor = ''
+    while cursor is not None:
+        with max_queries(3):
+            resp = client.json_get(url_for('admin.users', limit=2, cursor=cursor), auth=auth)
+        assert resp.status_code == 200
+        assert len(resp.json['objects']) <= 2
+        usernames.extend(obj['username'] for obj in resp.json['objects'])
+        cursor = resp.json['next_cursor']
+
+    assert usernames == ['admin', 'user0', 'user1', 'user2', 'user3']
+
+
+def test_list_invalid_cursor(client, user):
+    auth = (user.username, user.api_key)
+    resp = client.json_get(url_for('admin.users', cursor='invalid'), auth=auth)
+    assert resp.status_code == 400
 
 
 def test_create_success(client, user):
@@ -62,20 +89,22 @@ def test_create_invalid(client, user):
     assert 'username' in resp.json['errors']
 
 
-def test_detail(client, user):
+def test_detail(client, user, max_queries):
     auth = (user.username, user.api_key)
-    resp = client.json_get(url_for('admin.user', pk=user.id), auth=auth)
+    with max_queries(2):
+        resp = client.json_get(url_for('admin.user', pk=user.id), auth=auth)
     assert 'object' in resp.json
 
 
-def test_update_success(client, user):
+def test_update_success(client, user, max_queries):
     newuser = User.create(username='newuser', email='newuser@example.com', password='welcome', is_admin=False)
 
     data = {
         'username': 'updateduser'
     }
     auth = (user.username, user.api_key)
-    resp = client.json_post(url_for('admin.user', pk=newuser.id), data=data, auth=auth)
+    with max_queries(6):
+        resp = client.json_post(url_for('admin.user', pk=newuser.id), data=data, auth=auth)
     assert 'object' in resp.json
     assert resp.json['object']['username'] == data['username']
 
@@ -93,10 +122,111 @@ def test_update_invalid(client, user):
     assert 'username' in resp.json['errors']
 
 
-def test_delete(client, user):
+def test_delete(client, user, max_queries):
     newuser = User.create(username='byebye', email='byebye@example.com', password='welcome', is_admin=False)
 
     auth = (user.username, user.api_key)
-    resp = client.json_delete(url_for('admin.user', pk=newuser.id), auth=auth)
+    with max_queries(3):
+        resp = client.json_delete(url_for('admin.user', pk=newuser.id), auth=auth)
     assert 'object' in resp.json
     assert resp.json['object']['username'] == newuser.username
+
+
+def test_api_key(client, user):
+    resp = client.json_get(url_for('admin.users'), headers={'X-Api-Key': user.api_key})
+    assert resp.status_code == 200
+
+    newuser = User.create(username='notadmin', email='notadmin@example.com', password='welcome')
+    resp = client.json_get(url_for('admin.users'), headers={'X-Api-Key': newuser.api_key})
+    assert resp.status_code == 401
+
+
+def test_list_not_modified(client, user, mocker, max_queries):
+    auth = (user.username, user.api_key)
+    resp = client.json_get(url_for('admin.users'), auth=auth)
+    etag = resp.headers['ETag']
+    assert 'Last-Modified' not in resp.headers
+
+    serialize_many = mocker.spy(UserResource, 'serialize_many')
+    with max_queries(2):
+        resp = client.json_get(url_for('admin.users'), auth=auth, headers={'If-None-Match': etag})
+    assert resp.status_code == 304
+    assert not serialize_many.called
+
+    # changes to the page give a new etag
+    User.create(username='new', email='new@example.com', password='welcome')
+    resp = client.json_get(url_for('admin.users'), auth=auth, headers={'If-None-Match': etag})
+    assert resp.status_code == 200
+    assert resp.headers['ETag'] != etag
+    etag = resp.headers['ETag']
+
+    user.email = 'changed@example.com'
+    user.save()
+    resp = client.json_get(url_for('admin.users'), auth=auth, headers={'If-None-Match': etag})
+    assert resp.status_code == 200
+    assert resp.headers['ETag'] != etag
+
+
+def test_list_not_modified_delete(client, user):
+    auth = (user.username, user.api_key)
+    other = User.create(username='other', email='other@example.com', password='welcome')
+    resp = client.json_get(url_for('admin.users'), auth=auth)
+    etag = resp.headers['ETag']
+
+    other.delete_instance()
+    resp = client.json_get(url_for('admin.users'), auth=auth, headers={
+        'If-None-Match': etag,
+        'If-Modified-Since': 'Thu, 01 Jan 2099 00:00:00 GMT',
+    })
+    assert resp.status_code == 200
+    assert len(resp.json['objects']) == 1
+
+
+def test_detail_not_modified(client, user):
+    auth = (user.username, user.api_key)
+    resp = client.json_get(url_for('admin.user', pk=user.id), auth=auth)
+    last_modified = resp.headers['Last-Modified']
+
+    resp = client.json_get(url_for('admin.user', pk=user.id), auth=auth,
+                           headers={'If-Modified-Since': last_modified})
+    assert resp.status_code == 304
+
+    resp = client.json_get(url_for('admin.user', pk=user.id), auth=auth,
+                           headers={'If-None-Match': resp.headers['ETag']})
+    assert resp.status_code == 304
+
+
+def test_list_fields(client, user, max_queries):
+    auth = (user.username, user.api_key)
+    with max_queries(4) as stats:
+        resp = client.json_get(url_for('admin.users', fields='username, date_created'), auth=auth)
+    assert resp.status_code == 200
+    assert set(resp.json['objects'][0]) == {'id', 'username', 'date_created'}
+    # The objects are serialized by the last query, which selects only the requested columns.
+    assert stats.queries[-1].startswith('SELECT "t1"."id", "t1"."username", "t1"."date_created" FROM')
+
+    resp = client.json_get(url_for('admin.users', fields='username,password_hash'), auth=auth)
+    assert resp.status_code == 400
+
+
+def test_detail_fields(client, user, max_queries):
+    auth = (user.username, user.api_key)
+    with max_queries(2) as stats:
+        resp = client.json_get(url_for('admin.user', pk=user.id, fields='email'), auth=auth)
+    assert resp.status_code == 200
+    assert resp.json['object'] == {'id': user.id, 'email': user.email}
+    assert 'ETag' in resp.headers
+    assert not any('"api_key"' in sql for sql in stats.queries[1:])
+
+    etag = resp.headers['ETag']
+    resp = client.json_get(url_for('admin.user', pk=user.id), auth=auth)
+    assert resp.headers['ETag'] != etag
+
+
+def test_paginate_with_version(client, user):
+    User.create(username='other', email='other@example.com', password='welcome')
+    resource = UserResource(private=True)
+    page, next_cursor, etag = resource.paginate_with_version(limit=1)
+    assert [obj.id for obj in page] == [user.id]
+    assert next_cursor
+    assert etag == resource.get_version(page, next_cursor)
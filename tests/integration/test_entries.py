@@ -0,0 +1,74 @@
+from datetime import datetime
+from datetime import timedelta
+
+import pytest
+from flask import url_for
+
+from flaskapi.models import Category
+from flaskapi.models import Comment
+from flaskapi.models import Entry
+
+
+@pytest.fixture(scope='function')
+def client(app):
+    # Streamed responses pop their own request context, which a preserved context would break.
+    return app.test_client()
+
+
+@pytest.fixture(scope='function')
+def entries():
+    published = datetime.utcnow() - timedelta(days=1)
+    news = Category.create(name='news')
+    entries = []
+    for i in range(6):
+        entry = Entry.create(title='entry{}'.format(i), content='*entry {}*'.format(i),
+                             date_published=published)
+        entry.categories.add(news)
+        Comment.create(author='tim', content='first\n\nsecond', entry=entry)
+        Comment.create(author='bob', content='reply <{}>'.format(i), entry=entry)
+        entries.append(entry)
+    Entry.create(title='draft', content='draft')
+    return entries
+
+
+@pytest.mark.parametrize('limit', [2, 6])
+def test_list(client, entries, max_queries, limit):
+    # One query for the page ids, one for the page and one per prefetched relation.
+    with max_queries(4):
+        resp = client.json_get(url_for('api.entries', limit=limit))
+        assert resp.is_streamed
+        assert resp.status_code == 200
+        assert (resp.json['next_cursor'] is None) == (limit == 6)
+
+    objects = resp.json['objects']
+    assert len(objects) == limit
+    assert objects[0]['title'] == 'entry0'
+    assert objects[0]['html'] == '<p><em>entry 0</em></p>'
+    assert objects[0]['categories'] == [{'id': entries[0].categories[0].id, 'name': 'news'}]
+    assert [comment['html'] for comment in objects[1]['comments']] == [
+        '<p>first</p>\n<p>second</p>', '<p>reply &lt;1&gt;</p>']
+    assert 'content' not in objects[0]['comments'][0]
+
+
+def test_list_unpublished(client, entries):
+    resp = client.json_get(url_for('api.entries', limit=100))
+    assert 'draft' not in [obj['title'] for obj in resp.json['objects']]
+
+
+def test_list_fields(client, entries, max_queries):
+    with max_queries(3):
+        resp = client.json_get(url_for('api.entries', fields='title,comments', limit=1))
+        assert resp.json['next_cursor']
+    assert resp.json['objects'][0]['title'] == 'entry0'
+    assert sorted(resp.json['objects'][0]) == ['comments', 'id', 'title']
+
+
+def test_detail(client, entries):
+    resp = client.json_get(url_for('api.entry', pk=entries[2].id))
+    assert resp.status_code == 200
+    assert resp.json['object']['title'] == 'entry2'
+    assert len(resp.json['object']['comments']) == 2
+
+    draft = Entry.get(Entry.title == 'draft')
+    resp = client.json_get(url_for('api.entry', pk=draft.id))
+    assert resp.status_code == 404
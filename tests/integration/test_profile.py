@@ -1,7 +1,9 @@
 import pytest
 from flask import url_for
 
+from flaskapi.ext import limiter
 from flaskapi.models import User
+from flaskapi.utils.hashing import HasherBusy
 
 USER_DATA = {
     'username': 'mockuser',
@@ -27,9 +29,10 @@ def test_invalid(client, user):
     assert resp.status_code == 401
 
 
-def test_profile(client, user):
+def test_profile(client, user, max_queries):
     auth = (user.username, user.api_key)
-    resp = client.json_get(url_for('api.profile'), auth=auth)
+    with max_queries(1):
+        resp = client.json_get(url_for('api.profile'), auth=auth)
     assert resp.status_code == 200
     assert resp.json['object']['email'] == USER_DATA['email']
     assert resp.json['object']['username'] == USER_DATA['username']
@@ -49,14 +52,15 @@ def test_update_invalid(client, user):
     assert 'current_password' in resp.json['errors']
 
 
-def test_update(client, user):
+def test_update(client, user, max_queries):
     new_data = {
         'email': 'dfbdfgb@example.com',
         'password': 'newpassword',
         'current_password': USER_DATA['password'],
     }
     auth = (user.username, user.api_key)
-    resp = client.json_post(url_for('api.profile'), data=new_data, auth=auth)
+    with max_queries(4):
+        resp = client.json_post(url_for('api.profile'), data=new_data, auth=auth)
     assert resp.status_code == 200
     assert 'errors' not in resp.json
     assert resp.json['object']['email'] == new_data['email']
@@ -94,3 +98,131 @@ def test_delete(client, user):
     auth = (user.username, user.api_key)
     resp = client.json_get(url_for('api.profile'), auth=auth)
     assert resp.status_code == 401
+
+
+def test_password_cache(app, client, user):
+    from flaskapi.ext import credentials
+
+    auth = (user.username, USER_DATA['password'])
+    resp = client.json_get(url_for('api.profile'), auth=auth)
+    assert resp.status_code == 200
+    assert credentials.get(user.username, USER_DATA['password']) == user.password_hash
+
+    # cached credentials are dropped when the password changes
+    user.password = 'newpassword'
+    user.save()
+    assert credentials.get(user.username, USER_DATA['password']) is None
+
+    resp = client.json_get(url_for('api.profile'), auth=auth)
+    assert resp.status_code == 401
+
+
+def test_password_cache_stale_hash(app, client, user):
+    from flaskapi.ext import credentials
+
+    auth = (user.username, USER_DATA['password'])
+    resp = client.json_get(url_for('api.profile'), auth=auth)
+    assert resp.status_code == 200
+
+    # a password changed by another process is not visible to this cache,
+    # but the stored hash no longer matches so the entry is not trusted
+    User.update(password_hash='plain$$other').where(User.id == user.id).execute()
+    resp = client.json_get(url_for('api.profile'), auth=auth)
+    assert resp.status_code == 401
+
+
+def test_api_key_header(client, user, mocker):
+    check_password_hash = mocker.patch('flaskapi.utils.hashing.check_password_hash')
+
+    headers = {'X-Api-Key': user.api_key}
+    resp = client.json_get(url_for('api.profile'), headers=headers)
+    assert resp.status_code == 200
+    assert resp.json['object']['username'] == USER_DATA['username']
+
+    headers = {'X-Api-Key': 'invalid-key'}
+    resp = client.json_get(url_for('api.profile'), headers=headers)
+    assert resp.status_code == 401
+
+    assert not check_password_hash.called
+
+
+def test_api_key_bearer(client, user):
+    headers = {'Authorization': 'Bearer {}'.format(user.api_key)}
+    resp = client.json_get(url_for('api.profile'), headers=headers)
+    assert resp.status_code == 200
+
+    headers = {'Authorization': 'Bearer invalid-key'}
+    resp = client.json_get(url_for('api.profile'), headers=headers)
+    assert resp.status_code == 401
+
+    headers = {'Authorization': 'Bearer'}
+    resp = client.json_get(url_for('api.profile'), headers=headers)
+    assert resp.status_code == 401
+
+
+def test_profile_not_modified(client, user):
+    auth = (user.username, user.api_key)
+    resp = client.json_get(url_for('api.profile'), auth=auth)
+    etag = resp.headers['ETag']
+
+    resp = client.json_get(url_for('api.profile'), auth=auth, headers={'If-None-Match': etag})
+    assert resp.status_code == 304
+
+    new_data = {
+        'email': 'changed@example.com',
+        'current_password': USER_DATA['password'],
+    }
+    client.json_post(url_for('api.profile'), data=new_data, auth=auth)
+    resp = client.json_get(url_for('api.profile'), auth=auth, headers={'If-None-Match': etag})
+    assert resp.status_code == 200
+    assert resp.json['object']['email'] == new_data['email']
+
+
+def test_rehash_on_login(app, client, user):
+    app.config['PASSWORD_HASH_METHOD'] = 'pbkdf2:sha256:1000'
+    resp = client.json_get(url_for('api.profile'), auth=(user.username, USER_DATA['password']))
+    assert resp.status_code == 200
+
+    user = User.get(User.id == user.id)
+    assert user.password_hash.startswith('pbkdf2:sha256:1000$')
+    assert user.check_password(USER_DATA['password'])
+
+    resp = client.json_get(url_for('api.profile'), auth=(user.username, USER_DATA['password']))
+    assert resp.status_code == 200
+
+
+def test_hasher_busy(client, user, mocker):
+    mocker.patch('flaskapi.ext.hasher.check', side_effect=HasherBusy(retry_after=2))
+    resp = client.json_get(url_for('api.profile'), auth=(user.username, USER_DATA['password']))
+    assert resp.status_code == 503
+    assert resp.headers['Retry-After'] == '2'
+
+
+def test_profile_fields(client, user):
+    auth = (user.username, user.api_key)
+    resp = client.json_get(url_for('api.profile', fields='username'), auth=auth)
+    assert resp.status_code == 200
+    assert resp.json['object'] == {'id': user.id, 'username': 'mockuser'}
+
+    # Private fields can not be requested from the public API.
+    resp = client.json_get(url_for('api.profile', fields='date_created'), auth=auth)
+    assert resp.status_code == 400
+
+
+def test_rate_limit_before_auth(app, client, user, mocker):
+    app.config['RATELIMIT_ENABLED'] = True
+    limiter.init_app(app)
+    environ_base = {'REMOTE_ADDR': '127.0.0.1'}
+    resp = client.json_get(url_for('api.profile'), auth=(user.username, user.api_key),
+                           environ_base=environ_base)
+    assert resp.status_code == 200
+    assert resp.headers['X-RateLimit-Remaining'] == '59'
+
+    # Empty the bucket of the address: password guesses from it are not verified any more.
+    for _ in range(59):
+        limiter.storage.consume('api.profile|ip:127.0.0.1', 60, 1)
+    check_password = mocker.spy(User, 'check_password')
+    resp = client.json_get(url_for('api.profile'), auth=(user.username, 'guess'),
+                           environ_base=environ_base)
+    assert resp.status_code == 429
+    assert not check_password.called
@@ -0,0 +1,112 @@
+import shutil
+
+import pytest
+from flask import url_for
+from peewee_moves import get_database_manager
+
+from flaskapi import create_app
+from flaskapi.ext import db
+from flaskapi.models import User
+from tests import conftest
+
+
+@pytest.fixture(scope='function')
+def app(tmpdir):
+    primary = str(tmpdir.join('primary.sqlite'))
+    replica = str(tmpdir.join('replica.sqlite'))
+    config = {
+        'TESTING': True,
+        'DATABASE': 'sqlite:///' + primary,
+        'DATABASE_REPLICAS': ['sqlite:///' + replica],
+        'PASSWORD_HASH_METHOD': 'plain',
+        'CACHE_TYPE': 'sqlite',
+        'CACHE_SQLITE_PATH': str(tmpdir.join('cache.sqlite')),
+        'LOG_FILE': str(tmpdir.join('app.log')),
+        'ACCESS_LOG_FILE': str(tmpdir.join('access.log')),
+    }
+    app = create_app(config)
+    app.test_client_class = conftest.TestClient
+    app.response_class = conftest.TestResponse
+
+    with app.test_request_context():
+        get_database_manager(app).upgrade()
+        User.insert(username='admin', email='admin@example.com', password_hash='plain$$welcome',
+                    is_admin=True).execute()
+
+        # The replica is a snapshot of the primary, so later writes show how far behind it is.
+        db.database.close()
+        shutil.copy(primary, replica)
+
+        yield app
+
+
+def get_usernames(client):
+    resp = client.json_get(url_for('admin.users'), auth=('admin', 'welcome'))
+    assert resp.status_code == 200
+    return [obj['username'] for obj in resp.json['objects']]
+
+
+def test_reads_from_replica(client):
+    # Written by another process, so this one has no reason to read from the primary.
+    User.insert(username='tim', email='tim@example.com', password_hash='plain$$welcome').execute()
+    assert get_usernames(client) == ['admin']
+
+
+def test_auth_falls_back_to_primary(client):
+    user = User.create(username='tim', email='tim@example.com', password='welcome')
+    resp = client.json_get(url_for('api.profile'), auth=('tim', 'welcome'))
+    assert resp.status_code == 200
+
+    user.password = 'changed'
+    user.save()
+    resp = client.json_get(url_for('api.profile'), auth=('tim', 'welcome'))
+    assert resp.status_code == 401
+    resp = client.json_get(url_for('api.profile'), auth=('tim', 'changed'))
+    assert resp.status_code == 200
+
+    resp = client.json_get(url_for('api.profile'), headers={'X-Api-Key': user.api_key})
+    assert resp.status_code == 200
+
+
+def test_writes_go_to_primary(client):
+    data = {'username': 'tim', 'email': 'tim@example.com', 'password': 'welcome'}
+    resp = client.json_post(url_for('admin.users'), data=data, auth=('admin', 'welcome'))
+    assert resp.status_code == 200
+    assert User.select().where(User.username == 'tim').exists()
+
+    # The writer reads from the primary within the read-your-writes window.
+    assert get_usernames(client) == ['admin', 'tim']
+
+    client.application.cache.clear()
+    assert get_usernames(client) == ['admin']
+
+
+def test_read_your_writes_checked_once(client, mocker):
+    client.json_post(url_for('admin.users'), auth=('admin', 'welcome'),
+                     data={'username': 'tim', 'email': 'tim@example.com', 'password': 'welcome'})
+    get = mocker.spy(client.application.cache, 'get')
+    assert get_usernames(client) == ['admin', 'tim']
+    keys = [call[0][0] for call in get.call_args_list]
+    assert keys.count(db._write_key('admin')) == 1
+
+
+def test_read_your_writes_requires_shared_cache(tmpdir):
+    config = {
+        'DATABASE': 'sqlite:///' + str(tmpdir.join('primary.sqlite')),
+        'DATABASE_REPLICAS': ['sqlite:///' + str(tmpdir.join('replica.sqlite'))],
+        'CACHE_TYPE': 'lru',
+        'LOG_FILE': str(tmpdir.join('app.log')),
+        'ACCESS_LOG_FILE': str(tmpdir.join('access.log')),
+    }
+    with pytest.raises(ValueError):
+        create_app(config)
+
+    config['DATABASE_READ_YOUR_WRITES_SECONDS'] = 0
+    create_app(config)
+
+
+def test_read_your_writes_disabled(app, client):
+    db.read_your_writes = 0
+    data = {'username': 'tim', 'email': 'tim@example.com', 'password': 'welcome'}
+    client.json_post(url_for('admin.users'), data=data, auth=('admin', 'welcome'))
+    assert get_usernames(client) == ['admin']
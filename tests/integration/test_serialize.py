@@ -0,0 +1,37 @@
+import pytest
+from flask import json
+
+from flaskapi.models import User
+from flaskapi.resources import UserResource
+
+
+@pytest.fixture(scope='function')
+def users():
+    return [
+        User.create(username='user{}'.format(i), email='user{}@example.com'.format(i), password='welcome',
+                    is_admin=bool(i % 2))
+        for i in range(5)
+    ]
+
+
+@pytest.mark.parametrize('private', [False, True])
+def test_serialize_rows_identical(app, users, private):
+    resource = UserResource(private=private)
+    assert resource.get_columns() is not None
+
+    expected = tuple(resource.serialize(obj) for obj in User.select().order_by(User.id))
+    result = resource.serialize_many(User.select().order_by(User.id))
+
+    assert result == expected
+    assert json.dumps(result) == json.dumps(expected)
+
+
+def test_serialize_rows_projected(app, users, mocker):
+    resource = UserResource()
+    execute_sql = mocker.spy(User._meta.database.obj, 'execute_sql')
+
+    resource.serialize_many(resource.all())
+
+    sql = execute_sql.call_args[0][0]
+    assert '"password_hash"' not in sql
+    assert '"date_created"' not in sql
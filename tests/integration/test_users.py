@@ -1,5 +1,7 @@
 from flask import url_for
 
+from flaskapi.ext import limiter
+
 
 def test_invalid(client):
     resp = client.json_post(url_for('api.users'), data={})
@@ -25,13 +27,14 @@ def test_invalid_email(client):
     assert 'username' not in resp.json['errors']
 
 
-def test_success(client):
+def test_success(client, max_queries):
     user_data = {
         'username': 'uniqueuser',
         'email': 'uniqueuser@example.com',
         'password': 'welcome'
     }
-    resp = client.json_post(url_for('api.users'), data=user_data)
+    with max_queries(3):
+        resp = client.json_post(url_for('api.users'), data=user_data)
 
     assert resp.status_code == 200
     assert resp.json['object']['email'] == user_data['email']
@@ -53,3 +56,40 @@ def test_duplicate(client):
     resp = client.json_post(url_for('api.users'), data=user_data)
     assert resp.status_code == 422
     assert 'username' in resp.json['errors']
+
+
+def enable_rate_limit(app, **config):
+    app.config['RATELIMIT_ENABLED'] = True
+    app.config.update(config)
+    limiter.init_app(app)
+
+
+def test_rate_limit(app, client):
+    enable_rate_limit(app)
+    for i in range(10):
+        resp = client.json_post(url_for('api.users'), data={})
+        assert resp.status_code == 422
+        assert resp.headers['X-RateLimit-Remaining'] == str(9 - i)
+
+    resp = client.json_post(url_for('api.users'), data={})
+    assert resp.status_code == 429
+    assert resp.json['code'] == 429
+    assert resp.headers['X-RateLimit-Limit'] == '10'
+    assert int(resp.headers['Retry-After']) > 0
+
+
+def test_rate_limit_disabled(client):
+    # Limits are off unless RATELIMIT_ENABLED is set.
+    for i in range(11):
+        resp = client.json_post(url_for('api.users'), data={})
+        assert resp.status_code == 422
+        assert 'X-RateLimit-Remaining' not in resp.headers
+
+
+def test_rate_limit_trusted_proxy(app, client):
+    enable_rate_limit(app, TRUSTED_PROXIES=['127.0.0.1'])
+    for address in ('10.0.0.1', '10.0.0.2'):
+        resp = client.json_post(url_for('api.users'), data={},
+                                headers={'X-Forwarded-For': '1.2.3.4, ' + address},
+                                environ_base={'REMOTE_ADDR': '127.0.0.1'})
+        assert resp.headers['X-RateLimit-Remaining'] == '9'
@@ -0,0 +1,68 @@
+import pytest
+
+from flaskapi.ext import db
+from flaskapi.models import Category
+from flaskapi.models import Comment
+from flaskapi.models import Entry
+from flaskapi.models import EntryCategory
+from flaskapi.models import Page
+
+
+def is_full_scan(step):
+    """A plan step reading every row, with or without an index, e.g. "SCAN TABLE entries AS t1"."""
+    return step.startswith('SCAN ')
+
+
+def explain(query):
+    sql, params = query.sql()
+    cursor = db.database.execute_sql('EXPLAIN QUERY PLAN ' + sql, params)
+    return [row[-1] for row in cursor.fetchall()]
+
+
+@pytest.fixture(scope='function')
+def entry(app):
+    entry = Entry.create(title='Entry', content='content')
+    entry.categories.add(Category.create(name='category'))
+    Comment.create(author='tim', content='comment', entry=entry)
+    return entry
+
+
+def test_tables(entry):
+    for model in (Entry, Page, Category, Comment, EntryCategory):
+        assert model._meta.db_table in db.database.get_tables()
+
+
+@pytest.mark.parametrize('get_query', [
+    lambda entry: Entry.select().where(Entry.published_filter()),
+    lambda entry: Page.select().where(Page.published_filter()),
+    lambda entry: Comment.select().where(Comment.entry == entry),
+    lambda entry: entry.comments,
+    lambda entry: entry.categories,
+    lambda entry: Category.get(Category.name == 'category').entries,
+])
+def test_no_full_table_scan(entry, get_query):
+    plan = explain(get_query(entry))
+    assert plan
+    assert not any(is_full_scan(step) for step in plan), plan
+
+
+def test_comments_ordered_by_index(entry):
+    plan = explain(entry.comments)
+    assert not any('TEMP B-TREE' in step for step in plan), plan
+
+
+def test_full_table_scan_detected(entry):
+    plan = explain(Entry.select().where(Entry.title == 'Entry'))
+    assert any(is_full_scan(step) for step in plan), plan
+
+
+@pytest.mark.parametrize('model', [Comment, EntryCategory])
+def test_no_redundant_indexes(app, model):
+    """No index is a prefix of another one, which would serve the same lookups."""
+    table = model._meta.db_table
+    columns = [tuple(info[2] for info in db.database.execute_sql(
+                   'PRAGMA index_info("{}")'.format(row[1])).fetchall())
+               for row in db.database.execute_sql('PRAGMA index_list("{}")'.format(table))]
+    for index in columns:
+        others = [other for other in columns if other is not index]
+        assert not any(other[:len(index)] == index for other in others), (table, columns)
@@ -0,0 +1,75 @@
+import random
+import re
+
+from markupsafe import escape
+import pytest
+
+from flaskapi.models import Comment
+from flaskapi.models import linebreaks
+from flaskapi.models import linebreaks_many
+
+
+def reference_linebreaks(value):
+    """The original implementation, which the optimized one must match exactly."""
+    value = str(escape(value))
+    paragraphs = re.split(r'(?:\r\n|\r|\n){2,}', value)
+    iter_paragraphs = ('<p>{}</p>'.format(x.replace('\n', '<br>')) for x in paragraphs)
+    return '\n'.join(iter_paragraphs)
+
+
+CORPUS = [
+    '',
+    'one line',
+    'line\nbreak',
+    'para\n\nbreak',
+    'many\n\n\n\n\nbreaks',
+    'windows\r\nbreak',
+    'windows\r\n\r\nparagraph',
+    'lone\rcarriage',
+    'lone\r\rcarriages',
+    'mixed\n\r\r\n\nbreaks',
+    '\n\nleading and trailing\n\n',
+    '\r\n',
+    '\n',
+    '\r',
+    '<script>alert("x & y")</script>',
+    "it's <b>bold</b> & \"quoted\"",
+    '<>\n<|>\n\n<p></p>',
+    'unicode é ü 漢字\n\nsecond',
+]
+
+
+@pytest.mark.parametrize('value', CORPUS)
+def test_linebreaks_corpus(value):
+    assert linebreaks(value) == reference_linebreaks(value)
+
+
+def test_linebreaks_random():
+    rng = random.Random(1234)
+    alphabet = ['\r', '\n', '\r\n', 'a', ' ', '<', '>', '&', '"', "'", '<>', '<|>']
+    for _ in range(5000):
+        value = ''.join(rng.choice(alphabet) for _ in range(rng.randint(0, 15)))
+        assert linebreaks(value) == reference_linebreaks(value)
+
+
+def test_linebreaks_many():
+    assert linebreaks_many([]) == []
+    assert linebreaks_many(CORPUS) == [reference_linebreaks(value) for value in CORPUS]
+    assert linebreaks_many(iter(CORPUS)) == [reference_linebreaks(value) for value in CORPUS]
+
+
+def test_comment_html_many():
+    comments = [Comment(content=value) for value in CORPUS]
+    assert Comment.html_many(comments) == [comment.html for comment in comments]
+
+
+def test_comment_to_dict_many(mocker):
+    comments = [Comment(author='tim', content=value) for value in CORPUS]
+    expected = [comment.to_dict(private=True) for comment in comments]
+
+    # Every html value must come from the batch.
+    mocker.patch('flaskapi.models.linebreaks', side_effect=AssertionError)
+    assert Comment.to_dict_many(comments, private=True) == expected
+    assert Comment.to_dict_many(comments, keys=('author', 'html')) == [
+        {'author': 'tim', 'html': data['html']} for data in expected]
+    assert Comment.to_dict_many(comments, keys=('author', )) == [{'author': 'tim'}] * len(CORPUS)
@@ -0,0 +1,49 @@
+from flaskapi import models
+from flaskapi.models import Entry
+from flaskapi.models import Page
+from flaskapi.models import content_hash
+
+
+def test_html_stored_on_save(app, mocker):
+    entry = Entry.create(title='Hello', content='# Hello')
+
+    assert entry.content_html == '<h1>Hello</h1>'
+    assert entry.content_hash == content_hash('# Hello')
+
+    markdown = mocker.patch('flaskapi.models.markdown')
+    entry = Entry.get(Entry.id == entry.id)
+    assert entry.html == '<h1>Hello</h1>'
+    assert not markdown.called
+
+
+def test_html_rerendered_on_change(app):
+    entry = Entry.create(title='Hello', content='# Hello')
+    entry.content = '*changed*'
+    assert entry.html == '<p><em>changed</em></p>'
+
+    entry.save()
+    assert entry.content_html == '<p><em>changed</em></p>'
+
+
+def test_html_not_backfilled(app, mocker):
+    page = Page.create(title='About', content='**about**')
+    Page.update(content_html=None, content_hash=None).where(Page.id == page.id).execute()
+    page = Page.get(Page.id == page.id)
+
+    render_markdown = mocker.spy(models, 'render_markdown')
+    assert page.html == '<p><strong>about</strong></p>'
+    assert render_markdown.called
+
+
+def test_backfill_html(app):
+    entries = [Entry.create(title=str(i), content='entry {}'.format(i)) for i in range(5)]
+    Entry.update(content_html=None, content_hash=None).where(Entry.id << [e.id for e in entries[:3]]).execute()
+    date_updated = Entry.get(Entry.id == entries[0].id).date_updated
+
+    assert Entry.backfill_html(batch_size=2) == 3
+    assert Entry.backfill_html(batch_size=2) == 0
+
+    entry = Entry.get(Entry.id == entries[0].id)
+    assert entry.content_html == '<p>entry 0</p>'
+    assert entry.content_hash == content_hash('entry 0')
+    assert entry.date_updated == date_updated
@@ -28,3 +28,15 @@ def test_user_password():
     u.password = None
     assert u.check_password('derp')
     assert u.password == u.password_hash
+
+
+def test_user_needs_rehash(app):
+    u = User(username='tim', email='tim@me.com', password='pass')
+    assert not u.needs_rehash()
+
+    app.config['PASSWORD_HASH_METHOD'] = 'pbkdf2:sha256'
+    assert u.needs_rehash()
+
+    u.password = 'pass'
+    assert u.password_hash.startswith('pbkdf2:sha256:1000$')
+    assert not u.needs_rehash()
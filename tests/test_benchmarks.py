@@ -0,0 +1,37 @@
+import pytest
+
+from benchmarks import harness
+
+
+def test_percentile():
+    values = list(range(1, 101))
+    assert harness.percentile(values, 50) == 50
+    assert harness.percentile(values, 99) == 99
+    assert harness.percentile([3, 1, 2], 50) == 2
+    assert harness.percentile([], 50) is None
+
+
+def test_measure():
+    calls = []
+    result = harness.measure(lambda: calls.append(1), min_time=0, min_samples=3)
+    assert result['samples'] == 3
+    assert len(calls) == result['calls'] * 3 + 1
+    assert result['ops'] > 0
+    assert result['p50'] <= result['p99']
+
+
+def test_compare():
+    baseline = {'results': {'fast': {'ops': 100}, 'slow': {'ops': 100}}}
+    results = {'fast': {'ops': 95}, 'slow': {'ops': 70}, 'new': {'ops': 1}}
+    [(name, previous, current, change)] = harness.compare(results, baseline, 0.1)
+    assert (name, previous, current) == ('slow', 100, 70)
+    assert change == pytest.approx(-0.3)
+    assert harness.compare(results, baseline, 0.5) == []
+    assert harness.compare(results, {}, 0.1) == []
+
+
+def test_baseline(tmpdir):
+    path = str(tmpdir.join('baseline.json'))
+    assert harness.load_baseline(path) == {}
+    harness.save_baseline(path, {'fast': {'ops': 100}})
+    assert harness.load_baseline(path)['results'] == {'fast': {'ops': 100}}
@@ -2,6 +2,9 @@ def test_config(app):
     assert isinstance(app.config['SECRET_KEY'], str)
     assert isinstance(app.config['DATABASE'], str)
     assert isinstance(app.config['LOG_FILE'], str)
+    assert isinstance(app.config['ACCESS_LOG_ENABLED'], bool)
+    assert isinstance(app.config['ACCESS_LOG_FILE'], str)
+    assert isinstance(app.config['ACCESS_LOG_QUEUE_SIZE'], int)
     assert isinstance(app.config['ADMINS'], (list, tuple))
     assert isinstance(app.config['MAIL_SERVER'], str)
     assert isinstance(app.config['MAIL_PORT'], int)
@@ -11,3 +14,89 @@ def test_config(app):
     assert isinstance(app.config['MAIL_PASSWORD'], str)
     assert isinstance(app.config['MAIL_ERROR_SUBJECT'], str)
     assert isinstance(app.config['MAIL_FROM_ADDRESS'], str)
+    assert isinstance(app.config['MAIL_ERROR_WINDOW'], float)
+    assert isinstance(app.config['MAIL_ERROR_QUEUE_SIZE'], int)
+    assert isinstance(app.config['MAIL_ERROR_TIMEOUT'], float)
+    assert isinstance(app.config['DATABASE_POOL'], bool)
+    assert isinstance(app.config['DATABASE_MAX_CONNECTIONS'], int)
+    assert isinstance(app.config['DATABASE_STALE_TIMEOUT'], int)
+    assert isinstance(app.config['DATABASE_WAIT_TIMEOUT'], float)
+    assert isinstance(app.config['DATABASE_REPLICAS'], list)
+    assert isinstance(app.config['TRUSTED_PROXIES'], list)
+    assert isinstance(app.config['HASHER_WORKERS'], int)
+    assert isinstance(app.config['HASHER_QUEUE_SIZE'], int)
+
+
+def test_config_cache(app):
+    from flaskapi.utils.cache import LRUCache
+
+    assert isinstance(app.cache, LRUCache)
+    assert app.cache.threshold == app.config['CACHE_THRESHOLD']
+    assert app.cache.default_timeout == app.config['CACHE_SECONDS']
+    assert app.cache.set('key', 'value')
+    assert app.cache.get('key') == 'value'
+
+
+def test_config_cache_sqlite(tmpdir):
+    from flaskapi import create_app
+    from flaskapi.utils.cache import SQLiteCache
+
+    app = create_app({
+        'CACHE_TYPE': 'sqlite',
+        'CACHE_SQLITE_PATH': str(tmpdir.join('cache.sqlite')),
+        'DATABASE': 'sqlite:///' + str(tmpdir.join('test.sqlite')),
+        'LOG_FILE': str(tmpdir.join('app.log')),
+        'ACCESS_LOG_FILE': str(tmpdir.join('access.log')),
+    })
+    assert isinstance(app.cache, SQLiteCache)
+
+
+def test_config_database_pool(tmpdir):
+    from flaskapi import create_app
+    from flaskapi.ext import db
+
+    app = create_app({
+        'DATABASE': 'sqlite:///' + str(tmpdir.join('test.sqlite')),
+        'DATABASE_POOL': True,
+        'DATABASE_MAX_CONNECTIONS': 5,
+        'LOG_FILE': str(tmpdir.join('app.log')),
+        'ACCESS_LOG_FILE': str(tmpdir.join('access.log')),
+    })
+
+    with app.test_client() as client:
+        client.get('/api/profile')
+        client.get('/api/profile')
+
+    stats = db.pool_stats()
+    assert stats['max_connections'] == 5
+    assert stats['in_use'] == 0
+    assert stats['idle'] == 1
+    assert stats['checkouts'] == 2
+
+
+def test_config_no_admins(tmpdir):
+    from flaskapi import create_app
+    from flaskapi.utils.errormail import DigestMailHandler
+
+    app = create_app({
+        'ADMINS': [],
+        'DATABASE': 'sqlite:///' + str(tmpdir.join('test.sqlite')),
+        'LOG_FILE': str(tmpdir.join('app.log')),
+        'ACCESS_LOG_FILE': str(tmpdir.join('access.log')),
+    })
+    assert app.logger.handlers
+    assert not any(isinstance(handler, DigestMailHandler) for handler in app.logger.handlers)
+
+
+def test_config_admins_from_env(monkeypatch):
+    import importlib
+    from flaskapi import config
+
+    try:
+        monkeypatch.setenv('FLASK_ADMINS', '')
+        assert importlib.reload(config).ADMINS == []
+        monkeypatch.setenv('FLASK_ADMINS', 'a@example.com;;b@example.com')
+        assert importlib.reload(config).ADMINS == ['a@example.com', 'b@example.com']
+    finally:
+        monkeypatch.undo()
+        importlib.reload(config)
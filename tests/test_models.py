@@ -59,3 +59,25 @@ def test_model_to_dict_custom():
     assert data['ssn'] == obj.ssn
     assert data['date_created'] == obj.date_created
     assert data['date_updated'] == obj.date_updated
+
+
+def test_model_serialize_keys():
+    assert FakeUser.serialize_keys() == ('id', 'name')
+    assert FakeUser.serialize_keys(private=True) == ('id', 'name', 'ssn', 'date_created', 'date_updated')
+    assert FakeUser.serialize_keys() is FakeUser.serialize_keys()
+
+
+def test_model_serialize_columns():
+    columns = FakeUser.serialize_columns(private=True)
+    assert columns == (FakeUser.id, FakeUser.name, FakeUser.ssn, FakeUser.date_created, FakeUser.date_updated)
+
+    class FakeProperty(FakeUser):
+        @property
+        def upper(self):
+            return self.name.upper()
+
+        class Meta:
+            serialize = ('name', 'upper')
+
+    assert FakeProperty.serialize_columns() is None
+    assert FakeProperty(name='tim').to_dict()['upper'] == 'TIM'
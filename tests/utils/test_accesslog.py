@@ -0,0 +1,104 @@
+import json
+import os
+import queue
+import time
+
+from flask import url_for
+
+from flaskapi.ext import accesslog
+from flaskapi.models import User
+from flaskapi.utils.accesslog import QueueWriter
+from flaskapi.utils.accesslog import format_timestamp
+
+
+def read_lines(path):
+    with open(path) as fp:
+        return [json.loads(line) for line in fp]
+
+
+def test_format_timestamp():
+    assert format_timestamp(0.25) == '1970-01-01T00:00:00.250Z'
+
+
+def test_queue_writer(tmpdir):
+    path = str(tmpdir.join('logs', 'access.log'))
+    writer = QueueWriter(path)
+    for i in range(100):
+        assert writer.write({'i': i})
+    writer.close()
+
+    assert [line['i'] for line in read_lines(path)] == list(range(100))
+    stats = writer.stats()
+    assert stats['written'] == 100
+    assert stats['dropped'] == 0
+    assert 1 <= stats['batches'] <= 100
+
+
+def test_queue_writer_drops_when_full(tmpdir):
+    path = str(tmpdir.join('access.log'))
+    writer = QueueWriter(path, queue_size=2)
+    # Set up the queue without the background thread, so nothing takes records from it.
+    writer._pid = os.getpid()
+    writer._queue = queue.Queue(2)
+    results = [writer.write({'i': i}) for i in range(5)]
+    assert results == [True, True, False, False, False]
+    assert writer.dropped == 3
+
+    writer._write_batch([writer._queue.get_nowait(), writer._queue.get_nowait()])
+    assert [line['i'] for line in read_lines(path)] == [0, 1]
+
+
+def test_queue_writer_reopens(tmpdir):
+    path = str(tmpdir.join('access.log'))
+    writer = QueueWriter(path)
+    writer._write_batch([{'i': 1}])
+    os.rename(path, path + '.1')
+    writer._write_batch([{'i': 2}])
+
+    assert read_lines(path + '.1') == [{'i': 1}]
+    assert read_lines(path) == [{'i': 2}]
+
+
+def wait_for_lines(path, count):
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline:
+        if os.path.exists(path):
+            lines = read_lines(path)
+            if len(lines) >= count:
+                return lines
+        time.sleep(0.01)
+    raise AssertionError('Timed out waiting for {} lines'.format(count))
+
+
+def test_access_log(app):
+    user = User.create(username='tim', email='tim@example.com', password='welcome')
+    with app.test_client() as client:
+        resp = client.get('/does-not-exist', headers={'X-Request-Id': 'abc-123'})
+        assert resp.headers['X-Request-Id'] == 'abc-123'
+        resp = client.get('/does-not-exist', headers={'X-Request-Id': 'not valid!'})
+        generated_id = resp.headers['X-Request-Id']
+        resp = client.json_get(url_for('api.profile'), auth=('tim', 'welcome'))
+        request_id = resp.headers['X-Request-Id']
+
+    missing, invalid, profile = wait_for_lines(app.config['ACCESS_LOG_FILE'], 3)
+    assert profile['request_id'] == request_id
+    assert len(request_id) == 32
+    assert profile['method'] == 'GET'
+    assert profile['path'] == '/api/profile'
+    assert profile['endpoint'] == 'api.profile'
+    assert profile['user_id'] == user.id
+    assert profile['status'] == 200
+    assert profile['bytes'] > 0
+    assert profile['db_queries'] >= 1
+    assert profile['db_ms'] >= 0
+    assert profile['ms'] >= profile['db_ms']
+    assert profile['time'].endswith('Z')
+
+    assert missing['request_id'] == 'abc-123'
+    assert missing['status'] == 404
+    assert missing['user_id'] is None
+    assert missing['endpoint'] is None
+    assert invalid['request_id'] == generated_id
+    assert len(generated_id) == 32
+
+    assert accesslog.stats()['written'] == 3
@@ -0,0 +1,148 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from flaskapi.utils.cache import LRUCache
+from flaskapi.utils.cache import SQLiteCache
+
+
+@pytest.fixture(params=['lru', 'sqlite'])
+def make_cache(request, tmpdir):
+    def factory(**kwargs):
+        if request.param == 'sqlite':
+            return SQLiteCache(str(tmpdir.join('cache.sqlite')), **kwargs)
+        return LRUCache(**kwargs)
+    return factory
+
+
+def test_get_set(make_cache):
+    cache = make_cache()
+
+    assert cache.get('key') is None
+    assert cache.set('key', {'name': 'tim'})
+    assert cache.get('key') == {'name': 'tim'}
+    assert cache.has('key')
+    assert not cache.add('key', 'other')
+    assert cache.delete('key')
+    assert not cache.has('key')
+    assert cache.add('key', 'other')
+    assert cache.get('key') == 'other'
+
+
+def test_expired(make_cache, mocker):
+    cache = make_cache()
+    now = mocker.patch('flaskapi.utils.cache.time.time')
+
+    now.return_value = 100
+    cache.set('key', 'value', timeout=10)
+    cache.set('forever', 'value', timeout=0)
+    now.return_value = 111
+    assert cache.get('key') is None
+    assert cache.get('forever') == 'value'
+
+
+def test_threshold(make_cache, mocker):
+    cache = make_cache(threshold=2)
+    now = mocker.patch('flaskapi.utils.cache.time.time')
+
+    now.return_value = 100
+    cache.set('a', 1)
+    now.return_value = 101
+    cache.set('b', 2)
+    now.return_value = 102
+    cache.get('a')
+    now.return_value = 103
+    cache.set('c', 3)
+
+    assert cache.get('a') == 1
+    assert cache.get('b') is None
+    assert cache.get('c') == 3
+    assert cache.stats()['evictions'] == 1
+    assert cache.stats()['entries'] == 2
+
+
+def test_max_bytes(make_cache):
+    cache = make_cache(max_bytes=2000)
+    for i in range(10):
+        cache.set(i, 'x' * 500)
+
+    stats = cache.stats()
+    assert stats['bytes'] <= 2000
+    assert stats['entries'] < 10
+    assert stats['evictions'] == 10 - stats['entries']
+    assert cache.get(9) == 'x' * 500
+
+
+def test_stats(make_cache):
+    cache = make_cache()
+    cache.set('key', 'value')
+    cache.get('key')
+    cache.get('key')
+    cache.get('missing')
+
+    stats = cache.stats()
+    assert stats['hits'] == 2
+    assert stats['misses'] == 1
+    assert stats['entries'] == 1
+
+
+def test_clear(make_cache):
+    cache = make_cache()
+    cache.set_many({'a': 1, 'b': 2})
+    assert list(cache.get_many('a', 'b')) == [1, 2]
+    cache.clear()
+    assert list(cache.get_many('a', 'b')) == [None, None]
+    assert cache.stats()['bytes'] == 0
+
+
+def test_sqlite_shared(tmpdir):
+    path = str(tmpdir.join('cache.sqlite'))
+    cache1 = SQLiteCache(path)
+    cache2 = SQLiteCache(path)
+
+    cache1.set('key', 'value')
+    assert cache2.get('key') == 'value'
+
+
+def test_add_concurrent(make_cache):
+    cache = make_cache()
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(lambda value: cache.add('key', value), range(32)))
+    assert results.count(True) == 1
+
+
+def test_sqlite_stats_row(tmpdir):
+    cache = SQLiteCache(str(tmpdir.join('cache.sqlite')), threshold=3)
+    for i in range(5):
+        cache.set(i, 'x' * i)
+    cache.set(4, 'replaced')
+    cache.delete(3)
+
+    conn = cache._connection.get()
+    assert conn.execute('SELECT COUNT(*), SUM(size) FROM cache').fetchone() == (cache.count(), cache.size())
+    assert cache.count() == 2
+
+
+def test_sqlite_batches_accessed(tmpdir, mocker):
+    cache = SQLiteCache(str(tmpdir.join('cache.sqlite')))
+    cache.accessed_batch_size = 2
+    now = mocker.patch('flaskapi.utils.cache.time.time')
+    now.return_value = 100
+    cache.set('a', 1)
+    cache.set('b', 2)
+
+    def accessed():
+        conn = cache._connection.get()
+        return dict(conn.execute('SELECT key, accessed FROM cache').fetchall())
+
+    now.return_value = 101
+    cache.get('a')
+    cache.get('a')
+    assert accessed() == {'a': 100, 'b': 100}
+    cache.get('b')
+    assert accessed() == {'a': 101, 'b': 101}
+
+    now.return_value = 102
+    cache.get('b')
+    cache.set('c', 3)
+    assert accessed() == {'a': 101, 'b': 102, 'c': 102}
@@ -0,0 +1,72 @@
+import flask
+
+from flaskapi.utils.credentials import CredentialCache
+
+
+def make_cache(size=10, seconds=60):
+    app = flask.Flask(__name__)
+    app.config.update(SECRET_KEY='secret', CREDENTIAL_CACHE_SIZE=size, CREDENTIAL_CACHE_SECONDS=seconds)
+    return CredentialCache(app)
+
+
+def test_get_set():
+    cache = make_cache()
+
+    assert cache.get('tim', 'welcome') is None
+    cache.set('tim', 'welcome', 'hash')
+    assert cache.get('tim', 'welcome') == 'hash'
+    assert cache.get('tim', 'wrong') is None
+    assert cache.get('bob', 'welcome') is None
+
+
+def test_plaintext_not_stored():
+    cache = make_cache()
+    cache.set('tim', 'welcome', 'hash')
+
+    for username, digest in cache._entries:
+        assert username == 'tim'
+        assert 'welcome' not in digest
+
+
+def test_bounded():
+    cache = make_cache(size=2)
+    cache.set('a', 'pass', 'a')
+    cache.set('b', 'pass', 'b')
+    cache.get('a', 'pass')
+    cache.set('c', 'pass', 'c')
+
+    assert len(cache) == 2
+    assert cache.get('a', 'pass') == 'a'
+    assert cache.get('b', 'pass') is None
+    assert cache.get('c', 'pass') == 'c'
+
+
+def test_expired(mocker):
+    cache = make_cache(seconds=10)
+    monotonic = mocker.patch('flaskapi.utils.credentials.time.monotonic')
+
+    monotonic.return_value = 100
+    cache.set('tim', 'welcome', 'hash')
+    monotonic.return_value = 105
+    assert cache.get('tim', 'welcome') == 'hash'
+    monotonic.return_value = 111
+    assert cache.get('tim', 'welcome') is None
+    assert len(cache) == 0
+
+
+def test_invalidate():
+    cache = make_cache()
+    cache.set('tim', 'welcome', 'hash')
+    cache.set('tim', 'other', 'hash')
+    cache.set('bob', 'welcome', 'hash')
+
+    cache.invalidate('tim')
+    assert cache.get('tim', 'welcome') is None
+    assert cache.get('tim', 'other') is None
+    assert cache.get('bob', 'welcome') == 'hash'
+
+
+def test_disabled():
+    cache = make_cache(size=0)
+    cache.set('tim', 'welcome', 'hash')
+    assert cache.get('tim', 'welcome') is None
@@ -0,0 +1,186 @@
+import threading
+import time
+
+from flask import url_for
+import pytest
+
+from flaskapi.ext import db
+from flaskapi.models import User
+from flaskapi.utils.database import PoolMetricsMixin
+from flaskapi.utils.database import ReplicaRouter
+from flaskapi.utils.database import connect_pool
+
+
+@pytest.fixture
+def database(tmpdir):
+    database = connect_pool('sqlite:///' + str(tmpdir.join('pool.sqlite')),
+                            max_connections=1, wait_timeout=0.05)
+    yield database
+    database.close_all()
+
+
+def test_connect_pool(database):
+    assert isinstance(database, PoolMetricsMixin)
+    assert database.max_connections == 1
+    assert connect_pool('sqlite+pool:///:memory:').database == ':memory:'
+
+    with pytest.raises(RuntimeError):
+        connect_pool('unknown://localhost/db')
+
+
+def test_stats(database):
+    database.connect()
+    database.execute_sql('SELECT 1')
+    stats = database.stats()
+    assert stats['in_use'] == 1
+    assert stats['idle'] == 0
+    assert stats['checkouts'] == 1
+
+    database.close()
+    stats = database.stats()
+    assert stats['in_use'] == 0
+    assert stats['idle'] == 1
+    assert stats['checkout_seconds_max'] >= 0
+
+
+def test_wait_timeout(database):
+    database.connect()
+
+    def connect():
+        with pytest.raises(ValueError):
+            database.connect()
+
+    thread = threading.Thread(target=connect)
+    thread.start()
+    thread.join()
+
+    stats = database.stats()
+    assert stats['waits'] == 1
+    assert stats['timeouts'] == 1
+
+
+def test_wait_for_connection(database):
+    database.wait_timeout = 5
+    database.connect()
+    connected = []
+
+    def connect():
+        database.connect()
+        connected.append(True)
+        database.close()
+
+    thread = threading.Thread(target=connect)
+    thread.start()
+    time.sleep(0.05)
+    assert not connected
+
+    database.close()
+    thread.join()
+    assert connected
+    assert database.stats()['waits'] == 1
+    assert database.stats()['timeouts'] == 0
+
+
+def test_fork(database, mocker):
+    database.connect()
+    database.close()
+    assert database.stats()['idle'] == 1
+
+    # a forked child process starts with an empty pool
+    mocker.patch('flaskapi.utils.database.os.getpid', return_value=-1)
+    stats = database.stats()
+    assert stats['idle'] == 0
+    assert stats['in_use'] == 0
+    assert stats['checkouts'] == 0
+    assert database.is_closed()
+
+    database.connect()
+    database.execute_sql('SELECT 1')
+    database.close()
+    assert database.stats()['idle'] == 1
+
+
+def test_router_round_robin():
+    router = ReplicaRouter(['a', 'b', 'c'])
+    assert [router.acquire() for _ in range(4)] == [0, 1, 2, 0]
+    assert router.loads == [2, 1, 1]
+
+    with pytest.raises(ValueError):
+        ReplicaRouter(['a'], selection='random')
+
+
+def test_router_least_loaded():
+    router = ReplicaRouter(['a', 'b', 'c'], selection='least-loaded')
+    assert [router.acquire() for _ in range(3)] == [0, 1, 2]
+
+    router.release(1)
+    assert router.acquire() == 1
+    router.release(2)
+    router.release(0)
+    assert router.acquire() == 2
+    assert router.acquire() == 0
+    assert router.loads == [1, 1, 1]
+
+
+def test_count_queries(app):
+    with db.count_queries(record=True) as outer:
+        User.select().count()
+        with db.count_queries() as inner:
+            for i in range(3):
+                User.select().where(User.id == i).first()
+
+    assert inner.count == 3
+    assert inner.queries is None
+    assert outer.count == 4
+    assert len(outer.queries) == 4
+    assert outer.seconds >= outer.slowest_seconds > 0
+    assert outer.slowest_sql in outer.queries
+    assert outer.repeated(3) == [(outer.queries[1], 3)]
+    assert outer.repeated(4) == []
+
+    User.select().count()
+    assert outer.count == 4
+
+
+def test_server_timing(app, client):
+    resp = client.get(url_for('api.profile'))
+    assert 'Server-Timing' not in resp.headers
+
+    app.config['DATABASE_SERVER_TIMING'] = True
+    resp = client.get(url_for('api.profile'), headers={'X-Api-Key': 'invalid'})
+    assert resp.status_code == 401
+    assert resp.headers['Server-Timing'].startswith('db;dur=')
+    assert resp.headers['Server-Timing'].endswith(';desc="1 queries"')
+
+
+def test_slow_request_log(app, client, mocker):
+    warning = mocker.patch.object(app.logger, 'warning')
+    client.get(url_for('api.profile'))
+    client.get(url_for('api.profile'))
+    assert not warning.called
+
+    # The test client tears a request down when the next one starts.
+    app.config['SLOW_REQUEST_SECONDS'] = 0.000001
+    client.get(url_for('api.profile'), headers={'X-Api-Key': 'invalid'})
+    client.get(url_for('api.profile'))
+    message = warning.call_args_list[-1][0][0]
+    assert message.startswith('Slow request: GET /api/profile took')
+    assert '1 queries in' in message
+    assert 'FROM "users"' in message
+
+
+def test_repeated_query_log(app, client, mocker):
+    @app.route('/repeated')
+    def repeated():
+        for i in range(3):
+            User.select().where(User.id == i).first()
+        return ''
+
+    warning = mocker.patch.object(app.logger, 'warning')
+    app.config['DATABASE_REPEATED_QUERY_THRESHOLD'] = 3
+    client.get('/repeated')
+    client.get('/')
+    assert warning.call_count == 1
+    message = warning.call_args[0][0]
+    assert message.startswith('Repeated queries in request: GET /repeated')
+    assert 'Ran 3 times (possible N+1 query): SELECT' in message
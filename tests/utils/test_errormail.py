@@ -0,0 +1,182 @@
+from email import message_from_bytes
+import logging
+import os
+import queue
+import socketserver
+import threading
+import time
+
+import pytest
+
+from flaskapi.utils.errormail import DigestMailHandler
+
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+    """Just enough SMTP to receive a message, with an optional delay before every reply."""
+
+    def reply(self, line):
+        time.sleep(self.server.delay)
+        self.wfile.write(line.encode('ascii') + b'\r\n')
+
+    def handle(self):
+        self.reply('220 localhost')
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line[:4].upper()
+            if command == b'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                lines = []
+                for line in iter(self.rfile.readline, b'.\r\n'):
+                    lines.append(line[1:] if line.startswith(b'..') else line)
+                self.server.messages.append(message_from_bytes(b''.join(lines)))
+                self.reply('250 OK')
+            elif command == b'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('250 OK')
+
+
+@pytest.fixture
+def smtp_server():
+    server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), SMTPHandler)
+    server.daemon_threads = True
+    server.messages = []
+    server.delay = 0
+    thread = threading.Thread(target=server.serve_forever, args=(0.05, ), daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def logger():
+    logger = logging.getLogger('tests.errormail')
+    logger.propagate = False
+    yield logger
+    logger.handlers = []
+
+
+def make_handler(server, **kwargs):
+    handler = DigestMailHandler(server.server_address, 'app@example.com',
+                                ['admin@example.com'], 'Application Error', **kwargs)
+    handler.setFormatter(logging.Formatter('%(levelname)s %(message)s'))
+    return handler
+
+
+def fail(logger, exc_class):
+    try:
+        raise exc_class('broken')
+    except Exception:
+        logger.exception('Request failed')
+
+
+def wait_for(condition, seconds=5):
+    deadline = time.monotonic() + seconds
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_digest(smtp_server, logger):
+    handler = make_handler(smtp_server, window=0.2)
+    logger.addHandler(handler)
+
+    for _ in range(50):
+        fail(logger, ValueError)
+    fail(logger, KeyError)
+    logger.error('Something else')
+
+    assert wait_for(lambda: smtp_server.messages)
+    time.sleep(0.3)
+    assert len(smtp_server.messages) == 1
+
+    message = smtp_server.messages[0]
+    assert message['Subject'] == 'Application Error (52 errors, 3 distinct)'
+    assert message['To'] == 'admin@example.com'
+    body = message.get_payload(decode=True).decode('utf-8')
+    assert body.count('Occurrences: 50') == 1
+    assert body.count('Occurrences: 1') == 2
+    assert body.count('ValueError: broken') == 1
+    assert 'KeyError' in body
+    assert 'Something else' in body
+    handler.close()
+
+
+def test_single_error_keeps_subject(smtp_server, logger):
+    handler = make_handler(smtp_server, window=0.05)
+    logger.addHandler(handler)
+    fail(logger, ValueError)
+
+    assert wait_for(lambda: smtp_server.messages)
+    assert smtp_server.messages[0]['Subject'] == 'Application Error'
+    handler.close()
+
+
+def test_windows(smtp_server, logger):
+    handler = make_handler(smtp_server, window=0.05)
+    logger.addHandler(handler)
+
+    fail(logger, ValueError)
+    assert wait_for(lambda: len(smtp_server.messages) == 1)
+    fail(logger, ValueError)
+    assert wait_for(lambda: len(smtp_server.messages) == 2)
+    handler.close()
+
+
+def test_emit_does_not_wait_for_the_server(smtp_server, logger):
+    smtp_server.delay = 0.1
+    handler = make_handler(smtp_server, window=0.05)
+    logger.addHandler(handler)
+
+    start = time.perf_counter()
+    for _ in range(20):
+        fail(logger, ValueError)
+    assert time.perf_counter() - start < 0.1
+    assert wait_for(lambda: smtp_server.messages)
+    handler.close()
+
+
+def test_queue_full_drops(smtp_server, logger):
+    handler = make_handler(smtp_server, window=0.05, queue_size=1)
+    # Set up the queue without the background thread, so nothing takes records from it.
+    handler._pid = os.getpid()
+    handler._queue = queue.Queue(1)
+    logger.addHandler(handler)
+    for _ in range(6):
+        fail(logger, ValueError)
+    assert handler.dropped == 5
+
+    handler._thread = threading.Thread(target=handler._run, daemon=True)
+    handler._thread.start()
+    assert wait_for(lambda: smtp_server.messages)
+    body = smtp_server.messages[0].get_payload(decode=True).decode('utf-8')
+    assert 'Occurrences: 1' in body
+    assert '5 records were dropped' in body
+    handler.close()
+
+
+def test_close_sends_pending(smtp_server, logger):
+    handler = make_handler(smtp_server, window=60)
+    logger.addHandler(handler)
+    fail(logger, ValueError)
+    fail(logger, ValueError)
+
+    handler.close()
+    assert len(smtp_server.messages) == 1
+    assert handler.sent == 1
+    assert not handler._thread.is_alive()
+
+
+def test_send_failure(logger, capsys):
+    handler = DigestMailHandler(('127.0.0.1', 1), 'app@example.com', ['admin@example.com'],
+                                'Application Error', window=0, timeout=1)
+    logger.addHandler(handler)
+    fail(logger, ValueError)
+    handler.close()
+
+    assert handler.sent == 0
+    assert 'Could not send the error digest' in capsys.readouterr()[1]
@@ -0,0 +1,39 @@
+from datetime import datetime
+import gzip
+
+from flaskapi.utils.export import csv_chunks
+from flaskapi.utils.export import format_csv_value
+from flaskapi.utils.export import gzip_chunks
+from flaskapi.utils.export import ndjson_chunks
+
+
+def test_format_csv_value():
+    assert format_csv_value(None) == ''
+    assert format_csv_value(True) == 'true'
+    assert format_csv_value(False) == 'false'
+    assert format_csv_value(datetime(2016, 1, 2, 3, 4, 5)) == '2016-01-02T03:04:05'
+    assert format_csv_value(5) == 5
+
+
+def test_csv_chunks():
+    rows = ({'id': i, 'name': 'tim, "the" user', 'extra': 1} for i in range(100))
+    chunks = list(csv_chunks(rows, ('id', 'name'), chunk_size=100))
+    assert len(chunks) > 10
+    lines = ''.join(chunks).splitlines()
+    assert lines[0] == 'id,name'
+    assert lines[1] == '0,"tim, ""the"" user"'
+    assert len(lines) == 101
+
+
+def test_ndjson_chunks(app):
+    rows = ({'id': i} for i in range(100))
+    chunks = list(ndjson_chunks(rows, chunk_size=100))
+    assert len(chunks) > 10
+    assert ''.join(chunks).splitlines()[99] == '{"id": 99}'
+    assert list(ndjson_chunks(iter(()))) == ['']
+
+
+def test_gzip_chunks():
+    chunks = ['line {}\n'.format(i) for i in range(1000)]
+    data = b''.join(gzip_chunks(iter(chunks)))
+    assert gzip.decompress(data).decode('utf-8') == ''.join(chunks)
@@ -0,0 +1,152 @@
+import os
+import threading
+
+import pytest
+
+from flaskapi.utils.hashing import Hasher
+from flaskapi.utils.hashing import HasherBusy
+from flaskapi.utils.hashing import get_hash_method
+from flaskapi.utils.hashing import normalize_hash_method
+
+
+class FakeApp:
+    def __init__(self, **config):
+        self.config = {
+            'HASHER_WORKERS': 1,
+            'HASHER_QUEUE_SIZE': 0,
+            'HASHER_TIMEOUT': 5,
+            'HASHER_RETRY_AFTER': 3,
+        }
+        self.config.update(config)
+
+
+@pytest.fixture
+def hasher():
+    hasher = Hasher(FakeApp())
+    yield hasher
+    hasher.shutdown()
+
+
+def test_hash_method():
+    assert normalize_hash_method('pbkdf2:sha256') == 'pbkdf2:sha256:1000'
+    assert normalize_hash_method('pbkdf2:sha256:50000') == 'pbkdf2:sha256:50000'
+    assert normalize_hash_method('plain') == 'plain'
+    assert get_hash_method('pbkdf2:sha256:50000$salt$hash') == 'pbkdf2:sha256:50000'
+    assert get_hash_method(None) == ''
+
+
+def test_generate_and_check(hasher):
+    pwhash = hasher.generate('welcome', 'pbkdf2:sha256:1000')
+    assert get_hash_method(pwhash) == 'pbkdf2:sha256:1000'
+    assert hasher.check(pwhash, 'welcome')
+    assert not hasher.check(pwhash, 'invalid')
+
+    stats = hasher.stats()
+    assert stats['completed'] == 3
+    assert stats['in_flight'] == 0
+    assert stats['queued'] == 0
+    assert stats['rejected'] == 0
+    assert stats['seconds_max'] > 0
+
+
+def test_generate_many():
+    hasher = Hasher(FakeApp(HASHER_WORKERS=2))
+    passwords = ['password{}'.format(i) for i in range(40)]
+    hashes = hasher.generate_many(passwords, 'pbkdf2:sha256:1000')
+    hasher.shutdown()
+
+    assert len(hashes) == 40
+    assert all(hasher.check(pwhash, password) for pwhash, password in zip(hashes, passwords))
+    assert Hasher().generate_many(['welcome'], 'plain') == ['plain$$welcome']
+
+
+def test_runs_in_worker(hasher):
+    threads = set()
+    assert hasher.submit(lambda: threads.add(threading.current_thread())) is None
+    assert threading.current_thread() not in threads
+
+
+def test_disabled():
+    hasher = Hasher()
+    assert not hasher.enabled
+    assert hasher.submit(threading.current_thread) is threading.current_thread()
+
+
+def test_busy(hasher):
+    started = threading.Event()
+    release = threading.Event()
+
+    def block():
+        started.set()
+        release.wait(5)
+
+    thread = threading.Thread(target=hasher.submit, args=(block, ))
+    thread.start()
+    started.wait(5)
+
+    with pytest.raises(HasherBusy) as excinfo:
+        hasher.generate('welcome', 'plain')
+    assert excinfo.value.code == 503
+    assert excinfo.value.retry_after == 3
+    assert hasher.stats()['rejected'] == 1
+    assert hasher.stats()['in_flight'] == 1
+
+    release.set()
+    thread.join()
+    assert hasher.generate('welcome', 'plain') == 'plain$$welcome'
+
+
+def test_queue(hasher):
+    hasher.init_app(FakeApp(HASHER_QUEUE_SIZE=1))
+    started = threading.Event()
+    release = threading.Event()
+
+    def block():
+        started.set()
+        release.wait(5)
+
+    threads = [threading.Thread(target=hasher.submit, args=(block, )) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    started.wait(5)
+
+    with pytest.raises(HasherBusy):
+        hasher.generate('welcome', 'plain')
+
+    stats = hasher.stats()
+    assert stats['in_flight'] == 2
+    assert stats['queued'] == 1
+
+    release.set()
+    for thread in threads:
+        thread.join()
+
+
+def test_fork(hasher, mocker):
+    hasher.generate('welcome', 'plain')
+    executor = hasher._executor
+
+    mocker.patch('flaskapi.utils.hashing.os.getpid', return_value=os.getpid() + 1)
+    hasher.generate('welcome', 'plain')
+    assert hasher._executor is not executor
+    assert hasher.stats()['completed'] == 1
+
+
+def test_timeout_keeps_slot(hasher):
+    hasher.timeout = 0.05
+    release = threading.Event()
+
+    with pytest.raises(HasherBusy):
+        hasher.submit(release.wait, 5)
+    # The timed out task is still running, so it still holds the only slot.
+    assert hasher.stats()['in_flight'] == 1
+    with pytest.raises(HasherBusy):
+        hasher.generate('welcome', 'plain')
+    with pytest.raises(HasherBusy):
+        hasher.generate_many(['welcome'], 'plain')
+    assert hasher.stats()['rejected'] == 2
+
+    release.set()
+    hasher.timeout = 5
+    assert hasher.generate_many(['welcome'] * 3, 'plain') == ['plain$$welcome'] * 3
+    assert hasher.stats()['in_flight'] == 0
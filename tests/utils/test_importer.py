@@ -0,0 +1,114 @@
+import io
+
+from click.testing import CliRunner
+from flask.cli import ScriptInfo
+import pytest
+
+from flaskapi.models import User
+from flaskapi.operations import UserBulkOperations
+from flaskapi.utils.importer import Checkpoint
+from flaskapi.utils.importer import Importer
+from flaskapi.utils.importer import guess_format
+from flaskapi.utils.importer import read_rows
+
+CSV = '''username,email,password,is_admin
+tim,tim@example.com,welcome1,true
+bob,bob@example.com,welcome2,
+tim,tim2@example.com,welcome3,
+amy,invalid,welcome4,
+'''
+
+NDJSON = '''{"username": "tim", "email": "tim@example.com", "password": "welcome1"}
+not json
+
+{"username": "bob", "email": "bob@example.com", "password": "welcome2", "is_admin": true}
+'''
+
+
+def import_users(app, *args, input=None):
+    return CliRunner().invoke(app.cli, ['importusers'] + list(args), input=input,
+                              obj=ScriptInfo(create_app=lambda info: app))
+
+
+def test_guess_format():
+    assert guess_format('users.csv') == 'csv'
+    assert guess_format('users.NDJSON') == 'ndjson'
+    assert guess_format('users.jsonl') == 'ndjson'
+    assert guess_format(None) == 'csv'
+
+
+def test_read_rows():
+    rows = list(read_rows(io.StringIO(CSV), 'csv'))
+    assert rows[0] == {'username': 'tim', 'email': 'tim@example.com', 'password': 'welcome1',
+                       'is_admin': 'true'}
+    assert 'is_admin' not in rows[1]
+
+    rows = list(read_rows(io.StringIO(NDJSON), 'ndjson'))
+    assert len(rows) == 3
+    assert isinstance(rows[1], ValueError)
+    assert rows[2]['is_admin'] is True
+
+
+def test_checkpoint(tmpdir):
+    path = str(tmpdir.join('users.checkpoint'))
+    checkpoint = Checkpoint(path, 'users.csv')
+    assert checkpoint.load() is None
+    checkpoint.save(processed=10)
+    assert checkpoint.load() == {'processed': 10, 'source': 'users.csv'}
+    with pytest.raises(ValueError):
+        Checkpoint(path, 'other.csv').load()
+    checkpoint.remove()
+    assert checkpoint.load() is None
+
+
+def test_import_csv(app, tmpdir):
+    User.create(username='bob', email='bob@example.org', password='welcome')
+    source = tmpdir.join('users.csv')
+    source.write(CSV)
+
+    result = import_users(app, str(source), '--batch-size', '2', '--workers', '2')
+    assert result.exit_code == 0, result.output
+    assert 'Row 2 skipped: username must be a unique value' in result.output
+    assert 'Row 3 skipped: username must be a unique value' in result.output
+    assert 'Row 4 skipped: email must be a valid email address' in result.output
+    assert '2 rows: 1 imported, 1 skipped' in result.output
+    assert 'Done: 1 imported, 3 skipped.' in result.output
+    assert not tmpdir.join('users.csv.checkpoint').exists()
+
+    tim = User.get(User.username == 'tim')
+    assert tim.is_admin
+    assert tim.check_password('welcome1')
+    assert len(tim.api_key) == 32
+
+
+def test_import_ndjson_stdin(app):
+    result = import_users(app, '--format', 'ndjson', input=NDJSON)
+    assert result.exit_code == 0, result.output
+    assert 'Row 2 skipped: row invalid JSON' in result.output
+    assert User.select().count() == 2
+    assert User.get(User.username == 'bob').check_password('welcome2')
+
+
+def test_import_resumes(app, tmpdir):
+    source = tmpdir.join('users.csv')
+    source.write(CSV)
+    Checkpoint(str(source) + '.checkpoint', str(source)).save(processed=2, imported=2, skipped=0)
+
+    result = import_users(app, str(source))
+    assert result.exit_code == 0, result.output
+    assert 'Resuming after row 2.' in result.output
+    assert 'Done: 3 imported, 1 skipped.' in result.output
+    assert [user.username for user in User.select()] == ['tim']
+
+
+def test_importer(app, tmpdir):
+    checkpoint = Checkpoint(str(tmpdir.join('users.checkpoint')), 'users.csv')
+    messages = []
+    importer = Importer(UserBulkOperations(), checkpoint, app.config['PASSWORD_HASH_METHOD'],
+                        batch_size=2, echo=lambda message, err=False: messages.append((message, err)))
+    importer.run(read_rows(io.StringIO(CSV), 'csv'))
+
+    assert ('Row 3 skipped: username must be a unique value', True) in messages
+    assert messages[-1] == ('Done: 2 imported, 2 skipped.', False)
+    assert (importer.processed, importer.imported, importer.skipped) == (4, 2, 2)
+    assert [user.username for user in User.select().order_by(User.id)] == ['tim', 'bob']
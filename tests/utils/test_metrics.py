@@ -0,0 +1,127 @@
+import json
+import os
+import threading
+
+import flask
+import pytest
+
+from flaskapi.utils.metrics import Metrics
+from flaskapi.utils.metrics import format_labels
+
+
+@pytest.fixture
+def app():
+    app = flask.Flask(__name__)
+    app.config.update(METRICS_ENABLED=True, METRICS_DIR='', METRICS_FLUSH_SECONDS=0)
+    return app
+
+
+def test_record_threads(app):
+    metrics = Metrics(app)
+
+    def record():
+        for i in range(100):
+            metrics.record('api.profile', 'GET', 200, 0.002, 10)
+
+    threads = [threading.Thread(target=record) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    metrics.record('api.profile', 'GET', 500, 20.0)
+
+    snapshot = metrics.collect()
+    assert snapshot['requests'] == {('api.profile', 'GET', 200): 400, ('api.profile', 'GET', 500): 1}
+    assert snapshot['latency']['api.profile'][0] == 400
+    assert snapshot['latency']['api.profile'][-2] == 1
+    assert snapshot['sizes']['api.profile'] == [400, 4000]
+
+    # The finished threads were folded together.
+    assert len(metrics._shards) == 1
+    assert metrics.collect() == snapshot
+
+
+def test_render(app):
+    metrics = Metrics(app)
+    metrics.record('api.profile', 'GET', 200, 0.02, 100)
+    metrics.record('api.profile', 'GET', 200, 0.3, 300)
+    metrics.add_stats('pool', lambda: {'in_use': 2, 'checkouts': 5, 'name': 'x'}, counters=['checkouts'])
+    metrics.add_stats('missing', lambda: None)
+
+    lines = metrics.render().splitlines()
+    assert '# TYPE flaskapi_http_request_duration_seconds histogram' in lines
+    assert 'flaskapi_http_request_duration_seconds_bucket{endpoint="api.profile",le="0.01"} 0' in lines
+    assert 'flaskapi_http_request_duration_seconds_bucket{endpoint="api.profile",le="0.025"} 1' in lines
+    assert 'flaskapi_http_request_duration_seconds_bucket{endpoint="api.profile",le="0.5"} 2' in lines
+    assert 'flaskapi_http_request_duration_seconds_bucket{endpoint="api.profile",le="+Inf"} 2' in lines
+    assert 'flaskapi_http_request_duration_seconds_count{endpoint="api.profile"} 2' in lines
+    assert 'flaskapi_http_response_size_bytes_sum{endpoint="api.profile"} 400' in lines
+    assert 'flaskapi_http_requests_in_flight{endpoint="api.profile"} -2' in lines
+
+    pid = os.getpid()
+    assert '# TYPE flaskapi_pool_checkouts counter' in lines
+    assert 'flaskapi_pool_checkouts{{pid="{}"}} 5'.format(pid) in lines
+    assert '# TYPE flaskapi_pool_in_use gauge' in lines
+    assert not any('flaskapi_pool_name' in line or 'missing' in line for line in lines)
+
+
+def test_requests(app):
+    metrics = Metrics(app)
+
+    @app.route('/view')
+    def view():
+        return 'result'
+
+    @app.route('/error')
+    def error():
+        raise ValueError
+
+    client = app.test_client()
+    client.get('/view')
+    client.get('/missing')
+    assert client.get('/error').status_code == 500
+
+    snapshot = metrics.collect()
+    assert snapshot['requests'] == {
+        ('view', 'GET', 200): 1,
+        ('none', 'GET', 404): 1,
+        ('error', 'GET', 500): 1,
+    }
+    assert snapshot['sizes']['view'] == [1, 6]
+    assert snapshot['in_flight'] == {'view': 0, 'none': 0, 'error': 0}
+
+
+def test_disabled(app):
+    app.config['METRICS_ENABLED'] = False
+    metrics = Metrics(app)
+
+    @app.route('/view')
+    def view():
+        return 'result'
+
+    app.test_client().get('/view')
+    assert metrics.collect()['requests'] == {}
+
+
+def test_flush(app, tmpdir):
+    app.config['METRICS_DIR'] = str(tmpdir.join('metrics'))
+    metrics = Metrics(app)
+    metrics.record('api.profile', 'GET', 200, 0.02)
+
+    path = tmpdir.join('metrics', 'metrics-{}.json'.format(os.getpid()))
+    data = json.loads(path.read())
+    assert data['pid'] == os.getpid()
+    assert data['metrics']['requests'] == [[['api.profile', 'GET', 200], 1]]
+
+
+def test_fork(app, mocker):
+    metrics = Metrics(app)
+    metrics.record('api.profile', 'GET', 200, 0.02)
+
+    mocker.patch('flaskapi.utils.metrics.os.getpid', return_value=os.getpid() + 1)
+    assert metrics.collect()['requests'] == {}
+
+
+def test_format_labels():
+    assert format_labels() == ''
+    assert format_labels(b='2', a='say "hi"\\\n') == '{a="say \\"hi\\"\\\\\\n",b="2"}'
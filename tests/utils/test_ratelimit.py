@@ -0,0 +1,129 @@
+import flask
+import pytest
+
+from flaskapi.ext import limiter
+from flaskapi.utils.ratelimit import MemoryStorage
+from flaskapi.utils.ratelimit import RateLimit
+from flaskapi.utils.ratelimit import RateLimitExceeded
+from flaskapi.utils.ratelimit import SQLiteStorage
+from flaskapi.utils.ratelimit import get_client_address
+from flaskapi.utils.ratelimit import parse_networks
+from flaskapi.utils.views import View
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def storage(request, tmpdir):
+    if request.param == 'sqlite':
+        return SQLiteStorage(str(tmpdir.join('ratelimit.sqlite')), prune_interval=3)
+    return MemoryStorage(max_entries=2)
+
+
+def test_consume(storage):
+    assert storage.consume('key', 2, 1.0, now=100) == (True, 1)
+    assert storage.consume('key', 2, 1.0, now=100) == (True, 0)
+    assert storage.consume('key', 2, 1.0, now=100) == (False, 0)
+
+    # Tokens are refilled at the rate, up to the capacity.
+    assert storage.consume('key', 2, 1.0, now=100.5) == (False, 0.5)
+    assert storage.consume('key', 2, 1.0, now=101) == (True, 0)
+    assert storage.consume('key', 2, 1.0, now=200) == (True, 1)
+
+    assert storage.consume('other', 2, 1.0, now=200) == (True, 1)
+
+
+def test_prune_sqlite(tmpdir):
+    storage = SQLiteStorage(str(tmpdir.join('ratelimit.sqlite')), prune_interval=3)
+    storage.consume('a', 2, 1.0, now=100)
+    storage.consume('b', 2, 1.0, now=100)
+    storage.consume('c', 2, 1.0, now=102)
+    assert len(storage) == 1
+    assert storage.consume('c', 2, 1.0, now=102) == (True, 0)
+
+    storage.clear()
+    assert len(storage) == 0
+
+
+def test_evict_memory():
+    storage = MemoryStorage(max_entries=2)
+    storage.consume('a', 2, 1.0, now=100)
+    storage.consume('b', 2, 1.0, now=100)
+    storage.consume('a', 2, 1.0, now=100)
+    storage.consume('c', 2, 1.0, now=100)
+
+    # b was used least recently, so its bucket was dropped.
+    assert len(storage) == 2
+    assert storage.consume('a', 2, 1.0, now=100) == (False, 0)
+    assert storage.consume('b', 2, 1.0, now=100) == (True, 1)
+
+    storage.clear()
+    assert len(storage) == 0
+
+
+def test_rate_limit_scope():
+    with pytest.raises(ValueError):
+        RateLimit(10, by='session')
+
+    rate_limit = RateLimit(10, 60)
+    assert rate_limit.rate == 10 / 60
+
+    address = '10.0.0.1'
+    assert RateLimit(1, by='user').get_identity(address) == 'ip:10.0.0.1'
+    assert RateLimit(1, by='api_key').get_identity(address) == 'ip:10.0.0.1'
+
+    user = type('User', (), {'id': 5, 'api_key': 'abc'})
+    assert RateLimit(1, by='user').get_identity(address, user) == 'user:5'
+    assert RateLimit(1, by='ip').get_identity(address, user) == 'ip:10.0.0.1'
+
+    # The API key itself never ends up in the storage.
+    identity = RateLimit(1, by='api_key').get_identity(address, user, b'secret')
+    assert identity.startswith('key:')
+    assert 'abc' not in identity
+    assert identity != RateLimit(1, by='api_key').get_identity(address, user, b'other')
+
+
+def test_client_address():
+    trusted = parse_networks(['10.0.0.0/8', '127.0.0.1', ''])
+    assert get_client_address('1.2.3.4', '5.6.7.8', trusted) == '1.2.3.4'
+    assert get_client_address('1.2.3.4', '5.6.7.8', []) == '1.2.3.4'
+    assert get_client_address('127.0.0.1', None, trusted) == '127.0.0.1'
+    assert get_client_address('127.0.0.1', '5.6.7.8', trusted) == '5.6.7.8'
+    # Addresses left of the first untrusted one may be made up by the client.
+    assert get_client_address('127.0.0.1', '9.9.9.9, 5.6.7.8, 10.1.2.3', trusted) == '5.6.7.8'
+
+
+def test_view_rate_limit():
+    app = flask.Flask(__name__)
+    client = app.test_client()
+    limiter.enabled = True
+    limiter.storage = MemoryStorage()
+
+    class CustomView(View):
+        rate_limit = RateLimit(2, 60, by='ip')
+
+        def get(self):
+            return 'result'
+
+    class OtherView(CustomView):
+        pass
+
+    @app.errorhandler(RateLimitExceeded)
+    def rate_limited(exc):
+        return 'limited', exc.code, exc.headers
+
+    CustomView.register(app, '/view', 'view')
+    OtherView.register(app, '/other', 'other')
+
+    resp = client.get('/view')
+    assert resp.data == b'result'
+    assert resp.headers['X-RateLimit-Limit'] == '2'
+    assert resp.headers['X-RateLimit-Remaining'] == '1'
+    assert resp.headers['X-RateLimit-Reset'] == '30'
+
+    assert client.get('/view').headers['X-RateLimit-Remaining'] == '0'
+
+    resp = client.get('/view')
+    assert resp.status_code == 429
+    assert resp.headers['X-RateLimit-Remaining'] == '0'
+
+    # Every view has buckets of its own.
+    assert client.get('/other').status_code == 200
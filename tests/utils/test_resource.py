@@ -2,6 +2,9 @@ import pytest
 from peewee import SqliteDatabase
 from peewee import Model
 from peewee import CharField
+from peewee import ForeignKeyField
+from playhouse.fields import ManyToManyField
+from werkzeug.exceptions import BadRequest
 from werkzeug.exceptions import NotFound
 
 from flaskapi.utils.resource import Resource
@@ -28,6 +31,37 @@ user1 = FakeUser.create(name='tim', ssn='timssn')
 user2 = FakeUser.create(name='bob', ssn='bobssn')
 
 
+class FakeBase(Model):
+    def to_dict(self, private=False):
+        return {'name': self.name}
+
+    class Meta:
+        database = memory_database
+
+
+class FakeGroup(FakeBase):
+    name = CharField(max_length=10)
+    users = ManyToManyField(FakeUser, related_name='groups')
+
+    class Meta:
+        db_table = 'fakegroups'
+
+
+class FakePost(FakeBase):
+    name = CharField(max_length=10)
+    user = ForeignKeyField(FakeUser, related_name='posts')
+
+    class Meta:
+        db_table = 'fakeposts'
+        order_by = ('name', )
+
+
+FakeGroupUser = FakeGroup.users.get_through_model()
+FakeGroup.create_table(fail_silently=True)
+FakePost.create_table(fail_silently=True)
+FakeGroupUser.create_table(fail_silently=True)
+
+
 class ResourceMissingModel(Resource):
     pass
 
@@ -36,6 +70,11 @@ class UserResource(Resource):
     model = FakeUser
 
 
+class UserResourcePrefetch(Resource):
+    model = FakeUser
+    prefetch = ('posts', 'groups')
+
+
 class UserResourceSub(Resource):
     model = FakeUser
 
@@ -115,3 +154,176 @@ def test_serialize_sub_item():
     assert result['name'] == user1.name
     assert result['ssn'] == user1.ssn
     assert result['sub'] == user1.name
+
+
+def test_paginate():
+    resource = UserResource()
+    objs, cursor = resource.paginate(limit=1)
+    assert list(objs) == [user1]
+    assert cursor
+
+    objs, cursor = resource.paginate(cursor=cursor, limit=1)
+    assert list(objs) == [user2]
+    assert cursor is None
+
+    objs, cursor = resource.paginate(cursor=resource.encode_cursor(user2.id))
+    assert list(objs) == []
+    assert cursor is None
+
+
+def test_paginate_stable():
+    resource = UserResource()
+    objs, cursor = resource.paginate(limit=1)
+
+    # rows inserted after the first page are picked up without repeating rows
+    user3 = FakeUser.create(name='new', ssn='newssn')
+    try:
+        objs, cursor = resource.paginate(cursor=cursor, limit=10)
+        assert list(objs) == [user2, user3]
+        assert cursor is None
+    finally:
+        user3.delete_instance()
+
+
+def test_paginate_limit():
+    resource = UserResource()
+    resource.max_page_size = 1
+
+    assert resource.get_limit(None) == resource.page_size
+    assert resource.get_limit('100') == 1
+    assert resource.get_limit('-5') == 1
+    with pytest.raises(BadRequest):
+        resource.get_limit('abc')
+
+
+def test_cursor():
+    resource = UserResource()
+    assert resource.decode_cursor(resource.encode_cursor(123)) == 123
+    assert resource.decode_cursor(None) is None
+
+    for cursor in ('notacursor', resource.encode_cursor('abc'), 'e30'):
+        with pytest.raises(BadRequest):
+            resource.decode_cursor(cursor)
+
+
+def test_serialize_iter():
+    resource = UserResource()
+    result = resource.serialize_iter(resource.all())
+
+    assert not isinstance(result, (list, tuple))
+    result = list(result)
+    assert result[0]['name'] == user1.name
+    assert result[1]['name'] == user2.name
+    assert 'ssn' not in result[0]
+
+
+def test_serialize_many_query_fallback():
+    # FakeUser has no serialize_columns, so instances are built and to_dict is used
+    resource = UserResource(private=True)
+    assert resource.get_columns() is None
+    result = resource.serialize_many(resource.all())
+    assert result[0] == user1.to_dict(private=True)
+
+
+@pytest.fixture
+def related():
+    users = [FakeUser.create(name='user{}'.format(i), ssn='') for i in range(20)]
+    admins = FakeGroup.create(name='admins')
+    staff = FakeGroup.create(name='staff')
+    for user in users:
+        FakePost.create(name='b' + user.name, user=user)
+        FakePost.create(name='a' + user.name, user=user)
+        staff.users.add(user)
+    admins.users.add(users[0])
+
+    yield users
+
+    FakeGroupUser.delete().execute()
+    FakePost.delete().execute()
+    FakeGroup.delete().execute()
+    FakeUser.delete().where(FakeUser.id << [user.id for user in users]).execute()
+
+
+def test_serialize_prefetch(related):
+    resource = UserResourcePrefetch()
+    user = related[0]
+    result = resource.serialize(user)
+
+    assert result['posts'] == [{'name': 'auser0'}, {'name': 'buser0'}]
+    assert sorted(group['name'] for group in result['groups']) == ['admins', 'staff']
+
+    result = resource.serialize(user1)
+    assert result['posts'] == []
+    assert result['groups'] == []
+
+
+def test_serialize_many_prefetch(related):
+    resource = UserResourcePrefetch()
+    query = FakeUser.select().where(FakeUser.id << [user.id for user in related]).order_by(FakeUser.id)
+    result = resource.serialize_many(query)
+
+    assert len(result) == 20
+    assert result[1]['posts'] == [{'name': 'auser1'}, {'name': 'buser1'}]
+    assert result[1]['groups'] == [{'name': 'staff'}]
+    assert 'sub' not in result[1]
+
+
+@pytest.mark.parametrize('size', [1, 5, 20])
+def test_serialize_many_prefetch_queries(related, size, mocker):
+    resource = UserResourcePrefetch()
+    query = FakeUser.select().where(FakeUser.id << [user.id for user in related[:size]])
+
+    execute_sql = mocker.spy(memory_database, 'execute_sql')
+    result = resource.serialize_many(query)
+
+    assert len(result) == size
+    assert execute_sql.call_count == 3
+
+
+def test_serialize_many_prefetch_batches(related, mocker):
+    resource = UserResourcePrefetch()
+    resource.batch_size = 8
+    query = FakeUser.select().where(FakeUser.id << [user.id for user in related])
+
+    execute_sql = mocker.spy(memory_database, 'execute_sql')
+    result = resource.serialize_many(query)
+
+    assert len(result) == 20
+    assert all(len(data['posts']) == 2 for data in result)
+    assert execute_sql.call_count == 1 + 3 * 2
+
+
+def test_prefetch_invalid():
+    resource = UserResourcePrefetch()
+    resource.prefetch = ('name', )
+    with pytest.raises(ValueError):
+        resource.serialize(user1)
+
+
+def test_only_unsupported():
+    # FakeUser does not list its serialized keys, so fields can not be validated.
+    resource = UserResource()
+    assert resource.only(None) is resource
+    assert resource.only('') is resource
+    with pytest.raises(BadRequest):
+        resource.only('name')
+
+
+def test_only_prefetch(related, monkeypatch, mocker):
+    monkeypatch.setattr(FakeUser, 'serialize_keys', staticmethod(lambda private=False: ('id', 'name')),
+                        raising=False)
+    resource = UserResourcePrefetch()
+    with pytest.raises(BadRequest):
+        resource.only('name,ssn')
+
+    resource = resource.only('posts')
+    assert resource.fields == ('id', 'posts')
+    assert resource.prefetch == ('posts', )
+    assert UserResourcePrefetch.prefetch == ('posts', 'groups')
+
+    query = FakeUser.select().where(FakeUser.id << [user.id for user in related])
+    execute_sql = mocker.spy(memory_database, 'execute_sql')
+    result = resource.serialize_many(query)
+
+    assert result[0] == {'id': related[0].id, 'posts': [{'name': 'auser0'}, {'name': 'buser0'}]}
+    assert execute_sql.call_count == 2
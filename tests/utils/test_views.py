@@ -101,3 +101,81 @@ def test_custom_errors():
     resp = client.get('/view')
     data = json.loads(resp.data.decode('utf-8'))
     assert data['errors']['name'] == 'tim'
+
+
+def test_custom_objects_stream():
+    app = flask.Flask(__name__)
+    client = app.test_client()
+    consumed = []
+
+    def generate():
+        for i in range(1000):
+            consumed.append(i)
+            yield {'id': i, 'name': 'tim'}
+
+    class CustomView(View):
+        def get(self):
+            return self.objects(generate(), stream=True, next_cursor=None)
+
+    CustomView.register(app, '/view', 'view')
+
+    resp = client.get('/view')
+    assert resp.is_streamed
+    assert resp.mimetype == 'application/json'
+    assert not consumed
+
+    data = json.loads(resp.data.decode('utf-8'))
+    assert len(data['objects']) == 1000
+    assert data['objects'][999] == {'id': 999, 'name': 'tim'}
+    assert data['next_cursor'] is None
+
+
+def test_custom_objects_stream_empty():
+    app = flask.Flask(__name__)
+    client = app.test_client()
+
+    class CustomView(View):
+        def get(self):
+            return self.objects(iter(()), stream=True)
+
+    CustomView.register(app, '/view', 'view')
+
+    resp = client.get('/view')
+    data = json.loads(resp.data.decode('utf-8'))
+    assert data == {'objects': []}
+
+
+def test_not_modified():
+    from datetime import datetime
+
+    app = flask.Flask(__name__)
+    client = app.test_client()
+    last_modified = datetime(2020, 1, 2, 3, 4, 5, 600)
+
+    class CustomView(View):
+        def get(self):
+            rv = self.not_modified('abc', last_modified)
+            if rv:
+                return rv
+            return self.object({'name': 'tim'}, etag='abc', last_modified=last_modified)
+
+    CustomView.register(app, '/view', 'view')
+
+    resp = client.get('/view')
+    assert resp.status_code == 200
+    assert resp.headers['ETag'] == '"abc"'
+    assert resp.headers['Last-Modified'] == 'Thu, 02 Jan 2020 03:04:05 GMT'
+
+    resp = client.get('/view', headers={'If-None-Match': '"abc"'})
+    assert resp.status_code == 304
+    assert resp.data == b''
+    assert resp.headers['ETag'] == '"abc"'
+
+    resp = client.get('/view', headers={'If-None-Match': '"def"'})
+    assert resp.status_code == 200
+
+    resp = client.get('/view', headers={'If-Modified-Since': 'Thu, 02 Jan 2020 03:04:05 GMT'})
+    assert resp.status_code == 304
+
+    resp = client.get('/view', headers={'If-Modified-Since': 'Thu, 02 Jan 2020 03:04:04 GMT'})
+    assert resp.status_code == 200